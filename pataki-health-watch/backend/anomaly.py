@@ -0,0 +1,455 @@
+"""Streaming anomaly detection over ingested vitals, with O(1) work and memory per sample.
+
+Every patient has one fixed-size record of FIELDS doubles (about 350 bytes) holding:
+  - accumulators for the current UTC day (HR sum/count/min, steps, sleep minutes)
+  - for each daily signal (HR, resting HR, sleep, steps): a Welford mean/variance baseline,
+    an EWMA of recent days and a one-sided CUSUM of adverse standardized deviations
+  - the open episode, if any, and the last TREND_DAYS daily scores
+A sample only touches the day accumulators. The first sample of a new day closes the
+previous one: each signal is compared with the baseline (personal once MIN_BASELINE_DAYS
+are in, population defaults before), the CUSUMs advance, and the stability score is
+computed from the EWMAs with the same weights and penalty as scoring.py.
+
+A patient goes to risk when any CUSUM crosses CUSUM_H (a small shift sustained over a few
+days) or the score falls below RISK_SCORE_THRESHOLD, and back to stable once the score has
+recovered and every CUSUM has decayed below CUSUM_H / 2. Baselines are frozen during an
+episode so a decline isn't learned as normal. Episodes are logged in anomaly_events; lead
+time is the gap between detection and the day the score first fell below the threshold,
+i.e. how much earlier the CUSUM flagged the patient than a fixed threshold would have.
+
+The in-memory records are a working copy. observe() reloads each batch's patients from
+anomaly_state inside the caller's write transaction and writes them back before it commits,
+so restarts resume where they left off and several processes (gunicorn workers, ingest CLIs)
+can feed the same patient without overwriting each other's baselines.
+
+Usage (from pataki-health-watch/backend/):
+    python anomaly.py --replay          # rebuild detector state from the daily rollups
+    python anomaly.py --bench 5000      # per-sample cost of observe() for N patients (scratch DB)
+"""
+import argparse
+import math
+import os
+import time
+from array import array
+from datetime import datetime, timezone
+import scoring
+
+SIGNALS = ('hr', 'resting_hr', 'sleep', 'steps')
+# Same order as the first four scoring.METRICS, so the scoring constants line up
+DIRECTION = scoring.DIRECTION[:4].tolist()
+WEIGHTS = scoring.WEIGHTS[:4].tolist()
+POPULATION_MEAN = scoring.POPULATION_MEAN[:4].tolist()
+POPULATION_STD = scoring.POPULATION_STD[:4].tolist()
+MIN_STD = scoring.MIN_STD[:4].tolist()
+
+EWMA_ALPHA = float(os.getenv('ANOMALY_EWMA_ALPHA', '0.3'))
+CUSUM_K = float(os.getenv('ANOMALY_CUSUM_K', '0.5'))    # slack, in standard deviations per day
+CUSUM_H = float(os.getenv('ANOMALY_CUSUM_H', '4.0'))    # alarm threshold
+TREND_DAYS = 7
+DAY = 86400
+
+# Record layout (offsets into a patient's FIELDS doubles)
+DAY_START, HR_SUM, HR_N, HR_MIN, STEPS, STEPS_N, SLEEP_MIN, SLEEP_N = range(8)
+SIGNAL_BASE = 8
+N, MEAN, M2, EWMA, CUSUM = range(5)            # per-signal block
+SIGNAL_FIELDS = 5
+EPISODE = SIGNAL_BASE + SIGNAL_FIELDS * len(SIGNALS)   # detection time of the open episode, 0 if none
+DECLINED = EPISODE + 1                          # 1 once the open episode's score fell below the threshold
+TREND_N = EPISODE + 2                           # days closed so far
+TREND = EPISODE + 3                             # ring of TREND_DAYS (day, score) pairs
+FIELDS = TREND + 2 * TREND_DAYS
+
+UPSERT_STATE_SQL = (
+    'INSERT INTO anomaly_state (patient_id, state) VALUES (?, ?) '
+    'ON CONFLICT (patient_id) DO UPDATE SET state = excluded.state'
+)
+
+
+def _initial_record() -> array:
+    rec = array('d', bytes(8 * FIELDS))
+    for s in range(len(SIGNALS)):
+        rec[SIGNAL_BASE + s * SIGNAL_FIELDS + EWMA] = POPULATION_MEAN[s]
+    return rec
+
+
+class Detector:
+    """Per-patient online statistics in one flat array; not thread-safe (one writer)."""
+
+    def __init__(self):
+        self._slots = {}          # patient_id -> offset into _data
+        self._data = array('d')
+        self.samples = 0
+        self.late = 0
+        self.days_closed = 0
+        self.episodes = 0
+
+    def _load(self, db, patient_ids):
+        missing = list(patient_ids)
+        stored = {}
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i + 500]
+            stored.update(db.execute(
+                f'SELECT patient_id, state FROM anomaly_state WHERE patient_id IN ({",".join("?" * len(chunk))})',
+                chunk
+            ).fetchall())
+        for pid in missing:
+            rec = _initial_record()
+            blob = stored.get(pid)
+            if blob is not None and len(blob) == 8 * FIELDS:
+                rec = array('d')
+                rec.frombytes(blob)
+            o = self._slots.get(pid)
+            if o is None:
+                self._slots[pid] = len(self._data)
+                self._data.extend(rec)
+            else:
+                self._data[o:o + FIELDS] = rec
+
+    def _feed(self, rows, ops: list) -> set:
+        """Fold samples into the day accumulators, closing days as they roll over.
+        Appends episode operations to `ops`; returns the patients that closed a day."""
+        d = self._data
+        slots = self._slots
+        closed = set()
+        for pid, ts, hr, steps, sleep_min, *_ in rows:
+            o = slots[pid]
+            day = ts - ts % DAY
+            current = d[o + DAY_START]
+            if day != current:
+                if day < current:
+                    self.late += 1      # still in raw samples and rollups, just not scored
+                    continue
+                if current:
+                    self._close_day(pid, o, ops)
+                    closed.add(pid)
+                d[o + DAY_START] = day
+                d[o + HR_SUM] = d[o + HR_N] = d[o + STEPS] = d[o + STEPS_N] = 0.0
+                d[o + SLEEP_MIN] = d[o + SLEEP_N] = 0.0
+                d[o + HR_MIN] = math.inf
+            if hr is not None:
+                d[o + HR_SUM] += hr
+                d[o + HR_N] += 1
+                if hr < d[o + HR_MIN]:
+                    d[o + HR_MIN] = hr
+            if steps is not None:
+                d[o + STEPS] += steps
+                d[o + STEPS_N] += 1
+            if sleep_min is not None:
+                d[o + SLEEP_MIN] += sleep_min
+                d[o + SLEEP_N] += 1
+        self.samples += len(rows)
+        return closed
+
+    def _close_day(self, pid: int, o: int, ops: list):
+        d = self._data
+        has_hr = d[o + HR_N] > 0
+        values = (
+            d[o + HR_SUM] / d[o + HR_N] if has_hr else None,
+            d[o + HR_MIN] if has_hr else None,       # resting HR approximated by the day's minimum
+            d[o + SLEEP_MIN] / 60 if d[o + SLEEP_N] else None,
+            d[o + STEPS] if d[o + STEPS_N] else None,
+        )
+        in_episode = d[o + EPISODE] > 0
+        adverse = 0.0
+        alarms = []
+        settled = True
+        for s, x in enumerate(values):
+            b = o + SIGNAL_BASE + s * SIGNAL_FIELDS
+            n = d[b + N]
+            personal = n >= scoring.MIN_BASELINE_DAYS
+            if personal:
+                mean = d[b + MEAN]
+                std = max(math.sqrt(d[b + M2] / (n - 1)), MIN_STD[s])
+            else:
+                mean, std = POPULATION_MEAN[s], POPULATION_STD[s]
+            if x is not None:
+                if personal:
+                    # The CUSUM tracks change against the patient's own baseline only. Capping z
+                    # keeps a single outlier day from tripping it on its own.
+                    z = min(DIRECTION[s] * (x - mean) / std, scoring.Z_CAP)
+                    d[b + CUSUM] = max(0.0, d[b + CUSUM] + z - CUSUM_K)
+                d[b + EWMA] += EWMA_ALPHA * (x - d[b + EWMA])
+                if not in_episode:
+                    # Welford, with the count capped at the baseline window so old days fade out
+                    if n >= scoring.BASELINE_WINDOW_DAYS:
+                        d[b + M2] *= (n - 1) / n
+                    else:
+                        d[b + N] = n = n + 1
+                    delta = x - d[b + MEAN]
+                    d[b + MEAN] += delta / n
+                    d[b + M2] += delta * (x - d[b + MEAN])
+            ez = DIRECTION[s] * (d[b + EWMA] - mean) / std
+            adverse += WEIGHTS[s] * min(max(ez, 0.0), scoring.Z_CAP)
+            if d[b + CUSUM] > CUSUM_H:
+                alarms.append(SIGNALS[s])
+            if d[b + CUSUM] >= CUSUM_H / 2:
+                settled = False
+
+        day = int(d[o + DAY_START])
+        score = min(max(100.0 - scoring.PENALTY_SCALE * adverse, 0.0), 100.0)
+        declined = score < scoring.RISK_SCORE_THRESHOLD
+        day_end = day + DAY
+        if not in_episode and (alarms or declined):
+            d[o + EPISODE] = day_end
+            d[o + DECLINED] = float(declined)
+            ops.append(('detected', pid, day_end, declined, ','.join(alarms) or 'score'))
+            self.episodes += 1
+        elif in_episode:
+            if declined and not d[o + DECLINED]:
+                d[o + DECLINED] = 1.0
+                ops.append(('declined', pid, day_end, int(day_end - d[o + EPISODE])))
+            if not declined and settled:
+                d[o + EPISODE] = d[o + DECLINED] = 0.0
+                ops.append(('resolved', pid, day_end))
+
+        pos = TREND + 2 * (int(d[o + TREND_N]) % TREND_DAYS)
+        d[o + pos] = day
+        d[o + pos + 1] = score
+        d[o + TREND_N] += 1
+        self.days_closed += 1
+
+    def _trend(self, o: int) -> list:
+        d = self._data
+        n = min(int(d[o + TREND_N]), TREND_DAYS)
+        pairs = [(d[o + TREND + 2 * i], d[o + TREND + 2 * i + 1]) for i in range(n)]
+        return sorted(pairs)
+
+    def observe(self, db, rows) -> list:
+        """Update state for a batch of sample tuples (patient_id, ts, hr, steps, sleep_min, ...)
+        inside the caller's transaction. Call it after the transaction has written (e.g. the
+        sample insert), so the state it reloads is read under the write lock and is the latest.
+        Returns (patient_id, state, score) for every patient whose current_state changed, to be
+        published once the transaction commits."""
+        rows = sorted(rows, key=lambda r: r[1])
+        patient_ids = {r[0] for r in rows}
+        # Always reload: another process may have advanced these patients, and a rolled-back
+        # batch leaves the working copy ahead of the database
+        self._load(db, patient_ids)
+        ops = []
+        closed = self._feed(rows, ops)
+        return self._persist(db, patient_ids, closed, ops)
+
+    def _persist(self, db, patient_ids, closed: set, ops: list) -> list:
+        d = self._data
+        for op in ops:
+            if op[0] == 'detected':
+                _, pid, at, declined, signals = op
+                db.execute(
+                    'INSERT INTO anomaly_events (patient_id, detected_at, declined_at, lead_seconds, signals) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (pid, at, at if declined else None, 0 if declined else None, signals)
+                )
+            elif op[0] == 'declined':
+                _, pid, at, lead = op
+                db.execute(
+                    'UPDATE anomaly_events SET declined_at = ?, lead_seconds = ? '
+                    'WHERE patient_id = ? AND resolved_at IS NULL',
+                    (at, lead, pid)
+                )
+            else:
+                _, pid, at = op
+                db.execute('UPDATE anomaly_events SET resolved_at = ? WHERE patient_id = ? AND resolved_at IS NULL',
+                           (at, pid))
+
+        transitions = []
+        now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for pid in closed:
+            o = self._slots[pid]
+            state = 'risk' if d[o + EPISODE] else 'stable'
+            trend = self._trend(o)
+            score = int(round(trend[-1][1]))
+            if db.execute('UPDATE patients SET current_state = ? WHERE id = ? AND current_state != ?',
+                          (state, pid, state)).rowcount:
+                transitions.append((pid, state, score))
+                if state == 'risk':
+                    db.execute('UPDATE vitals SET last_updated = ? WHERE patient_id = ? AND state = ?',
+                               (now_str, pid, 'risk'))
+            db.execute('UPDATE vitals SET stability_score = ? WHERE patient_id = ? AND state = ?',
+                       (score, pid, state))
+            db.execute('DELETE FROM trend_scores WHERE patient_id = ? AND state = ?', (pid, state))
+            db.executemany(
+                'INSERT INTO trend_scores (patient_id, state, day_label, score, sort_order) VALUES (?, ?, ?, ?, ?)',
+                [(pid, state, datetime.fromtimestamp(day, timezone.utc).strftime('%a'), int(round(s)), i)
+                 for i, (day, s) in enumerate(trend)]
+            )
+        db.executemany(UPSERT_STATE_SQL, [
+            (pid, d[self._slots[pid]:self._slots[pid] + FIELDS].tobytes()) for pid in patient_ids
+        ])
+        return transitions
+
+    def stats(self) -> dict:
+        return {
+            'patients': len(self._slots),
+            'samples': self.samples,
+            'late_samples': self.late,
+            'days_closed': self.days_closed,
+            'episodes_detected': self.episodes,
+            'state_bytes': self._data.itemsize * len(self._data),
+        }
+
+
+def snapshot(db, patient_id: int):
+    """Decoded detector state for one patient, read from anomaly_state (so any worker can
+    serve it). None if the detector has never seen the patient."""
+    row = db.execute('SELECT state FROM anomaly_state WHERE patient_id = ?', (patient_id,)).fetchone()
+    if row is None or len(row[0]) != 8 * FIELDS:
+        return None
+    d = array('d')
+    d.frombytes(row[0])
+    signals = {}
+    for s, name in enumerate(SIGNALS):
+        b = SIGNAL_BASE + s * SIGNAL_FIELDS
+        n = int(d[b + N])
+        signals[name] = {
+            'baseline_days': n,
+            'baseline_mean': round(d[b + MEAN], 2) if n else None,
+            'baseline_std': round(math.sqrt(d[b + M2] / (n - 1)), 2) if n > 1 else None,
+            'ewma': round(d[b + EWMA], 2),
+            'cusum': round(d[b + CUSUM], 2),
+        }
+    n = min(int(d[TREND_N]), TREND_DAYS)
+    trend = sorted((int(d[TREND + 2 * i]), round(d[TREND + 2 * i + 1], 1)) for i in range(n))
+    return {
+        'day_start': int(d[DAY_START]) or None,
+        'days_scored': int(d[TREND_N]),
+        'episode_since': int(d[EPISODE]) or None,
+        'signals': signals,
+        'trend': [{'day': day, 'score': score} for day, score in trend],
+    }
+
+
+def replay(db, detector: Detector) -> dict:
+    """Rebuild every patient's state from daily rollups, oldest day first. Each patient's latest
+    day is left open, as if its samples had just streamed in. Run with ingest stopped."""
+    with db:
+        db.execute('DELETE FROM anomaly_state')
+        db.execute('DELETE FROM anomaly_events')
+    cur = db.execute(
+        "SELECT patient_id, bucket_start, metric, count, sum, min FROM metric_rollups "
+        "WHERE granularity = 'day' AND metric IN ('hr', 'steps', 'sleep_min') ORDER BY patient_id, bucket_start"
+    )
+    d = detector._data
+    pending = []
+    transitions = 0
+
+    def flush():
+        nonlocal pending, transitions
+        ops = []
+        closed = set()
+        for pid, day, metrics in pending:
+            o = detector._slots[pid]
+            if d[o + DAY_START] and d[o + DAY_START] < day:
+                detector._close_day(pid, o, ops)
+                closed.add(pid)
+            hr, steps, sleep = metrics.get('hr'), metrics.get('steps'), metrics.get('sleep_min')
+            d[o + DAY_START] = day
+            d[o + HR_N], d[o + HR_SUM], d[o + HR_MIN] = (hr[0], hr[1], hr[2]) if hr else (0.0, 0.0, math.inf)
+            d[o + STEPS_N], d[o + STEPS] = (steps[0], steps[1]) if steps else (0.0, 0.0)
+            d[o + SLEEP_N], d[o + SLEEP_MIN] = (sleep[0], sleep[1]) if sleep else (0.0, 0.0)
+        with db:
+            transitions += len(detector._persist(db, {pid for pid, _, _ in pending}, closed, ops))
+        pending = []
+
+    last = None
+    for pid, day, metric, count, total, low in cur:
+        if (pid, day) != last:
+            if last is None or pid != last[0]:
+                if len(pending) >= 5000:
+                    flush()
+                detector._load(db, [pid])
+            pending.append((pid, day, {}))
+            last = (pid, day)
+        pending[-1][2][metric] = (count, total, low)
+    if pending:
+        flush()
+    report = detector.stats()
+    report['state_changes'] = transitions
+    return report
+
+
+def _bench(n_patients: int, days: int = 14, per_day: int = 24, seed_value: int = 42):
+    """Hourly samples for n_patients over `days`; 5% of them decline from day 7 on. Runs
+    observe() against a scratch database, one write transaction per ingest batch, so the
+    state loads and writes are measured along with the arithmetic."""
+    import tempfile
+    import numpy as np
+    os.environ['PATAKI_DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix='pataki-anomaly-'), 'pataki.db')
+    import migrations
+    from database import connect
+    from ingest import INGEST_BATCH_SIZE
+    db = connect()
+    migrations.migrate(db)
+    with db:
+        db.executemany("INSERT INTO patients (id, name, current_state) VALUES (?, ?, 'stable')",
+                       [(pid, f'Patient {pid}') for pid in range(1, n_patients + 1)])
+        db.executemany('INSERT INTO vitals (patient_id, state, stability_score) VALUES (?, ?, 90)',
+                       [(pid, state) for pid in range(1, n_patients + 1) for state in ('stable', 'risk')])
+
+    rng = np.random.default_rng(seed_value)
+    detector = Detector()
+    base_hr = rng.normal(70, 5, n_patients)
+    declining = rng.random(n_patients) < 0.05
+    start = 1_700_006_400 - 1_700_006_400 % DAY
+    step = DAY // per_day
+    pids = np.arange(1, n_patients + 1)
+    elapsed = 0.0
+    transitions = []
+    for day in range(days):
+        shift = np.where(declining & (day >= 7), min(day - 6, 5), 0)
+        for i in range(per_day):
+            ts = start + day * DAY + i * step
+            hour = i * 24 // per_day
+            hr = base_hr + rng.normal(0, 4, n_patients) + shift * 2.5
+            steps = np.maximum(rng.normal(220, 60, n_patients) * (1 - shift * 0.08), 0) if 8 <= hour < 22 else np.zeros(n_patients)
+            sleep = np.clip(rng.normal(55, 4, n_patients) - shift * 4, 0, 60) if hour < 7 else np.zeros(n_patients)
+            rows = list(zip(pids.tolist(), [ts] * n_patients, np.round(hr).astype(int).tolist(),
+                            np.round(steps).astype(int).tolist(), np.round(sleep).astype(int).tolist()))
+            for b in range(0, len(rows), INGEST_BATCH_SIZE):
+                t0 = time.perf_counter()
+                with db:
+                    transitions += detector.observe(db, rows[b:b + INGEST_BATCH_SIZE])
+                elapsed += time.perf_counter() - t0
+    detected = {pid for pid, state, _ in transitions if state == 'risk'}
+    leads = [r[0] for r in db.execute('SELECT lead_seconds FROM anomaly_events WHERE lead_seconds IS NOT NULL')]
+    true_pos = sum(1 for pid in detected if declining[pid - 1])
+    n_samples = detector.samples
+    state_bytes = db.execute('SELECT SUM(LENGTH(state)) FROM anomaly_state').fetchone()[0]
+    db.close()
+    print(f'{n_samples:,} samples for {n_patients:,} patients in {elapsed:.2f}s through observe() '
+          f'({elapsed / n_samples * 1e6:.2f}us/sample, {n_samples / elapsed:,.0f} samples/sec)')
+    print(f'Stored state: {state_bytes / 1e6:.1f}MB ({state_bytes / n_patients:.0f} bytes/patient)')
+    print(f'Detected {true_pos}/{int(declining.sum())} declining patients, '
+          f'{len(detected) - true_pos} false alarms among {int((~declining).sum())} stable ones')
+    if leads:
+        print(f'Lead time before the score crossed {scoring.RISK_SCORE_THRESHOLD}: '
+              f'mean {sum(leads) / len(leads) / 3600:.0f}h over {len(leads)} declines')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--replay', action='store_true', help='rebuild state from daily rollups')
+    parser.add_argument('--bench', type=int, metavar='PATIENTS', help='benchmark on synthetic samples')
+    args = parser.parse_args()
+
+    if args.bench:
+        _bench(args.bench)
+        return
+    if args.replay:
+        import migrations
+        from database import connect
+        db = connect()
+        migrations.migrate(db)
+        t0 = time.perf_counter()
+        report = replay(db, Detector())
+        print(f'Replayed in {time.perf_counter() - t0:.1f}s')
+        for key, value in report.items():
+            print(f'  {key:<18} {value}')
+        db.close()
+        return
+    parser.print_help()
+
+
+detector = Detector()
+
+if __name__ == '__main__':
+    main()
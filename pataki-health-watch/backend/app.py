@@ -1,18 +1,70 @@
+import csv
+import json
+import math
 import os
+import sqlite3
+import time
 import requests
 from datetime import datetime
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
-from database import get_db, init_db
+import anomaly
+import export
+import insight_cache
+import metrics
+import prompts
+import retention
+import rollups
+import sample_store
+from circuit_breaker import CircuitBreaker
+from database import connect_ro, get_data_version, get_read_db, init_db, release_db, writer
+from events import hub, sse_stream
+from scoring import RISK_SCORE_THRESHOLD
+from ingest import IngestBufferFull, ingest_buffer, parse_binary, parse_json_lines
+from insight_jobs import get_cached_insight, get_job, submit_insight_job
 
 load_dotenv()
 
 app = Flask(__name__)
+# Routes pair an unscoped URL (defaults to the demo patient) with /api/patients/<id>/...; without
+# this Werkzeug answers /api/patients/1/... with a 308 to the unscoped URL
+app.url_map.redirect_defaults = False
 CORS(app)
+app.teardown_appcontext(release_db)
+
+
+@app.before_request
+def _start_request_metrics():
+    metrics.start_request()
+
+
+@app.after_request
+def _record_request_metrics(response):
+    # For streamed responses (SSE) this is the time to the first byte, not the stream's lifetime
+    rule = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.finish_request(rule, request.method, response.status_code)
+    return response
+
 
 HF_API_KEY = os.getenv('HF_API_KEY', '')
-HF_URL = 'https://router.huggingface.co/v1/chat/completions'
+HF_URL = os.getenv('HF_URL', 'https://router.huggingface.co/v1/chat/completions')
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', '3'))
+LLM_READ_TIMEOUT = float(os.getenv('LLM_READ_TIMEOUT', '20'))
+# /api/debug/* (the sampling profiler) is unauthenticated; only serve it when asked to
+DEBUG_ENDPOINTS = os.getenv('DEBUG_ENDPOINTS', '0') == '1'
+
+# Shared by request handlers, insight jobs and batch_insights: after LLM_BREAKER_FAILURES
+# consecutive failures, calls fail fast to the rule-based fallback for LLM_BREAKER_RESET seconds
+llm_breaker = CircuitBreaker(
+    'huggingface',
+    failure_threshold=int(os.getenv('LLM_BREAKER_FAILURES', '5')),
+    reset_timeout=float(os.getenv('LLM_BREAKER_RESET', '30')),
+)
+metrics.Gauge(
+    'pataki_llm_circuit_state', 'Hugging Face circuit breaker: 0 closed, 1 half-open, 2 open',
+    lambda: {(): {'closed': 0, 'half_open': 1, 'open': 2}[llm_breaker.state]},
+)
 AI_MODEL = 'openai/gpt-oss-120b:groq'
 PATIENT_ID = 1
 
@@ -21,54 +73,42 @@ BASELINE_SLEEP_PER_PERIOD = 7.5
 BASELINE_STEPS_DAILY = 5200
 
 
-def get_ai_insight(patient: dict, vitals: dict) -> str:
-    """Call Hugging Face Mistral to generate a user-friendly caregiver insight.
-    Always uses the live LLM — never falls back to stored hardcoded text."""
-    first_name = patient['name'].split()[0]
-    caregiver = patient.get('caregiver_name', 'the caregiver')
-    is_at_risk = vitals['stability_score'] < 70
+def lookup_cached_insight(patient: dict, vitals: dict):
+    """Return a cached LLM insight for this patient's current descriptors without calling out."""
+    return insight_cache.get(prompts.render(patient, vitals).cache_key)
 
-    hr_desc = 'elevated' if vitals['hr'] > 80 else 'normal'
-    sleep_desc = (
-        'very low' if vitals['sleep_hours'] < 5
-        else 'below normal' if vitals['sleep_hours'] < 6.5
-        else 'good'
-    )
-    activity_desc = (
-        'very little movement' if vitals['steps'] < 2000
-        else 'less movement than usual' if vitals['steps'] < 4000
-        else 'normal movement'
-    )
-    bp_desc = 'high' if vitals['bp_sys'] > 130 else 'normal'
-    fatigue_desc = vitals['fatigue'].lower()
 
+def fallback_insight(patient: dict, is_at_risk: bool) -> str:
+    """Rule-based insight used when the LLM returns no content."""
+    first_name = patient['name'].split()[0]
+    caregiver = patient.get('caregiver_name', 'the caregiver')
     if is_at_risk:
-        tone = (
-            f"{first_name} is showing warning signs and needs attention right away. "
-            f"Write 2-3 sentences that clearly alert the caregiver. "
-            f"End with a direct call to action stating: the user needs urgent care immediately. "
-            f"ENSURE A RESPONSE IS ALWAYS PROVIDED."
-        )
-    else:
-        tone = (
-            f"{first_name} is doing well today. "
-            f"Write 2-3 warm, reassuring sentences confirming everything looks fine. "
-            f"End by saying no action is needed and to continue the normal routine. "
-            f"ENSURE A RESPONSE IS ALWAYS PROVIDED."
+        return (
+            f"{first_name} is currently showing signs that require attention. "
+            f"Please review their recent vital signs for heart rate, sleep, and activity levels. "
+            f"Contact {caregiver} for further assessment."
         )
-
-    prompt = (
-        f"You are a health monitoring AI helping caregivers of elderly patients.\n"
-        f"{tone}\n\n"
-        f"Patient: {first_name}, {patient['age']} years old\n"
-        f"Heart rate today: {hr_desc}\n"
-        f"Sleep last night: {sleep_desc}\n"
-        f"Movement today: {activity_desc}\n"
-        f"Energy level: {fatigue_desc} fatigue\n"
-        f"Blood pressure: {bp_desc}"
+    return (
+        f"{first_name} appears stable today. "
+        f"Their vital signs for heart rate, sleep, and activity levels are within normal ranges. "
+        f"No immediate action is required."
     )
 
-    print(f'[AI] Sending request to Hugging Face — model: {AI_MODEL}, state: {"risk" if is_at_risk else "stable"}')
+
+class LLMUnavailable(Exception):
+    """The LLM gave no usable insight (error, timeout, empty reply, or the circuit is open)."""
+
+
+def _llm_post(prompt: prompts.Prompt, stream: bool = False):
+    """POST the prompt to Hugging Face through the circuit breaker. Failures are counted against
+    the breaker and recorded in metrics, then raised as LLMUnavailable."""
+    mode = 'stream' if stream else 'sync'
+    if not llm_breaker.allow():
+        metrics.record_llm_call(mode, 'CircuitOpen')
+        raise LLMUnavailable('circuit open')
+    metrics.LLM_PROMPT_TOKENS.observe(prompt.tokens, prompt.state)
+    t0 = time.perf_counter()
+    body = prompts.request_body(AI_MODEL, prompt, stream)
     try:
         resp = requests.post(
             HF_URL,
@@ -76,125 +116,202 @@ def get_ai_insight(patient: dict, vitals: dict) -> str:
                 'Authorization': f'Bearer {HF_API_KEY}',
                 'Content-Type': 'application/json',
             },
-            json={
-                'model': AI_MODEL,
-                'messages': [{'role': 'user', 'content': prompt}],
-                'max_tokens': 150,
-            },
-            timeout=20,
+            json=body,
+            timeout=(LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT),
+            stream=stream,
         )
         resp.raise_for_status()
-        content = resp.json()['choices'][0]['message']['content'].strip()
-        if not content:
-            print('[AI] Hugging Face returned empty insight content. Generating rule-based fallback.')
-            if is_at_risk:
-                fallback_insight = (
-                    f"{first_name} is currently showing signs that require attention. "
-                    f"Please review their recent vital signs for heart rate, sleep, and activity levels. "
-                    f"Contact {caregiver} for further assessment."
-                )
-            else:
-                fallback_insight = (
-                    f"{first_name} appears stable today. "
-                    f"Their vital signs for heart rate, sleep, and activity levels are within normal ranges. "
-                    f"No immediate action is required."
-                )
-            return fallback_insight
-        print('[AI] Hugging Face response received successfully.')
-        return content
+        return resp
     except requests.HTTPError as e:
+        llm_breaker.record_failure()
+        metrics.record_llm_call(mode, e.response.status_code, time.perf_counter() - t0)
         print(f'[AI] Hugging Face HTTP error: status={e.response.status_code} — '
               f'response body: {e.response.text[:300]}')
-        return f'AI service error ({e.response.status_code}). Please check your HF_API_KEY.'
-    except requests.ConnectionError as e:
-        print(f'[AI] Hugging Face connection error: {e}')
-        return 'AI service unreachable. Please check your network connection.'
-    except requests.Timeout:
-        print('[AI] Hugging Face request timed out after 20 seconds.')
-        return 'AI insight timed out. Please try syncing again.'
-    except Exception as e:
-        print(f'[AI] Hugging Face unexpected error: {type(e).__name__}: {e}')
-        return 'AI insight unavailable. Please ensure HF_API_KEY is configured correctly.'
+        raise LLMUnavailable(f'HTTP {e.response.status_code}') from e
+    except requests.RequestException as e:
+        llm_breaker.record_failure()
+        metrics.record_llm_call(mode, type(e).__name__, time.perf_counter() - t0)
+        print(f'[AI] Hugging Face request failed: {type(e).__name__}: {e}')
+        raise LLMUnavailable(type(e).__name__) from e
+
+
+def generate_ai_insight(patient: dict, vitals: dict) -> str:
+    """Call Hugging Face to generate a user-friendly caregiver insight.
+    Identical prompts are served from the insight cache; only successful responses are cached.
+    Raises LLMUnavailable instead of returning error text, so failures are never stored as insights."""
+    prompt = prompts.render(patient, vitals)
+    cached = insight_cache.get(prompt.cache_key)
+    if cached:
+        print('[AI] Insight served from cache.')
+        return cached
+
+    print(f'[AI] Sending request to Hugging Face — model: {AI_MODEL}, state: {prompt.state}, '
+          f'prompt tokens: {prompt.tokens}, max_tokens: {prompt.max_tokens}')
+    t0 = time.perf_counter()
+    resp = _llm_post(prompt)
+    try:
+        data = resp.json()
+        content = data['choices'][0]['message']['content'].strip()
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+        llm_breaker.record_failure()
+        metrics.record_llm_call('sync', 'BadResponse', time.perf_counter() - t0)
+        raise LLMUnavailable(f'malformed response: {type(e).__name__}') from e
+    llm_breaker.record_success()
+    metrics.record_llm_call('sync', resp.status_code, time.perf_counter() - t0, data.get('usage'))
+    if not content:
+        print('[AI] Hugging Face returned empty insight content.')
+        raise LLMUnavailable('empty response')
+    print('[AI] Hugging Face response received successfully.')
+    insight_cache.put(prompt.cache_key, content)
+    return content
+
+
+def degraded_insight(patient: dict, vitals: dict) -> str:
+    """Rule-based text shown while the LLM is unavailable. Shown, never persisted."""
+    return fallback_insight(patient, vitals['stability_score'] < RISK_SCORE_THRESHOLD)
+
+
+def get_ai_insight(patient: dict, vitals: dict) -> str:
+    """LLM insight, or the rule-based fallback when the LLM is unavailable (fails fast while
+    the circuit is open)."""
+    try:
+        return generate_ai_insight(patient, vitals)
+    except LLMUnavailable as e:
+        print(f'[AI] LLM unavailable ({e}). Generating rule-based fallback.')
+        return degraded_insight(patient, vitals)
+
+
+def stream_ai_insight(patient: dict, vitals: dict):
+    """Yield insight text chunks as the LLM produces them (OpenAI-style streaming chunks).
+    A cached insight is yielded in one piece. Raises LLMUnavailable if the call fails."""
+    prompt = prompts.render(patient, vitals)
+    cached = insight_cache.get(prompt.cache_key)
+    if cached:
+        print('[AI] Insight served from cache.')
+        yield cached
+        return
+
+    print(f'[AI] Streaming request to Hugging Face — model: {AI_MODEL}, state: {prompt.state}, '
+          f'prompt tokens: {prompt.tokens}, max_tokens: {prompt.max_tokens}')
+    t0 = time.perf_counter()
+    parts = []
+    usage = None
+    resp = _llm_post(prompt, stream=True)
+    try:
+        with resp:
+            for line in resp.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                chunk = json.loads(data)
+                usage = chunk.get('usage') or usage
+                choices = chunk.get('choices') or [{}]
+                delta = (choices[0].get('delta') or {}).get('content')
+                if delta:
+                    parts.append(delta)
+                    yield delta
+    except (requests.RequestException, ValueError) as e:
+        # Failed mid-stream, after the response started
+        llm_breaker.record_failure()
+        metrics.record_llm_call('stream', type(e).__name__, time.perf_counter() - t0)
+        raise LLMUnavailable(type(e).__name__) from e
+    llm_breaker.record_success()
+    metrics.record_llm_call('stream', resp.status_code, time.perf_counter() - t0, usage)
+
+    content = ''.join(parts).strip()
+    if not content:
+        raise LLMUnavailable('empty response')
+    print('[AI] Hugging Face stream completed successfully.')
+    insight_cache.put(prompt.cache_key, content)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
 
 
 # ---------------------------------------------------------------------------
 # Routes
 # ---------------------------------------------------------------------------
 
-@app.route('/api/patient', methods=['GET'])
-def get_patient():
-    db = get_db()
-    row = db.execute('SELECT * FROM patients WHERE id = ?', (PATIENT_ID,)).fetchone()
-    db.close()
+@app.route('/api/patient', methods=['GET'], defaults={'patient_id': PATIENT_ID})
+@app.route('/api/patients/<int:patient_id>', methods=['GET'])
+def get_patient(patient_id):
+    db = get_read_db()
+    row = db.execute('SELECT * FROM patients WHERE id = ?', (patient_id,)).fetchone()
     if not row:
         return jsonify({'error': 'Patient not found'}), 404
     return jsonify(dict(row))
 
 
-@app.route('/api/vitals', methods=['GET'])
-def get_vitals():
-    db = get_db()
-    patient = db.execute('SELECT * FROM patients WHERE id = ?', (PATIENT_ID,)).fetchone()
+def _vitals_payload(db, patient, stream_requested: bool = False) -> dict:
     state = patient['current_state']
     vitals = db.execute(
-        'SELECT * FROM vitals WHERE patient_id = ? AND state = ?', (PATIENT_ID, state)
+        'SELECT * FROM vitals WHERE patient_id = ? AND state = ?', (patient['id'], state)
     ).fetchone()
 
-    # Always generate a fresh LLM insight on initial load/login
-    insight = get_ai_insight(dict(patient), dict(vitals))
-    # Update the cached insight in the database for consistency, though it will be regenerated next time.
-    # Or you might choose to only update it if you have a separate background process for caching.
-    db.execute(
-        'INSERT OR REPLACE INTO ai_insights (patient_id, insight_text, state, created_at) VALUES (?, ?, ?, ?)',
-        (PATIENT_ID, insight, state, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-    )
-    db.commit()
-    db.close()
+    # Serve the last stored insight right away and refresh it in the background,
+    # unless the descriptors match a cached LLM response (no outbound call needed)
+    insight = lookup_cached_insight(dict(patient), dict(vitals))
+    job_id = None
+    stream = False
+    if insight is None:
+        insight = get_cached_insight(db, patient['id'], state)
+        # ?insight=stream: the client will open /api/insight/stream instead of polling a job
+        stream = stream_requested
+        if not stream:
+            job_id = submit_insight_job(generate_ai_insight, dict(patient), dict(vitals), state,
+                                        fallback=degraded_insight)
 
     result = dict(vitals)
     result['insight'] = insight
+    result['insight_job_id'] = job_id
+    result['insight_stream'] = stream
     result['theme_color'] = 'hsl(178 100% 25%)' if state == 'stable' else 'hsl(43 96% 56%)'
-    return jsonify(result)
+    return result
 
 
-@app.route('/api/trend', methods=['GET'])
-def get_trend():
-    db = get_db()
-    patient = db.execute('SELECT * FROM patients WHERE id = ?', (PATIENT_ID,)).fetchone()
-    state = patient['current_state']
+def _trend_rows(db, patient_id: int, state: str) -> list:
     rows = db.execute(
         'SELECT day_label AS name, score FROM trend_scores WHERE patient_id = ? AND state = ? ORDER BY sort_order',
-        (PATIENT_ID, state)
+        (patient_id, state)
     ).fetchall()
-    db.close()
-    return jsonify([dict(r) for r in rows])
+    return [dict(r) for r in rows]
 
 
-@app.route('/api/health-data', methods=['GET'])
-def get_health_data():
-    period = request.args.get('period', 'week')
-    db = get_db()
+def _health_rows(db, patient_id: int, period: str) -> list:
+    # Patients with ingested samples are served from rollups; seeded demo data otherwise
+    rollup_rows = rollups.get_period_rows(db, patient_id, period)
+    if rollup_rows is not None:
+        return rollup_rows
     rows = db.execute(
         'SELECT * FROM health_metrics WHERE patient_id = ? AND period_type = ?',
-        (PATIENT_ID, period)
+        (patient_id, period)
     ).fetchall()
-    db.close()
-    return jsonify([dict(r) for r in rows])
+    return [dict(r) for r in rows]
+
+
+def _health_summary(db, patient_id: int, period: str):
+    """Summary metrics for the period: a single precomputed rollup bucket when the patient
+    has ingested samples, otherwise calculated from the seeded health_metrics rows.
+    Returns None if there is no data for the period."""
+    summary = rollups.get_period_summary(db, patient_id, period)
+    if summary is not None:
+        days = summary.pop('days_covered')
+        baseline_steps = BASELINE_STEPS_DAILY * days
+        summary['hr_baseline'] = BASELINE_HR
+        summary['sleep_baseline'] = round(BASELINE_SLEEP_PER_PERIOD * days, 1)
+        summary['step_change'] = round(((summary['steps'] - baseline_steps) / baseline_steps) * 100)
+        return summary
 
-
-@app.route('/api/health-summary', methods=['GET'])
-def get_health_summary():
-    """Calculate summary metrics directly from health_metrics rows in the DB."""
-    period = request.args.get('period', 'week')
-    db = get_db()
     rows = db.execute(
         'SELECT * FROM health_metrics WHERE patient_id = ? AND period_type = ?',
-        (PATIENT_ID, period)
+        (patient_id, period)
     ).fetchall()
-    db.close()
 
     if not rows:
-        return jsonify({'error': 'No health data found for this period'}), 404
+        return None
 
     rows = [dict(r) for r in rows]
     n = len(rows)
@@ -217,7 +334,7 @@ def get_health_summary():
     step_change = round(((total_steps - baseline_steps_for_period) / baseline_steps_for_period) * 100)
     sleep_baseline = round(BASELINE_SLEEP_PER_PERIOD * n, 1)
 
-    return jsonify({
+    return {
         'hr_current': avg_hr,
         'hr_resting': avg_rhr,
         'hr_baseline': BASELINE_HR,
@@ -228,82 +345,432 @@ def get_health_summary():
         'bp_sys': avg_bp_sys,
         'bp_dia': avg_bp_dia,
         'activity_min': avg_activity,
-    })
+    }
 
 
-@app.route('/api/sync', methods=['POST'])
-def sync_data():
-    db = get_db()
-    patient = db.execute('SELECT * FROM patients WHERE id = ?', (PATIENT_ID,)).fetchone()
-    current_state = patient['current_state']
-    new_state = 'risk' if current_state == 'stable' else 'stable'
+def _stats_payload(db, patient) -> dict:
+    patient_id = patient['id']
+    # Counted by trigger on each patient's transition to risk (migration 6), so it survives retention deletes
+    row = db.execute('SELECT risk_events FROM patient_stats WHERE patient_id = ?', (patient_id,)).fetchone()
+    risk_count = row[0] if row else 0
 
-    db.execute('UPDATE patients SET current_state = ? WHERE id = ?', (new_state, PATIENT_ID))
+    caregiver_count = db.execute(
+        "SELECT COUNT(*) FROM patients WHERE id = ? AND caregiver_name IS NOT NULL AND caregiver_name != ''",
+        (patient_id,)
+    ).fetchone()[0]
 
-    # When switching to risk, stamp the risk vitals with the exact current time.
-    # Stable last_updated is permanently set to the historical date and is never changed.
-    if new_state == 'risk':
-        now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        db.execute(
-            'UPDATE vitals SET last_updated = ? WHERE patient_id = ? AND state = ?',
-            (now_str, PATIENT_ID, 'risk')
-        )
+    # Measured by the streaming detector: time from detection to the score crossing the risk threshold
+    lead = db.execute(
+        'SELECT AVG(lead_seconds), COUNT(*) FROM anomaly_events WHERE patient_id = ? AND lead_seconds IS NOT NULL',
+        (patient_id,)
+    ).fetchone()
+    avg_early_detection = f'{round(lead[0] / 3600)}h' if lead[1] else '–'
+
+    return {
+        'risk_events_prevented': risk_count,
+        'avg_early_detection': avg_early_detection,
+        'active_caregivers': caregiver_count,
+    }
 
-    db.commit()
 
-    vitals = db.execute(
-        'SELECT * FROM vitals WHERE patient_id = ? AND state = ?', (PATIENT_ID, new_state)
-    ).fetchone()
-    trend_rows = db.execute(
-        'SELECT day_label AS name, score FROM trend_scores WHERE patient_id = ? AND state = ? ORDER BY sort_order',
-        (PATIENT_ID, new_state)
-    ).fetchall()
+def _not_modified(etag: str):
+    """304 response if the client's If-None-Match already holds this ETag, else None."""
+    if etag in request.if_none_match:
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        return resp
+    return None
+
 
-    # Always generate a fresh LLM insight on sync — this is the primary insight update point
-    ai_text = get_ai_insight(dict(patient), dict(vitals))
-    db.execute(
-        'INSERT INTO ai_insights (patient_id, insight_text, state) VALUES (?, ?, ?)',
-        (PATIENT_ID, ai_text, new_state)
+def _with_etag(payload: dict, etag: str):
+    resp = jsonify(payload)
+    resp.set_etag(etag)
+    # Let the browser keep the body but always revalidate
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
+
+@app.route('/api/vitals', methods=['GET'], defaults={'patient_id': PATIENT_ID})
+@app.route('/api/patients/<int:patient_id>/vitals', methods=['GET'])
+def get_vitals(patient_id):
+    db = get_read_db()
+    patient = db.execute('SELECT * FROM patients WHERE id = ?', (patient_id,)).fetchone()
+    if not patient:
+        return jsonify({'error': 'Patient not found'}), 404
+    return jsonify(_vitals_payload(db, patient, request.args.get('insight') == 'stream'))
+
+
+@app.route('/api/trend', methods=['GET'], defaults={'patient_id': PATIENT_ID})
+@app.route('/api/patients/<int:patient_id>/trend', methods=['GET'])
+def get_trend(patient_id):
+    db = get_read_db()
+    patient = db.execute('SELECT * FROM patients WHERE id = ?', (patient_id,)).fetchone()
+    if not patient:
+        return jsonify({'error': 'Patient not found'}), 404
+    return jsonify(_trend_rows(db, patient_id, patient['current_state']))
+
+
+@app.route('/api/health-data', methods=['GET'], defaults={'patient_id': PATIENT_ID})
+@app.route('/api/patients/<int:patient_id>/health-data', methods=['GET'])
+def get_health_data(patient_id):
+    period = request.args.get('period', 'week')
+    return jsonify(_health_rows(get_read_db(), patient_id, period))
+
+
+@app.route('/api/health-summary', methods=['GET'], defaults={'patient_id': PATIENT_ID})
+@app.route('/api/patients/<int:patient_id>/health-summary', methods=['GET'])
+def get_health_summary(patient_id):
+    period = request.args.get('period', 'week')
+    summary = _health_summary(get_read_db(), patient_id, period)
+    if summary is None:
+        return jsonify({'error': 'No health data found for this period'}), 404
+    return jsonify(summary)
+
+
+@app.route('/api/dashboard', methods=['GET'], defaults={'patient_id': PATIENT_ID})
+@app.route('/api/patients/<int:patient_id>/dashboard', methods=['GET'])
+def get_dashboard(patient_id):
+    """Everything the dashboard needs (patient, vitals + insight, trend, stats) in one response.
+    The strong ETag follows the patient's data version, so unchanged polls get a bodyless 304."""
+    db = get_read_db()
+    version = get_data_version(db, patient_id)
+    etag = f'p{patient_id}-v{version}'
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
+
+    patient = db.execute('SELECT * FROM patients WHERE id = ?', (patient_id,)).fetchone()
+    if not patient:
+        return jsonify({'error': 'Patient not found'}), 404
+    return _with_etag({
+        'patient': dict(patient),
+        'vitals': _vitals_payload(db, patient, request.args.get('insight') == 'stream'),
+        'trend': _trend_rows(db, patient_id, patient['current_state']),
+        'stats': _stats_payload(db, patient),
+        'version': version,
+    }, etag)
+
+
+@app.route('/api/data-view', methods=['GET'], defaults={'patient_id': PATIENT_ID})
+@app.route('/api/patients/<int:patient_id>/data-view', methods=['GET'])
+def get_data_view(patient_id):
+    """Data page payload (patient, period rows and summary) with the same ETag scheme."""
+    period = request.args.get('period', 'week')
+    db = get_read_db()
+    version = get_data_version(db, patient_id)
+    etag = f'p{patient_id}-v{version}-{period}'
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
+
+    patient = db.execute('SELECT * FROM patients WHERE id = ?', (patient_id,)).fetchone()
+    if not patient:
+        return jsonify({'error': 'Patient not found'}), 404
+    return _with_etag({
+        'patient': dict(patient),
+        'period': period,
+        'health_data': _health_rows(db, patient_id, period),
+        'summary': _health_summary(db, patient_id, period),
+        'version': version,
+    }, etag)
+
+
+@app.route('/api/sync', methods=['POST'], defaults={'patient_id': PATIENT_ID})
+@app.route('/api/patients/<int:patient_id>/sync', methods=['POST'])
+def sync_data(patient_id):
+    with writer as db:
+        patient = db.execute('SELECT * FROM patients WHERE id = ?', (patient_id,)).fetchone()
+        if not patient:
+            return jsonify({'error': 'Patient not found'}), 404
+        current_state = patient['current_state']
+        new_state = 'risk' if current_state == 'stable' else 'stable'
+
+        db.execute('UPDATE patients SET current_state = ? WHERE id = ?', (new_state, patient_id))
+
+        # When switching to risk, stamp the risk vitals with the exact current time.
+        # Stable last_updated is permanently set to the historical date and is never changed.
+        if new_state == 'risk':
+            now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            db.execute(
+                'UPDATE vitals SET last_updated = ? WHERE patient_id = ? AND state = ?',
+                (now_str, patient_id, 'risk')
+            )
+
+        vitals = db.execute(
+            'SELECT * FROM vitals WHERE patient_id = ? AND state = ?', (patient_id, new_state)
+        ).fetchone()
+        trend_rows = _trend_rows(db, patient_id, new_state)
+
+    # Sync is the primary insight update point — generation runs on the worker pool
+    ai_text = lookup_cached_insight(dict(patient), dict(vitals))
+    job_id = None
+    stream = False
+    if ai_text is None:
+        ai_text = get_cached_insight(get_read_db(fresh=True), patient_id, new_state)
+        stream = request.args.get('insight') == 'stream'
+        if not stream:
+            job_id = submit_insight_job(generate_ai_insight, dict(patient), dict(vitals), new_state,
+                                        fallback=degraded_insight)
+    else:
+        with writer as db:
+            db.execute(
+                'INSERT INTO ai_insights (patient_id, insight_text, state, created_at) VALUES (?, ?, ?, ?)',
+                (patient_id, ai_text, new_state, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            )
+
+    # Push the transition to every dashboard watching this patient
+    hub.publish(
+        patient_id, 'risk_alert' if new_state == 'risk' else 'state_change',
+        state=new_state, stability_score=vitals['stability_score'], status=vitals['status'],
     )
-    db.commit()
-    db.close()
 
     result = dict(vitals)
     result['insight'] = ai_text
+    result['insight_job_id'] = job_id
+    result['insight_stream'] = stream
     result['theme_color'] = 'hsl(178 100% 25%)' if new_state == 'stable' else 'hsl(43 96% 56%)'
-    result['trend'] = [dict(r) for r in trend_rows]
+    result['trend'] = trend_rows
     return jsonify(result)
 
 
-@app.route('/api/stats', methods=['GET'])
-def get_stats():
-    db = get_db()
+@app.route('/api/ingest', methods=['POST'])
+def ingest_samples():
+    """Accept a batch of raw wearable samples as JSON lines or the packed binary format.
+    Samples are buffered and group-committed; pass ?wait=1 to block until they are on disk."""
+    body = request.get_data()
+    try:
+        if request.mimetype == 'application/octet-stream':
+            rows = parse_binary(body)
+        else:
+            rows = parse_json_lines(body)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': f'Invalid sample batch: {e}'}), 400
 
-    risk_count = db.execute(
-        'SELECT COUNT(*) FROM ai_insights WHERE patient_id = ? AND state = ?',
-        (PATIENT_ID, 'risk')
-    ).fetchone()[0]
+    try:
+        ingest_buffer.add(rows)
+    except IngestBufferFull as e:
+        return jsonify({'error': str(e)}), 503
+
+    if request.args.get('wait') == '1':
+        ingest_buffer.flush()
+    return jsonify({'accepted': len(rows), **ingest_buffer.stats()}), 202
+
+
+@app.route('/api/export/<table>', methods=['GET'])
+def export_table(table):
+    """Stream a whole table (or ?patient_id=N's rows) as ?format=csv (gzip), arrow or parquet."""
+    fmt = request.args.get('format', 'csv')
+    # Its own connection: the open cursor holds a read transaction for the whole download,
+    # which would freeze the pooled connection's view for every other request on the thread
+    db = connect_ro()
+    try:
+        stream = export.export_stream(db, table, fmt, request.args.get('patient_id', type=int))
+    except export.ExportError as e:
+        db.close()
+        return jsonify({'error': str(e)}), 400
+
+    def generate():
+        try:
+            yield from stream
+        finally:
+            db.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=export.MIMETYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{table}{export.EXTENSIONS[fmt]}"'},
+    )
 
-    caregiver_count = db.execute(
-        "SELECT COUNT(*) FROM patients WHERE caregiver_name IS NOT NULL AND caregiver_name != ''"
-    ).fetchone()[0]
 
-    risk_trend = db.execute(
-        'SELECT score FROM trend_scores WHERE patient_id = ? AND state = ? ORDER BY sort_order',
-        (PATIENT_ID, 'risk')
-    ).fetchall()
-    days_before_drop = sum(1 for row in risk_trend if row['score'] >= 75)
-    avg_early_detection = f'{days_before_drop * 24}h' if days_before_drop > 0 else '24h'
+@app.route('/api/import/<table>', methods=['POST'])
+def import_table(table):
+    """Load a file produced by /api/export from the request body; ?replace=1 replaces each
+    imported patient's existing rows. The format comes from ?format= or the Content-Type."""
+    by_mimetype = {mimetype: fmt for fmt, mimetype in export.MIMETYPES.items()}
+    fmt = request.args.get('format') or by_mimetype.get(request.mimetype, 'csv')
+    try:
+        result = export.import_stream(writer, table, request.stream, fmt, request.args.get('replace') == '1')
+    except (export.ExportError, OSError, EOFError, csv.Error, sqlite3.Error) as e:
+        return jsonify({'error': f'Import failed: {type(e).__name__}: {e}'}), 400
+    return jsonify(result)
 
-    db.close()
 
+@app.route('/api/patients/<int:patient_id>/samples', methods=['GET'])
+def get_samples(patient_id):
+    """Raw samples of one metric in [start, end) (unix seconds), optionally averaged
+    into buckets of `resolution` seconds."""
+    try:
+        metric = request.args.get('metric', 'hr')
+        end = int(request.args.get('end', datetime.now().timestamp()))
+        start = int(request.args.get('start', end - 7 * 86400))
+        resolution = int(request.args.get('resolution', 0)) or None
+        ts, values = sample_store.query(get_read_db(), patient_id, metric, start, end, resolution)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     return jsonify({
-        'risk_events_prevented': risk_count,
-        'avg_early_detection': avg_early_detection,
-        'active_caregivers': caregiver_count,
+        'metric': metric, 'start': start, 'end': end, 'resolution': resolution,
+        'ts': ts.tolist(), 'values': [round(v, 2) for v in values.tolist()],
+    })
+
+
+@app.route('/api/insight/stream', methods=['GET'], defaults={'patient_id': PATIENT_ID})
+@app.route('/api/patients/<int:patient_id>/insight/stream', methods=['GET'])
+def stream_insight(patient_id):
+    """Relay LLM tokens as Server-Sent Events: `token` events while generating, then a
+    `done` event with the full text once it has been saved to ai_insights."""
+    db = get_read_db(fresh=True)
+    patient = db.execute('SELECT * FROM patients WHERE id = ?', (patient_id,)).fetchone()
+    if not patient:
+        return jsonify({'error': 'Patient not found'}), 404
+    state = patient['current_state']
+    vitals = db.execute(
+        'SELECT * FROM vitals WHERE patient_id = ? AND state = ?', (patient_id, state)
+    ).fetchone()
+    patient, vitals = dict(patient), dict(vitals)
+
+    def events():
+        parts = []
+        try:
+            for chunk in stream_ai_insight(patient, vitals):
+                parts.append(chunk)
+                yield _sse('token', {'text': chunk})
+        except LLMUnavailable as e:
+            # Degraded mode: show the rule-based text but don't store it as an insight
+            print(f'[AI] LLM unavailable while streaming ({e}). Sending rule-based fallback.')
+            yield _sse('done', {'insight': degraded_insight(patient, vitals), 'degraded': True})
+            return
+
+        insight = ''.join(parts).strip()
+        with writer as db:
+            db.execute(
+                'INSERT INTO ai_insights (patient_id, insight_text, state, created_at) VALUES (?, ?, ?, ?)',
+                (patient_id, insight, state, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            )
+        yield _sse('done', {'insight': insight})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@app.route('/api/events', methods=['GET'])
+@app.route('/api/patients/<int:patient_id>/events', methods=['GET'])
+def stream_events(patient_id=None):
+    """Server-Sent Events push channel for patient state changes.
+    /api/events?patients=1,2,3 subscribes a caregiver to several patients at once."""
+    if patient_id is not None:
+        patient_ids = [patient_id]
+    else:
+        try:
+            patient_ids = [int(p) for p in request.args.get('patients', str(PATIENT_ID)).split(',') if p]
+        except ValueError:
+            return jsonify({'error': 'patients must be a comma-separated list of ids'}), 400
+    sub = hub.subscribe(patient_ids)
+    return Response(
+        sse_stream(sub),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@app.route('/api/events/stats', methods=['GET'])
+def get_event_stats():
+    return jsonify(hub.stats())
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/debug/profiler', methods=['GET', 'POST'])
+def profiler_control():
+    """POST ?enabled=1|0[&interval=0.01][&reset=1] toggles the sampling profiler.
+    GET ?format=collapsed returns the sampled stacks for flamegraph tools.
+    Only served with DEBUG_ENDPOINTS=1."""
+    if not DEBUG_ENDPOINTS:
+        return jsonify({'error': 'Not found'}), 404
+    profiler = metrics.profiler
+    if request.method == 'POST':
+        interval = None
+        if 'interval' in request.args:
+            try:
+                interval = float(request.args['interval'])
+            except ValueError:
+                interval = math.nan
+            if not math.isfinite(interval) or interval < metrics.PROFILER_MIN_INTERVAL:
+                return jsonify({'error': f'interval must be a number of seconds, at least '
+                                         f'{metrics.PROFILER_MIN_INTERVAL}'}), 400
+        if request.args.get('reset') == '1':
+            profiler.reset()
+        enabled = request.args.get('enabled')
+        if enabled == '1':
+            profiler.start(interval)
+        elif enabled == '0':
+            profiler.stop()
+    if request.args.get('format') == 'collapsed':
+        return Response(profiler.collapsed(), mimetype='text/plain')
+    return jsonify(profiler.stats())
+
+
+@app.route('/api/insight/jobs/<int:job_id>', methods=['GET'])
+def get_insight_job(job_id):
+    """Poll an insight job queued by /api/vitals or /api/sync."""
+    db = get_read_db(fresh=True)
+    job = get_job(db, job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({
+        'id': job['id'],
+        'status': job['status'],
+        'state': job['state'],
+        'insight': job['insight_text'],
+        'error': job['error'],
     })
 
 
+@app.route('/api/insight/breaker', methods=['GET'])
+def get_llm_breaker():
+    """Circuit breaker state for the Hugging Face dependency."""
+    return jsonify(llm_breaker.stats())
+
+
+@app.route('/api/patients/<int:patient_id>/anomaly', methods=['GET'])
+def get_anomaly_state(patient_id):
+    """The streaming detector's baselines, CUSUMs and recent episodes for one patient."""
+    db = get_read_db()
+    episodes = db.execute(
+        'SELECT detected_at, declined_at, resolved_at, lead_seconds, signals FROM anomaly_events '
+        'WHERE patient_id = ? ORDER BY detected_at DESC LIMIT 20',
+        (patient_id,)
+    ).fetchall()
+    return jsonify({'detector': anomaly.snapshot(db, patient_id), 'episodes': [dict(r) for r in episodes]})
+
+
+@app.route('/api/anomaly/stats', methods=['GET'])
+def get_anomaly_stats():
+    return jsonify(anomaly.detector.stats())
+
+
+@app.route('/api/insight/cache-stats', methods=['GET'])
+def get_insight_cache_stats():
+    return jsonify(insight_cache.stats())
+
+
+@app.route('/api/stats', methods=['GET'], defaults={'patient_id': PATIENT_ID})
+@app.route('/api/patients/<int:patient_id>/stats', methods=['GET'])
+def get_stats(patient_id):
+    db = get_read_db()
+    patient = db.execute('SELECT * FROM patients WHERE id = ?', (patient_id,)).fetchone()
+    if not patient:
+        return jsonify({'error': 'Patient not found'}), 404
+    return jsonify(_stats_payload(db, patient))
+
+
 if __name__ == '__main__':
     init_db()
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':   # the reloaded child, not the watcher process
+        retention.start()
     app.run(debug=True, port=5000)
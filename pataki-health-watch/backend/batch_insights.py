@@ -0,0 +1,194 @@
+"""Generate insights for every patient whose state changed since their last insight.
+
+Prompts are deduplicated and checked against the insight cache first. Remaining prompts go
+through one pooled requests.Session with at most --max-in-flight concurrent calls, retrying
+429/5xx with exponential backoff. Results are written to ai_insights in a single bulk insert.
+
+Usage (from pataki-health-watch/backend/):
+    python batch_insights.py --max-in-flight 8
+    python batch_insights.py --all --mock --mock-latency 0.2    # benchmark against a local mock of HF_URL
+"""
+import argparse
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import requests
+from requests.adapters import HTTPAdapter
+import metrics
+import prompts
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def changed_patients(db, include_all: bool = False, shard: tuple = None):
+    """Patients (with their current vitals) whose latest insight is missing or for another state.
+    shard=(index, count) limits it to patients with id % count == index."""
+    query = '''
+        SELECT p.*, v.hr, v.sleep_hours, v.steps, v.fatigue, v.stability_score, v.bp_sys
+        FROM patients p
+        JOIN vitals v ON v.patient_id = p.id AND v.state = p.current_state
+        LEFT JOIN ai_insights i ON i.id = (
+            SELECT id FROM ai_insights WHERE patient_id = p.id ORDER BY created_at DESC, id DESC LIMIT 1
+        )
+    '''
+    conditions, params = [], ()
+    if not include_all:
+        conditions.append('(i.id IS NULL OR i.state != p.current_state)')
+    if shard is not None:
+        conditions.append('p.id % ? = ?')
+        params = (shard[1], shard[0])
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    return [dict(r) for r in db.execute(query, params)]
+
+
+def make_session(max_in_flight: int) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def call_llm(session, url: str, api_key: str, model: str, prompt,
+             max_retries: int = 4, backoff: float = 0.5, timeout: float = 20, breaker=None):
+    """Return the completion text, or None once retries are exhausted, the breaker is open or
+    the response isn't a usable completion."""
+    for attempt in range(max_retries + 1):
+        if breaker is not None and not breaker.allow():
+            metrics.record_llm_call('batch', 'CircuitOpen')
+            return None
+        t0 = time.perf_counter()
+        try:
+            resp = session.post(
+                url,
+                headers={'Authorization': f'Bearer {api_key}', 'Content-Type': 'application/json'},
+                json=prompts.request_body(model, prompt),
+                timeout=timeout,
+            )
+            if not resp.ok:
+                metrics.record_llm_call('batch', resp.status_code, time.perf_counter() - t0)
+                if breaker is not None:
+                    breaker.record_failure()
+                if resp.status_code in RETRY_STATUSES and attempt < max_retries:
+                    retry_after = resp.headers.get('Retry-After')
+                    delay = float(retry_after) if retry_after and retry_after.isdigit() else backoff * 2 ** attempt
+                    time.sleep(delay * random.uniform(0.8, 1.2))
+                    continue
+                resp.raise_for_status()
+            # Success is only recorded once the body is a usable completion
+            body = resp.json()
+            content = body['choices'][0]['message']['content'].strip()
+        except (requests.ConnectionError, requests.Timeout) as e:
+            metrics.record_llm_call('batch', type(e).__name__, time.perf_counter() - t0)
+            if breaker is not None:
+                breaker.record_failure()
+            if attempt == max_retries:
+                print(f'[Batch] Giving up after {attempt + 1} attempts: {type(e).__name__}')
+                return None
+            time.sleep(backoff * 2 ** attempt * random.uniform(0.8, 1.2))
+            continue
+        except requests.HTTPError as e:
+            print(f'[Batch] Hugging Face HTTP error: status={e.response.status_code}')
+            return None
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+            metrics.record_llm_call('batch', 'BadResponse', time.perf_counter() - t0)
+            if breaker is not None:
+                breaker.record_failure()
+            print(f'[Batch] Malformed Hugging Face response: {type(e).__name__}')
+            return None
+        metrics.record_llm_call('batch', resp.status_code, time.perf_counter() - t0, body.get('usage'))
+        if breaker is not None:
+            breaker.record_success()
+        return content or None
+    return None
+
+
+def run_batch(db, app_module, max_in_flight: int = 8, include_all: bool = False, url: str = None,
+              use_cache: bool = True, shard: tuple = None) -> dict:
+    """Insert a fresh insight for every changed patient the LLM answers for. Patients whose call
+    fails get nothing stored: like the web app's degraded mode, the rule-based text is only
+    shown (by the dashboard's insight job), and the next run retries them."""
+    import insight_cache
+
+    patients = changed_patients(db, include_all, shard)
+    by_prompt = {}
+    for p in patients:
+        by_prompt.setdefault(prompts.render(p, p), []).append(p)
+
+    texts = {}
+    to_call = []
+    for prompt in by_prompt:
+        cached = insight_cache.get(prompt.cache_key) if use_cache else None
+        if cached:
+            texts[prompt] = cached
+        else:
+            to_call.append(prompt)
+
+    t0 = time.perf_counter()
+    session = make_session(max_in_flight)
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        results = pool.map(
+            lambda prompt: call_llm(session, url or app_module.HF_URL, app_module.HF_API_KEY,
+                                    app_module.AI_MODEL, prompt, breaker=app_module.llm_breaker),
+            to_call
+        )
+        for prompt, text in zip(to_call, results):
+            if text:
+                texts[prompt] = text
+                insight_cache.put(prompt.cache_key, text)
+    llm_elapsed = time.perf_counter() - t0
+
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    rows = [
+        (p['id'], texts[prompt], p['current_state'], now)
+        for prompt, group in by_prompt.items() if prompt in texts
+        for p in group
+    ]
+    db.executemany(
+        'INSERT INTO ai_insights (patient_id, insight_text, state, created_at) VALUES (?, ?, ?, ?)', rows
+    )
+    db.commit()
+    elapsed = time.perf_counter() - t0
+    return {
+        'patients': len(patients),
+        'unique_prompts': len(by_prompt),
+        'llm_calls': len(to_call),
+        'failed': len(to_call) - sum(1 for prompt in to_call if prompt in texts),
+        'inserted': len(rows),
+        'llm_seconds': round(llm_elapsed, 3),
+        'insights_per_sec': round(len(rows) / elapsed, 1) if elapsed else None,
+        'llm_calls_per_sec': round(len(to_call) / llm_elapsed, 1) if llm_elapsed else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-in-flight', type=int, default=8, help='concurrent LLM requests')
+    parser.add_argument('--all', action='store_true', help='regenerate for every patient, not just state changes')
+    parser.add_argument('--no-cache', action='store_true', help='skip the insight cache (for benchmarking)')
+    parser.add_argument('--mock', action='store_true', help='run against a local mock of HF_URL')
+    parser.add_argument('--mock-latency', type=float, default=0.2)
+    parser.add_argument('--mock-error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    import app as app_module
+    import migrations
+    from database import connect
+
+    url = None
+    if args.mock:
+        from mock_hf import start_mock_server
+        server, url = start_mock_server(latency=args.mock_latency, error_rate=args.mock_error_rate)
+
+    db = connect()
+    migrations.migrate(db)
+    report = run_batch(db, app_module, args.max_in_flight, args.all, url, use_cache=not args.no_cache)
+    db.close()
+    for key, value in report.items():
+        print(f'  {key:<18} {value}')
+
+
+if __name__ == '__main__':
+    main()
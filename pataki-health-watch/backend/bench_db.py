@@ -0,0 +1,150 @@
+"""Compare concurrent read/write throughput: a fresh untuned connection per request (the old
+get_db), pooled WAL-tuned per-thread connections for both reads and writes (DB_READ_MODE=rw),
+and read-only or in-memory snapshot readers with writes through database.writer
+(DB_READ_MODE=ro / snapshot).
+
+Usage (from pataki-health-watch/backend/):
+    python bench_db.py --threads 8 --seconds 5 --write-ratio 0.1
+    python bench_db.py --threads 1,2,4,8 --write-ratio 0.05   # how reads scale with threads
+
+Runs against temporary databases so the demo pataki.db is left untouched.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+
+def _legacy_connect(path):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _read(db, pid):
+    patient = db.execute('SELECT * FROM patients WHERE id = ?', (pid,)).fetchone()
+    db.execute('SELECT * FROM vitals WHERE patient_id = ? AND state = ?',
+               (pid, patient['current_state'])).fetchone()
+    db.execute('SELECT day_label, score FROM trend_scores WHERE patient_id = ? AND state = ? ORDER BY sort_order',
+               (pid, patient['current_state'])).fetchall()
+
+
+def _write(db, pid, state):
+    db.execute('UPDATE patients SET current_state = ? WHERE id = ?', (state, pid))
+
+
+def _shared(acquire, release):
+    """read/write functions for connections that do both (commit per write)."""
+    def read(pid):
+        db = acquire()
+        try:
+            _read(db, pid)
+        finally:
+            release(db)
+
+    def write(pid, state):
+        db = acquire()
+        try:
+            _write(db, pid, state)
+            db.commit()
+        except sqlite3.OperationalError:
+            db.rollback()
+            raise
+        finally:
+            release(db)
+    return read, write
+
+
+def _split(database, mode):
+    """Reads on get_read_db() in `mode`, writes through the single writer."""
+    database.DB_READ_MODE = mode
+
+    def write(pid, state):
+        with database.writer as db:
+            _write(db, pid, state)
+    return lambda pid: _read(database.get_read_db(), pid), write
+
+
+def _run(label, read, write, n_threads, seconds, write_ratio, n_patients):
+    counts = {'reads': 0, 'writes': 0, 'locked': 0}
+    lock = threading.Lock()
+    stop = time.monotonic() + seconds
+
+    def worker(seed_value):
+        rng = random.Random(seed_value)
+        local = {'reads': 0, 'writes': 0, 'locked': 0}
+        while time.monotonic() < stop:
+            pid = rng.randint(1, n_patients)
+            try:
+                if rng.random() < write_ratio:
+                    write(pid, rng.choice(('stable', 'risk')))
+                    local['writes'] += 1
+                else:
+                    read(pid)
+                    local['reads'] += 1
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                local['locked'] += 1
+        with lock:
+            for k, v in local.items():
+                counts[k] += v
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = counts['reads'] + counts['writes']
+    print(f'  {label:<32} {total / seconds:>10,.0f} ops/sec  '
+          f'({counts["reads"] / seconds:,.0f} reads/s, {counts["writes"] / seconds:,.0f} writes/s, '
+          f'{counts["locked"]} "database is locked" errors)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', default='8', help='thread count, or a comma-separated list')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--write-ratio', type=float, default=0.1)
+    parser.add_argument('--patients', type=int, default=1000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='pataki-dbbench-')
+    legacy_path = os.path.join(tmp, 'legacy.db')
+    pooled_path = os.path.join(tmp, 'pooled.db')
+    os.environ['PATAKI_DB_PATH'] = pooled_path
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import database
+    from seed_patients import seed
+
+    database.init_db()
+    db = database.connect()
+    database.seed_demo(db)
+    seed(db, args.patients - 1)
+    db.close()
+    # Same data, but in the default rollback-journal mode the old get_db() ran with
+    with sqlite3.connect(pooled_path) as src, sqlite3.connect(legacy_path) as dst:
+        src.backup(dst)
+    conn = sqlite3.connect(legacy_path)
+    conn.execute('PRAGMA journal_mode=DELETE')
+    conn.close()
+
+    database.DB_SNAPSHOT_INTERVAL = 1
+    variants = (
+        ('fresh connection per op', lambda: _shared(lambda: _legacy_connect(legacy_path), lambda db: db.close())),
+        ('pooled WAL connections', lambda: _shared(database.get_db, lambda db: database.release_db())),
+        ('read-only + single writer', lambda: _split(database, 'ro')),
+        ('snapshot + single writer', lambda: _split(database, 'snapshot')),
+    )
+    for n_threads in [int(n) for n in args.threads.split(',')]:
+        print(f'{n_threads} threads, {args.seconds:g}s, {args.write_ratio:.0%} writes, {args.patients} patients')
+        for label, make in variants:
+            _run(label, *make(), n_threads, args.seconds, args.write_ratio, args.patients)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Measure sustained ingest throughput for POST /api/ingest.
+
+Usage (from pataki-health-watch/backend/):
+    python bench_ingest.py --samples 500000 --batch 5000
+    python bench_ingest.py --format json
+
+Runs against a fresh temporary database so the demo pataki.db is left untouched.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+
+def make_batches(n_samples: int, batch: int, n_patients: int, seed_value: int = 42):
+    rng = random.Random(seed_value)
+    start_ts = 1771718400  # 2026-02-22 00:00 UTC
+    for offset in range(0, n_samples, batch):
+        rows = []
+        for i in range(offset, min(offset + batch, n_samples)):
+            minute = i // n_patients
+            rows.append((i % n_patients + 1, start_ts + minute * 60, rng.randint(55, 120), rng.randint(0, 120),
+                         rng.choice((0, 0, 1)), rng.randint(110, 140), rng.randint(70, 90)))
+        yield rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=500000)
+    parser.add_argument('--batch', type=int, default=5000, help='samples per HTTP request')
+    parser.add_argument('--patients', type=int, default=1000)
+    parser.add_argument('--format', choices=('binary', 'json'), default='binary')
+    args = parser.parse_args()
+
+    os.environ['PATAKI_DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix='pataki-ingest-'), 'pataki.db')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as app_module
+    from database import connect, init_db
+    from ingest import SAMPLE_FIELDS, ingest_buffer, pack_binary
+
+    init_db()
+
+    # Encode up front so the timing covers the server side only
+    if args.format == 'binary':
+        payloads = [pack_binary(rows) for rows in make_batches(args.samples, args.batch, args.patients)]
+        content_type = 'application/octet-stream'
+    else:
+        payloads = [
+            '\n'.join(json.dumps(dict(zip(SAMPLE_FIELDS, row))) for row in rows).encode()
+            for rows in make_batches(args.samples, args.batch, args.patients)
+        ]
+        content_type = 'application/x-ndjson'
+
+    client = app_module.app.test_client()
+    t0 = time.perf_counter()
+    for payload in payloads:
+        resp = client.post('/api/ingest', data=payload, content_type=content_type)
+        if resp.status_code != 202:
+            raise RuntimeError(f'ingest returned {resp.status_code}: {resp.get_json()}')
+    accepted = time.perf_counter() - t0
+    ingest_buffer.flush(timeout=300)
+    elapsed = time.perf_counter() - t0
+
+    db = connect()
+    stored = db.execute('SELECT COUNT(*) FROM raw_samples').fetchone()[0]
+    db.close()
+    stats = ingest_buffer.stats()
+    print(f'{args.format}: {stored} samples stored in {elapsed:.2f}s '
+          f'({stored / elapsed:,.0f} samples/sec committed, {args.samples / accepted:,.0f} samples/sec accepted, '
+          f'{stats["batches"]} transactions)')
+
+
+if __name__ == '__main__':
+    main()
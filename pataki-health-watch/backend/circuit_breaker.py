@@ -0,0 +1,93 @@
+import threading
+import time
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitBreaker:
+    """Stops calling a failing dependency so callers fall back immediately instead of
+    tying up workers on connection errors and timeouts.
+
+    closed:    calls go through; `failure_threshold` consecutive failures open the circuit.
+    open:      allow() is False until `reset_timeout` seconds have passed.
+    half_open: up to `half_open_max_calls` probe calls go through; a success closes the
+               circuit, a failure re-opens it for another `reset_timeout`.
+
+    Every call that allow() lets through should be followed by record_success() or
+    record_failure(); a probe whose outcome is never recorded (e.g. the client went away)
+    stops blocking new probes after `reset_timeout`.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_started = 0.0
+        self._rejected = 0
+        self._times_opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN:
+                now = time.monotonic()
+                if self._probes >= self.half_open_max_calls and now - self._probe_started >= self.reset_timeout:
+                    self._probes = 0
+                if self._probes < self.half_open_max_calls:
+                    self._probes += 1
+                    self._probe_started = now
+                    return True
+            self._rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            if self._state != CLOSED:
+                print(f'[Breaker] {self.name}: probe succeeded, circuit closed')
+                self._state = CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN or (
+                self._state == CLOSED and self._consecutive_failures >= self.failure_threshold
+            ):
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._times_opened += 1
+                print(f'[Breaker] {self.name}: circuit opened after {self._consecutive_failures} '
+                      f'consecutive failures; retrying in {self.reset_timeout:g}s')
+
+    def stats(self) -> dict:
+        with self._lock:
+            state = self._current_state()
+            return {
+                'name': self.name,
+                'state': state,
+                'consecutive_failures': self._consecutive_failures,
+                'retry_in_seconds': round(max(0.0, self._opened_at + self.reset_timeout - time.monotonic()), 1)
+                if state == OPEN else 0,
+                'rejected': self._rejected,
+                'times_opened': self._times_opened,
+            }
@@ -1,113 +1,257 @@
 import sqlite3
 import os
+import threading
+import time
+from urllib.request import pathname2url
+from flask import g, has_app_context
+import migrations
+from metrics import Gauge, TimedConnection
 
-DB_PATH = os.path.join(os.path.dirname(__file__), 'pataki.db')
+DB_PATH = os.getenv('PATAKI_DB_PATH', os.path.join(os.path.dirname(__file__), 'pataki.db'))
 
+# Where read-only request handlers read from (get_read_db):
+#   ro        a mode=ro connection per thread to the database file (default)
+#   snapshot  an in-memory copy refreshed every DB_SNAPSHOT_INTERVAL seconds; reads may lag writes
+#   rw        the thread's read-write connection, as before
+DB_READ_MODE = os.getenv('DB_READ_MODE', 'ro')
+DB_SNAPSHOT_INTERVAL = float(os.getenv('DB_SNAPSHOT_INTERVAL', '5'))
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
+# Applied once per pooled connection rather than on every request
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',       # safe with WAL; fsync on checkpoint instead of every commit
+    'PRAGMA busy_timeout=5000',        # wait for the writer instead of failing with "database is locked"
+    'PRAGMA cache_size=-32000',        # 32 MB page cache
+    'PRAGMA mmap_size=268435456',      # 256 MB memory-mapped reads
+    'PRAGMA temp_store=MEMORY',
+)
+# journal_mode and synchronous can't be set on a read-only connection; WAL persists in the file
+READ_PRAGMAS = PRAGMAS[2:]
+STATEMENT_CACHE_SIZE = 256
+
+try:
+    # gevent patches threading.local to be per greenlet, i.e. per request; keep the pool per OS thread
+    from gevent.monkey import get_original
+    _local = get_original('threading', 'local')()
+except ImportError:
+    _local = threading.local()
+
+
+def connect(check_same_thread: bool = True):
+    """Open a new tuned connection. Callers own it and must close it."""
+    conn = sqlite3.connect(DB_PATH, timeout=5, cached_statements=STATEMENT_CACHE_SIZE,
+                           factory=TimedConnection, check_same_thread=check_same_thread)
     conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
     return conn
 
 
-def init_db():
-    conn = get_db()
-    c = conn.cursor()
+def connect_ro(uri: str = None, check_same_thread: bool = True):
+    """Open a read-only connection to the database file (or to `uri`). It can never take the
+    write lock, so under WAL any number of them read in parallel with the writer."""
+    uri = uri or f'file:{pathname2url(os.path.abspath(DB_PATH))}?mode=ro'
+    conn = sqlite3.connect(uri, uri=True, timeout=5, cached_statements=STATEMENT_CACHE_SIZE,
+                           factory=TimedConnection, check_same_thread=check_same_thread)
+    conn.row_factory = sqlite3.Row
+    for pragma in READ_PRAGMAS:
+        conn.execute(pragma)
+    conn.execute('PRAGMA query_only=1')
+    return conn
+
+
+def get_db():
+    """Return this thread's pooled connection, opening it on first use.
+    Don't close it — request handlers release it via release_db on app teardown."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _local.conn = connect()
+    return conn
+
+
+def get_read_db(fresh: bool = False):
+    """Return this thread's read-only connection, per DB_READ_MODE. Writes through it fail;
+    use `writer`. fresh=True skips the snapshot for reads that must see the latest commit."""
+    if DB_READ_MODE == 'rw':
+        return get_db()
+    if DB_READ_MODE == 'snapshot' and not fresh:
+        # Pinned for the whole request, so a refresh can't swap the connection under a caller
+        if not has_app_context():
+            return _snapshot_db()
+        if 'snapshot_db' not in g:
+            g.snapshot_db = _snapshot_db()
+        return g.snapshot_db
+    conn = getattr(_local, 'ro', None)
+    if conn is None:
+        conn = _local.ro = connect_ro()
+    return conn
+
+
+def _snapshot_db():
+    """This thread's connection to the current snapshot. A connection to an older copy is
+    dropped, not closed: a caller may still hold it. Request handlers close it on teardown
+    (release_db); elsewhere it closes when the last reference goes."""
+    generation, uri = _snapshot.current()
+    if getattr(_local, 'snapshot_generation', None) != generation:
+        _local.snapshot = connect_ro(uri)
+        _local.snapshot_generation = generation
+    return _local.snapshot
+
+
+class Writer:
+    """The process's single write connection. `with writer as db:` holds it for one
+    transaction, committing on success and rolling back on error. Threads queue on a lock
+    instead of contending for SQLite's write lock through busy_timeout retries. Nested
+    blocks join the outer transaction."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._conn = None
+        self._depth = 0
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._conn is None:
+            self._conn = connect(check_same_thread=False)
+        self._depth += 1
+        return self._conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self._depth -= 1
+        try:
+            if self._depth == 0:
+                if exc_type is None:
+                    self._conn.commit()
+                else:
+                    self._conn.rollback()
+        finally:
+            self._lock.release()
+        return False
+
+
+writer = Writer()
+
 
-    c.executescript('''
-        CREATE TABLE IF NOT EXISTS patients (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            age INTEGER,
-            address TEXT,
-            device_name TEXT,
-            device_status TEXT,
-            device_battery TEXT,
-            caregiver_name TEXT,
-            caregiver_relationship TEXT,
-            caregiver_phone TEXT,
-            caregiver_email TEXT,
-            current_state TEXT DEFAULT 'stable'
-        );
-
-        CREATE TABLE IF NOT EXISTS vitals (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER,
-            state TEXT,
-            hr INTEGER,
-            sleep_hours REAL,
-            steps INTEGER,
-            fatigue TEXT,
-            stability_score INTEGER,
-            status TEXT,
-            bp_sys INTEGER,
-            bp_dia INTEGER,
-            resting_hr INTEGER,
-            activity_min INTEGER,
-            last_updated TEXT,
-            FOREIGN KEY (patient_id) REFERENCES patients(id)
-        );
-
-        CREATE TABLE IF NOT EXISTS trend_scores (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER,
-            state TEXT,
-            day_label TEXT,
-            score INTEGER,
-            sort_order INTEGER,
-            FOREIGN KEY (patient_id) REFERENCES patients(id)
-        );
-
-        CREATE TABLE IF NOT EXISTS health_metrics (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER,
-            period_type TEXT,
-            label TEXT,
-            hr INTEGER,
-            resting_hr INTEGER,
-            bp_sys INTEGER,
-            bp_dia INTEGER,
-            steps INTEGER,
-            sleep REAL,
-            activity_min INTEGER,
-            FOREIGN KEY (patient_id) REFERENCES patients(id)
-        );
-
-        CREATE TABLE IF NOT EXISTS period_summaries (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER,
-            period_type TEXT,
-            hr_current INTEGER,
-            hr_resting INTEGER,
-            hr_baseline INTEGER,
-            sleep_total REAL,
-            sleep_baseline REAL,
-            steps INTEGER,
-            step_change INTEGER,
-            bp_sys INTEGER,
-            bp_dia INTEGER,
-            activity_min INTEGER,
-            FOREIGN KEY (patient_id) REFERENCES patients(id)
-        );
-
-        CREATE TABLE IF NOT EXISTS ai_insights (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER,
-            insight_text TEXT,
-            state TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (patient_id) REFERENCES patients(id)
-        );
-    ''')
-
-    # Always reset patient to stable sta te on startup (demo mode — ensures clean start every run)
-    c.execute("UPDATE patients SET current_state = 'stable' WHERE id = 1")
+class Snapshot:
+    """An in-memory copy of the database for DB_READ_MODE=snapshot. A background thread
+    copies the file with the backup API every DB_SNAPSHOT_INTERVAL seconds if anything was
+    committed since the last copy. Each copy is a new named shared-cache memory database,
+    so readers finish on the old copy and move to the new one on their next get_read_db."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current = None   # (generation, uri), swapped as one value
+        self._holder = None    # keeps the current copy alive
+        self.refreshed_at = 0.0
+        self.refreshes = 0
+
+    @property
+    def generation(self):
+        return self._current[0] if self._current else None
+
+    def current(self):
+        if self._current is None:
+            with self._lock:
+                if self._current is None:
+                    source = connect_ro(check_same_thread=False)   # handed to the refresh thread
+                    self._refresh(source)
+                    threading.Thread(target=self._run, args=(source,), name='db-snapshot', daemon=True).start()
+        return self._current
+
+    def _refresh(self, source):
+        generation = self.refreshes + 1
+        uri = f'file:pataki-snapshot-{os.getpid()}-{generation}?mode=memory&cache=shared'
+        holder = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        source.backup(holder)
+        old, self._holder = self._holder, holder
+        self._current = (generation, uri)
+        self.refreshed_at = time.time()
+        self.refreshes += 1
+        if old is not None:
+            old.close()   # freed once the last reader on it reconnects
+
+    def _run(self, source):
+        # data_version changes when another connection commits, so idle databases aren't re-copied
+        version = source.execute('PRAGMA data_version').fetchone()[0]
+        while True:
+            time.sleep(DB_SNAPSHOT_INTERVAL)
+            try:
+                current = source.execute('PRAGMA data_version').fetchone()[0]
+                if current != version:
+                    version = current
+                    self._refresh(source)
+            except sqlite3.Error as e:
+                print(f'[DB] Snapshot refresh failed: {type(e).__name__}: {e}')
+
+
+_snapshot = Snapshot()
+Gauge(
+    'pataki_db_snapshot_age_seconds', 'Seconds since the in-memory read snapshot was copied (snapshot mode)',
+    lambda: {(): time.time() - _snapshot.refreshed_at} if _snapshot.refreshes else {},
+)
+
+
+def release_db(exc=None):
+    """Return the thread's connection to the pool: roll back anything left uncommitted
+    so a failed request can't hold the write lock. Also closes the request's snapshot
+    connection if a refresh has replaced it."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and conn.in_transaction:
+        conn.rollback()
+    if has_app_context():
+        pinned = g.pop('snapshot_db', None)
+        current = getattr(_local, 'snapshot', None)
+        if pinned is not None and (pinned is not current or _local.snapshot_generation != _snapshot.generation):
+            pinned.close()
+            if pinned is current:
+                _local.snapshot = _local.snapshot_generation = None
+
+
+def close_db():
+    for name in ('conn', 'ro', 'snapshot'):
+        conn = getattr(_local, name, None)
+        if conn is not None:
+            conn.close()
+            setattr(_local, name, None)
+    _local.snapshot_generation = None
+
+
+def get_data_version(db, patient_id: int) -> int:
+    row = db.execute('SELECT version FROM patient_versions WHERE patient_id = ?', (patient_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def bump_data_version(db, patient_ids):
+    """Bump versions for writes that skip the triggers (batched sample ingest). Caller commits."""
+    db.executemany(
+        'INSERT INTO patient_versions (patient_id, version) VALUES (?, 1) '
+        'ON CONFLICT (patient_id) DO UPDATE SET version = version + 1',
+        [(pid,) for pid in set(patient_ids)]
+    )
+
+
+def init_db():
+    """Bring the schema up to date and reset per-run state. Call once per deployment start
+    (app.py __main__, gunicorn's master), not per worker or import."""
+    conn = connect()
+    migrations.migrate(conn)
+    # Always reset patient to stable state on startup (demo mode — ensures clean start every run)
+    conn.execute("UPDATE patients SET current_state = 'stable' WHERE id = 1")
+    # Jobs that were queued or running when the previous process exited will never finish
+    conn.execute(
+        "UPDATE insight_jobs SET status = 'failed', error = 'interrupted by restart' "
+        "WHERE status IN ('queued', 'running')"
+    )
     conn.commit()
+    conn.close()
+
 
-    # Skip seeding if already done
+def seed_demo(conn) -> bool:
+    """Insert the demo patient and their history into an empty database (python manage.py seed).
+    Returns False if patients already exist."""
+    c = conn.cursor()
     if c.execute('SELECT COUNT(*) FROM patients').fetchone()[0] > 0:
-        conn.close()
-        return
+        return False
 
     # --- Patient ---
     c.execute(
@@ -237,8 +381,4 @@ def init_db():
     # No pre-seeded AI insights — always generated live by the LLM
 
     conn.commit()
-    conn.close()
-    print('Database initialized and seeded.')
-
-get_db()
-init_db()
\ No newline at end of file
+    return True
@@ -0,0 +1,167 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# Pub/sub for pushing patient state changes to connected dashboards.
+# Each subscriber only holds a small bounded queue; the SSE response generator blocks
+# on it, so under an async worker (gunicorn -k gevent) an idle connection costs a
+# greenlet rather than an OS thread.
+#
+# Events reach this process's subscribers directly and are also appended to the
+# patient_events table; every process with subscribers polls it for events published by
+# the others, so a dashboard sees a sync or ingest handled by any gunicorn worker.
+SUBSCRIBER_QUEUE_SIZE = 32
+KEEPALIVE_SECONDS = 15
+EVENTS_POLL_INTERVAL = float(os.getenv('EVENTS_POLL_INTERVAL', '0.5'))   # 0: this process only
+EVENTS_KEEP_SECONDS = 60   # relayed rows older than this are pruned
+
+
+class Subscription:
+    def __init__(self, hub, patient_ids):
+        self.hub = hub
+        self.patient_ids = frozenset(patient_ids)
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.dropped = 0
+
+    def push(self, event: dict):
+        # A slow client loses its oldest events rather than blocking the publisher
+        while True:
+            try:
+                self.queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: float = KEEPALIVE_SECONDS):
+        """Next event, or None if nothing arrived within timeout."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class EventHub:
+    def __init__(self, poll_interval: float = EVENTS_POLL_INTERVAL):
+        self._lock = threading.Lock()
+        self._subscribers = {}   # patient_id -> set of Subscription
+        self.poll_interval = poll_interval
+        self._poller = None
+        self.published = 0
+        self.delivered = 0
+        self.relayed = 0         # events from other processes delivered here
+
+    def subscribe(self, patient_ids) -> Subscription:
+        sub = Subscription(self, patient_ids)
+        with self._lock:
+            for pid in sub.patient_ids:
+                self._subscribers.setdefault(pid, set()).add(sub)
+            if self.poll_interval > 0 and (self._poller is None or not self._poller.is_alive()):
+                self._poller = threading.Thread(target=self._poll, name='events-relay', daemon=True)
+                self._poller.start()
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            for pid in sub.patient_ids:
+                subs = self._subscribers.get(pid)
+                if subs:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._subscribers[pid]
+
+    def publish(self, patient_id: int, event_type: str, **data) -> int:
+        """Fan an event out to every subscriber of the patient, here and (through patient_events)
+        in other processes. Call it after the change has committed. Returns this process's
+        deliveries."""
+        event = {'type': event_type, 'patient_id': patient_id, 'ts': int(time.time()), **data}
+        with self._lock:
+            self.published += 1
+        if self.poll_interval > 0:
+            self._relay(event)
+        return self._deliver(event)
+
+    def _deliver(self, event: dict) -> int:
+        with self._lock:
+            subs = list(self._subscribers.get(event['patient_id'], ()))
+            self.delivered += len(subs)
+        for sub in subs:
+            sub.push(event)
+        return len(subs)
+
+    def _relay(self, event: dict):
+        from database import writer
+        now = time.time()
+        try:
+            with writer as db:
+                db.execute(
+                    'INSERT INTO patient_events (origin, patient_id, body, created_at) VALUES (?, ?, ?, ?)',
+                    (os.getpid(), event['patient_id'], json.dumps(event, separators=(',', ':')), now)
+                )
+                if self.published % 100 == 1:
+                    db.execute('DELETE FROM patient_events WHERE created_at < ?', (now - EVENTS_KEEP_SECONDS,))
+        except sqlite3.Error as e:
+            print(f'[Events] Relay to other processes failed: {type(e).__name__}: {e}')
+
+    def _poll(self):
+        """Deliver events other processes appended to patient_events. Cheap while idle:
+        PRAGMA data_version only changes when another connection commits."""
+        from database import connect_ro
+        db = connect_ro()
+        last_id = db.execute('SELECT COALESCE(MAX(id), 0) FROM patient_events').fetchone()[0]
+        version = None
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                current = db.execute('PRAGMA data_version').fetchone()[0]
+                if current == version:
+                    continue
+                version = current
+                rows = db.execute('SELECT id, origin, body FROM patient_events WHERE id > ? ORDER BY id',
+                                  (last_id,)).fetchall()
+            except sqlite3.Error as e:
+                print(f'[Events] Poll failed: {type(e).__name__}: {e}')
+                continue
+            pid = os.getpid()
+            for event_id, origin, body in rows:
+                last_id = event_id
+                if origin != pid:
+                    self._deliver(json.loads(body))
+                    with self._lock:
+                        self.relayed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'subscriptions': len({s for subs in self._subscribers.values() for s in subs}),
+                'patients_watched': len(self._subscribers),
+                'published': self.published,
+                'delivered': self.delivered,
+                'relayed': self.relayed,
+            }
+
+
+def sse_stream(sub: Subscription):
+    """Generator of SSE frames for one subscription, with keepalive comments while idle."""
+    try:
+        yield ': connected\n\n'
+        while True:
+            event = sub.get()
+            if event is None:
+                yield ': keepalive\n\n'
+                continue
+            yield f'event: {event["type"]}\ndata: {json.dumps(event, separators=(",", ":"))}\n\n'
+    finally:
+        sub.close()
+
+
+hub = EventHub()
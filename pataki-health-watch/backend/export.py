@@ -0,0 +1,313 @@
+"""Bulk export/import of patient history as chunked, compressed columnar files.
+
+Rows flow through a generator pipeline: a cursor with no row factory is read CHUNK_ROWS tuples
+at a time, each chunk is transposed into columns and encoded, and the encoded bytes are yielded
+straight to the HTTP response or file. Memory stays at one chunk regardless of table size.
+
+Formats:
+  arrow     Arrow IPC stream, zstd-compressed record batches     (needs pyarrow)
+  parquet   Parquet, one zstd row group per chunk                 (needs pyarrow)
+  csv       gzip-compressed CSV with a header row; empty field = NULL (always available)
+
+Imports append rows under new ids. With replace, each patient's existing rows in the table are
+deleted the first time the file mentions that patient, so re-importing an export is idempotent.
+Each chunk is committed separately so an import never holds the write lock for long.
+
+Usage (from pataki-health-watch/backend/):
+    python export.py export health_metrics -o health_metrics.csv.gz
+    python export.py export ai_insights -o insights.arrow --patient 7
+    python export.py import health_metrics health_metrics.csv.gz --replace
+    python export.py bench --rows 1000000
+"""
+import argparse
+import csv
+import gzip
+import io
+import os
+import time
+import zlib
+from database import bump_data_version
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:   # optional; CSV works without it
+    pa = pq = None
+
+TABLES = ('health_metrics', 'vitals', 'trend_scores', 'ai_insights')
+FORMATS = ('arrow', 'parquet', 'csv')
+CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', '50000'))
+
+MIMETYPES = {
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+    'csv': 'application/gzip',
+}
+EXTENSIONS = {'arrow': '.arrow', 'parquet': '.parquet', 'csv': '.csv.gz'}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def check_format(table: str, fmt: str):
+    if table not in TABLES:
+        raise ExportError(f'unknown table {table!r}; choose from {", ".join(TABLES)}')
+    if fmt not in FORMATS:
+        raise ExportError(f'unknown format {fmt!r}; choose from {", ".join(FORMATS)}')
+    if fmt != 'csv' and pa is None:
+        raise ExportError(f'{fmt} needs pyarrow (pip install pyarrow); use format=csv')
+
+
+def format_for_path(path: str) -> str:
+    for fmt, ext in EXTENSIONS.items():
+        if path.endswith(ext):
+            return fmt
+    return 'csv'
+
+
+def columns(db, table: str) -> list:
+    """(name, declared type) for each column, in table order."""
+    return [(r[1], r[2].upper()) for r in db.execute(f'PRAGMA table_info({table})')]
+
+
+def read_chunks(db, table: str, patient_id: int = None, chunk_rows: int = CHUNK_ROWS):
+    """Yield lists of plain row tuples, in id order."""
+    cur = db.cursor()
+    cur.row_factory = None
+    names = ', '.join(name for name, _ in columns(db, table))
+    if patient_id is None:
+        cur.execute(f'SELECT {names} FROM {table} ORDER BY id')
+    else:
+        cur.execute(f'SELECT {names} FROM {table} WHERE patient_id = ? ORDER BY id', (patient_id,))
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows:
+            return
+        yield rows
+
+
+def _arrow_schema(cols):
+    def arrow_type(decl):
+        if 'INT' in decl:
+            return pa.int64()
+        if decl in ('REAL', 'FLOAT', 'DOUBLE'):
+            return pa.float64()
+        return pa.string()
+    return pa.schema([(name, arrow_type(decl)) for name, decl in cols])
+
+
+def _batch(schema, rows):
+    return pa.RecordBatch.from_arrays(
+        [pa.array(col, type=field.type) for col, field in zip(zip(*rows), schema)], schema=schema)
+
+
+def encode_csv(cols, chunks):
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31)   # wbits=31: gzip container
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(name for name, _ in cols)
+    for rows in chunks:
+        writer.writerows(rows)
+        out = gz.compress(buf.getvalue().encode('utf-8'))
+        buf.seek(0)
+        buf.truncate()
+        if out:
+            yield out
+    yield gz.compress(buf.getvalue().encode('utf-8')) + gz.flush()
+
+
+def _drain(buf: io.BytesIO) -> bytes:
+    out = buf.getvalue()
+    buf.seek(0)
+    buf.truncate()
+    return out
+
+
+def encode_arrow(cols, chunks):
+    schema = _arrow_schema(cols)
+    buf = io.BytesIO()
+    writer = pa.ipc.new_stream(pa.PythonFile(buf, mode='w'), schema,
+                               options=pa.ipc.IpcWriteOptions(compression='zstd'))
+    for rows in chunks:
+        writer.write_batch(_batch(schema, rows))
+        yield _drain(buf)
+    writer.close()
+    yield _drain(buf)
+
+
+def encode_parquet(cols, chunks):
+    schema = _arrow_schema(cols)
+    buf = io.BytesIO()
+    writer = pq.ParquetWriter(pa.PythonFile(buf, mode='w'), schema, compression='zstd')
+    for rows in chunks:
+        writer.write_table(pa.Table.from_batches([_batch(schema, rows)]))   # one row group per chunk
+        yield _drain(buf)
+    writer.close()
+    yield _drain(buf)
+
+
+ENCODERS = {'arrow': encode_arrow, 'parquet': encode_parquet, 'csv': encode_csv}
+
+
+def export_stream(db, table: str, fmt: str = 'csv', patient_id: int = None):
+    """Generator of encoded bytes for the whole table (or one patient's rows)."""
+    check_format(table, fmt)
+    return ENCODERS[fmt](columns(db, table), read_chunks(db, table, patient_id))
+
+
+def decode_csv(f, chunk_rows: int = CHUNK_ROWS):
+    """Yield (column names, rows) chunks from a gzip CSV file object."""
+    reader = csv.reader(io.TextIOWrapper(gzip.GzipFile(fileobj=f), encoding='utf-8', newline=''))
+    names = next(reader, None)
+    if names is None:
+        return
+    rows = []
+    for record in reader:
+        rows.append([v if v != '' else None for v in record])
+        if len(rows) >= chunk_rows:
+            yield names, rows
+            rows = []
+    if rows:
+        yield names, rows
+
+
+def _decode_batches(batches):
+    for batch in batches:
+        yield batch.schema.names, list(zip(*(col.to_pylist() for col in batch.columns)))
+
+
+def decode_arrow(f, chunk_rows: int = CHUNK_ROWS):
+    return _decode_batches(pa.ipc.open_stream(f))
+
+
+def decode_parquet(f, chunk_rows: int = CHUNK_ROWS):
+    # Parquet keeps its metadata in the footer, so the source has to be seekable
+    if not f.seekable():
+        import tempfile
+        tmp = tempfile.TemporaryFile()
+        while block := f.read(1 << 20):
+            tmp.write(block)
+        tmp.seek(0)
+        f = tmp
+    return _decode_batches(pq.ParquetFile(f).iter_batches(batch_size=chunk_rows))
+
+
+DECODERS = {'arrow': decode_arrow, 'parquet': decode_parquet, 'csv': decode_csv}
+
+
+def import_stream(target, table: str, f, fmt: str = 'csv', replace: bool = False) -> dict:
+    """Insert rows from an exported file object. The id column is dropped (rows get new ids);
+    other columns are matched by name. `target` is a connection or database.writer; each chunk
+    runs in one `with target as db:` transaction. Returns counts."""
+    check_format(table, fmt)
+    with target as db:
+        known = {name for name, _ in columns(db, table)} - {'id'}
+    seen = set()
+    inserted = deleted = 0
+    for names, rows in DECODERS[fmt](f):
+        keep = [i for i, name in enumerate(names) if name in known]
+        if not keep:
+            raise ExportError(f'no columns of {table} in the file (got {", ".join(names)})')
+        sql = (f'INSERT INTO {table} ({", ".join(names[i] for i in keep)}) '
+               f'VALUES ({", ".join("?" * len(keep))})')
+        values = [tuple(row[i] for i in keep) for row in rows] if len(keep) < len(names) else rows
+        with target as db:
+            if 'patient_id' in names:
+                p = names.index('patient_id')
+                patient_ids = {row[p] for row in rows}
+                if replace:
+                    for pid in patient_ids - seen:
+                        deleted += db.execute(f'DELETE FROM {table} WHERE patient_id = ?', (pid,)).rowcount
+                    seen |= patient_ids
+                bump_data_version(db, patient_ids)
+            db.executemany(sql, values)
+        inserted += len(rows)
+    return {'table': table, 'inserted': inserted, 'replaced': deleted}
+
+
+def _bench(n_rows: int, fmt: str):
+    """Export/import n_rows synthetic health_metrics rows through a scratch database."""
+    import resource
+    import shutil
+    import sqlite3
+    import tempfile
+    import migrations
+
+    tmp = tempfile.mkdtemp(prefix='pataki-export-')
+    db = sqlite3.connect(os.path.join(tmp, 'src.db'))
+    migrations.migrate(db)
+    with db:
+        db.executemany(
+            'INSERT INTO health_metrics (patient_id, period_type, label, hr, resting_hr, bp_sys, bp_dia, '
+            'steps, sleep, activity_min) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            ((i // 7 + 1, 'week', 'Mon', 60 + i % 30, 55 + i % 10, 110 + i % 20, 70 + i % 15,
+              3000 + i % 4000, 6 + (i % 30) / 10, i % 60) for i in range(n_rows))
+        )
+    path = os.path.join(tmp, 'health_metrics' + EXTENSIONS[fmt])
+    t0 = time.perf_counter()
+    with open(path, 'wb') as f:
+        for block in export_stream(db, 'health_metrics', fmt):
+            f.write(block)
+    export_s = time.perf_counter() - t0
+
+    dst = sqlite3.connect(os.path.join(tmp, 'dst.db'))
+    migrations.migrate(dst)
+    t0 = time.perf_counter()
+    with open(path, 'rb') as f:
+        result = import_stream(dst, 'health_metrics', f, fmt)
+    import_s = time.perf_counter() - t0
+    size = os.path.getsize(path)
+    print(f'{fmt}: exported {n_rows:,} rows in {export_s:.2f}s ({n_rows / export_s:,.0f} rows/s), '
+          f'{size / 1e6:.1f}MB ({size / n_rows:.1f} bytes/row)')
+    print(f'{fmt}: imported {result["inserted"]:,} rows in {import_s:.2f}s ({n_rows / import_s:,.0f} rows/s)')
+    print(f'peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f}MB')
+    db.close()
+    dst.close()
+    shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    exp = sub.add_parser('export', help='write a table to a file')
+    exp.add_argument('table', choices=TABLES)
+    exp.add_argument('-o', '--output', required=True, help='.arrow, .parquet or .csv.gz')
+    exp.add_argument('--patient', type=int, help='only this patient')
+    imp = sub.add_parser('import', help='load a file written by export')
+    imp.add_argument('table', choices=TABLES)
+    imp.add_argument('input')
+    imp.add_argument('--replace', action='store_true', help="replace each imported patient's existing rows")
+    bench = sub.add_parser('bench', help='round-trip synthetic rows through a scratch database')
+    bench.add_argument('--rows', type=int, default=1_000_000)
+    bench.add_argument('--format', choices=FORMATS, default='csv')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'bench':
+            check_format('health_metrics', args.format)
+            _bench(args.rows, args.format)
+            return
+        import migrations
+        from database import connect
+        db = connect()
+        migrations.migrate(db)
+        t0 = time.perf_counter()
+        if args.command == 'export':
+            with open(args.output, 'wb') as f:
+                for block in export_stream(db, args.table, format_for_path(args.output), args.patient):
+                    f.write(block)
+            print(f'Wrote {args.output} ({os.path.getsize(args.output):,} bytes) in {time.perf_counter() - t0:.1f}s')
+        else:
+            with open(args.input, 'rb') as f:
+                result = import_stream(db, args.table, f, format_for_path(args.input), args.replace)
+            print(f'Imported {result["inserted"]:,} rows into {args.table} '
+                  f'(replaced {result["replaced"]:,}) in {time.perf_counter() - t0:.1f}s')
+        db.close()
+    except ExportError as e:
+        raise SystemExit(str(e))
+
+
+if __name__ == '__main__':
+    main()
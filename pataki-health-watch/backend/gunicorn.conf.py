@@ -0,0 +1,51 @@
+import os
+import signal
+import subprocess
+import sys
+
+# Dashboards keep an idle /api/events connection open. gevent workers park each one on a
+# greenlet, so a worker can hold thousands of them instead of one OS thread per connection.
+#
+# One worker per core by default, so read-only requests use every core. State shared across
+# workers lives in the database: events published in one worker reach dashboards connected to
+# another through the patient_events relay (events.py), the anomaly detector reloads its state
+# inside each write transaction, and ETags come from patient_versions. Each worker has its own
+# `writer`; between workers, SQLite's write lock and busy_timeout do the queueing.
+#
+# Under gevent, sqlite calls don't yield: a query blocks every greenlet in the worker until it
+# returns, which is another reason to run a worker per core. Request queries are short indexed
+# lookups; bulk export/import and the snapshot copy (DB_READ_MODE=snapshot) stall the worker
+# for their duration, so run large ones with `python export.py` instead. database.py keeps its pooled connections per OS thread, not per
+# greenlet, so they're reused across requests rather than opened per request.
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', str(os.cpu_count() or 1)))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '5000'))
+timeout = 60
+
+
+# Retention never runs inside a worker: its deletes, compaction and VACUUM would block every
+# request and SSE stream in it. Run `python scheduler.py run` (which has a retention job), or
+# set GUNICORN_RETENTION=1 to have the master start `python retention.py --loop` beside it.
+GUNICORN_RETENTION = os.getenv('GUNICORN_RETENTION', '0') == '1'
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def on_starting(server):
+    # Migrate once before any worker forks, in a child process: the master must not import
+    # the app's modules, or workers would inherit them created before gevent patched threading
+    subprocess.run([sys.executable, '-c', 'import database; database.init_db()'], cwd=BACKEND_DIR, check=True)
+    if GUNICORN_RETENTION:
+        server.retention_process = subprocess.Popen([sys.executable, 'retention.py', '--loop'], cwd=BACKEND_DIR)
+
+
+def on_exit(server):
+    process = getattr(server, 'retention_process', None)
+    if process is not None and process.poll() is None:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
@@ -0,0 +1,209 @@
+import json
+import os
+import struct
+import threading
+import time
+from collections import deque
+import anomaly
+import rollups
+from database import bump_data_version, writer
+from events import hub
+
+# Raw wearable samples are buffered in memory and group-committed by a single writer
+# thread, so one transaction (and one fsync) covers thousands of samples.
+INGEST_BUFFER_MAX = int(os.getenv('INGEST_BUFFER_MAX', '200000'))     # pending samples before backpressure
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '10000'))      # samples per transaction
+INGEST_FLUSH_INTERVAL = float(os.getenv('INGEST_FLUSH_INTERVAL', '0.05'))  # seconds
+
+SAMPLE_FIELDS = ('patient_id', 'ts', 'hr', 'steps', 'sleep_min', 'bp_sys', 'bp_dia')
+# Accepted value ranges, checked before a sample is buffered: a value SQLite can't store (or no
+# device could measure) would otherwise only fail in the background flush, after the 202
+SAMPLE_RANGES = {
+    'patient_id': (1, 2 ** 32 - 1),
+    'hr': (20, 300),            # bpm
+    'steps': (0, 65534),        # per sample
+    'sleep_min': (0, 1440),
+    'bp_sys': (40, 300),        # mmHg
+    'bp_dia': (20, 200),
+}
+INGEST_MAX_FUTURE_SECONDS = int(os.getenv('INGEST_MAX_FUTURE_SECONDS', '3600'))   # device clock skew
+
+# Compact binary layout (little-endian, 18 bytes per sample):
+#   patient_id uint32, ts uint32 (unix seconds), hr, steps, sleep_min, bp_sys, bp_dia uint16
+# 0xFFFF in a uint16 field means "not measured in this sample".
+SAMPLE_STRUCT = struct.Struct('<IIHHHHH')
+MISSING_U16 = 0xFFFF
+
+INSERT_SAMPLE_SQL = (
+    'INSERT INTO raw_samples (patient_id, ts, hr, steps, sleep_min, bp_sys, bp_dia) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?)'
+)
+
+
+class IngestBufferFull(Exception):
+    pass
+
+
+def parse_json_lines(body: bytes) -> list:
+    """Parse newline-delimited JSON samples (a single JSON array is accepted too)."""
+    text = body.decode('utf-8').strip()
+    if not text:
+        return []
+    items = json.loads(text) if text.startswith('[') else [json.loads(line) for line in text.splitlines() if line.strip()]
+    rows = []
+    for n, item in enumerate(items, 1):
+        if not isinstance(item, dict) or item.get('patient_id') is None or item.get('ts') is None:
+            raise ValueError(f'sample {n}: each sample needs patient_id and ts')
+        try:
+            row = tuple(None if item.get(f) is None else int(item[f]) for f in SAMPLE_FIELDS)
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(f'sample {n}: {", ".join(SAMPLE_FIELDS)} must be integers') from None
+        rows.append(row)
+    return check_ranges(rows)
+
+
+def parse_binary(body: bytes) -> list:
+    if len(body) % SAMPLE_STRUCT.size:
+        raise ValueError(f'binary payload must be a multiple of {SAMPLE_STRUCT.size} bytes')
+    return check_ranges([
+        (pid, ts) + tuple(None if v == MISSING_U16 else v for v in values)
+        for pid, ts, *values in SAMPLE_STRUCT.iter_unpack(body)
+    ])
+
+
+def check_ranges(rows: list) -> list:
+    """Raise ValueError naming the first sample (1-based) with a value outside SAMPLE_RANGES
+    or a timestamp that isn't positive or lies more than INGEST_MAX_FUTURE_SECONDS ahead."""
+    latest = int(time.time()) + INGEST_MAX_FUTURE_SECONDS
+    for n, row in enumerate(rows, 1):
+        if not 0 < row[1] <= latest:
+            raise ValueError(f'sample {n}: ts {row[1]} must be positive unix seconds, '
+                             f'at most {INGEST_MAX_FUTURE_SECONDS}s in the future')
+        for field, value in zip(SAMPLE_FIELDS, row):
+            bounds = SAMPLE_RANGES.get(field)
+            if bounds and value is not None and not bounds[0] <= value <= bounds[1]:
+                raise ValueError(f'sample {n}: {field} {value} outside {bounds[0]}-{bounds[1]}')
+    return rows
+
+
+def pack_binary(rows) -> bytes:
+    """Inverse of parse_binary — used by clients and the ingest benchmark."""
+    return b''.join(
+        SAMPLE_STRUCT.pack(pid, ts, *(MISSING_U16 if v is None else v for v in values))
+        for pid, ts, *values in rows
+    )
+
+
+class IngestBuffer:
+    """Bounded in-memory buffer drained by one writer thread with batched executemany.
+    Requests are kept as separate chunks: if a group commit fails, each chunk is retried in
+    its own transaction so one bad request can't drop other clients' samples."""
+
+    def __init__(self, max_pending=INGEST_BUFFER_MAX, batch_size=INGEST_BATCH_SIZE,
+                 flush_interval=INGEST_FLUSH_INTERVAL):
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = deque()   # one list of rows per request (split at batch_size)
+        self._pending_rows = 0
+        self._cond = threading.Condition()
+        self._enqueued = 0
+        self._written = 0
+        self._failed = 0
+        self._batches = 0
+        self._thread = None
+
+    def _ensure_writer(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+            self._thread.start()
+
+    def add(self, rows: list, timeout: float = 1.0) -> int:
+        """Queue samples for writing. Blocks up to `timeout` while the buffer is full."""
+        if len(rows) > self.max_pending:
+            raise IngestBufferFull(f'batch of {len(rows)} exceeds buffer size {self.max_pending}')
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._ensure_writer()
+            while self._pending_rows + len(rows) > self.max_pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    raise IngestBufferFull('ingest buffer is full, retry later')
+            for i in range(0, len(rows), self.batch_size):
+                self._pending.append(rows[i:i + self.batch_size])
+            self._pending_rows += len(rows)
+            self._enqueued += len(rows)
+            if self._pending_rows >= self.batch_size:
+                self._cond.notify_all()
+            return self._enqueued
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Wait until everything queued so far has been committed."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            target = self._enqueued
+            self._cond.notify_all()
+            while self._written < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'pending': self._pending_rows,
+                'enqueued': self._enqueued,
+                'written': self._written,
+                'failed': self._failed,
+                'batches': self._batches,
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._pending_rows < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                if not self._pending:
+                    continue
+                chunks = [self._pending.popleft()]
+                size = len(chunks[0])
+                while self._pending and size + len(self._pending[0]) <= self.batch_size:
+                    chunks.append(self._pending.popleft())
+                    size += len(chunks[-1])
+                self._pending_rows -= size
+            failed = 0
+            try:
+                self._write([row for chunk in chunks for row in chunk])
+            except Exception as e:
+                if len(chunks) == 1:
+                    print(f'[Ingest] Failed to write {size} samples: {type(e).__name__}: {e}')
+                    failed = size
+                else:
+                    # Find the bad request(s) and keep everyone else's samples
+                    for chunk in chunks:
+                        try:
+                            self._write(chunk)
+                        except Exception as e:
+                            print(f'[Ingest] Failed to write {len(chunk)} samples: {type(e).__name__}: {e}')
+                            failed += len(chunk)
+            with self._cond:
+                # Failed samples are counted as written too so flush() never hangs on them
+                self._written += size
+                self._failed += failed
+                self._batches += 1
+                self._cond.notify_all()
+
+    def _write(self, batch: list):
+        with writer as db:
+            db.executemany(INSERT_SAMPLE_SQL, batch)
+            rollups.apply_samples(db, batch)
+            transitions = anomaly.detector.observe(db, batch)
+            bump_data_version(db, (row[0] for row in batch))
+        for patient_id, state, score in transitions:
+            hub.publish(patient_id, 'risk_alert' if state == 'risk' else 'state_change',
+                        state=state, stability_score=score, source='detector')
+
+
+ingest_buffer = IngestBuffer()
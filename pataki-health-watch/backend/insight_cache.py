@@ -0,0 +1,105 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from database import get_read_db, writer
+
+# Insights depend only on the rendered prompt (bucketed descriptors + name + age),
+# so identical prompts can reuse the stored LLM response.
+INSIGHT_CACHE_TTL = int(os.getenv('INSIGHT_CACHE_TTL', str(24 * 60 * 60)))   # seconds
+INSIGHT_CACHE_MAX_ROWS = int(os.getenv('INSIGHT_CACHE_MAX_ROWS', '10000'))
+INSIGHT_CACHE_LRU_SIZE = int(os.getenv('INSIGHT_CACHE_LRU_SIZE', '512'))
+
+_lru = OrderedDict()   # prompt_hash -> (insight_text, created_at)
+_touched = {}          # prompt_hash -> last hit time, written to last_used by the next put()
+_lock = threading.Lock()
+_stats = {'hits': 0, 'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+
+def _remember(key: str, text: str, created_at: float):
+    with _lock:
+        _lru[key] = (text, created_at)
+        _lru.move_to_end(key)
+        while len(_lru) > INSIGHT_CACHE_LRU_SIZE:
+            _lru.popitem(last=False)
+
+
+def get(prompt: str):
+    """Return the cached insight for this prompt, or None on a miss/expired entry."""
+    key = prompt_key(prompt)
+    now = time.time()
+
+    with _lock:
+        entry = _lru.get(key)
+        if entry and now - entry[1] < INSIGHT_CACHE_TTL:
+            _lru.move_to_end(key)
+            _touched[key] = now
+            _stats['hits'] += 1
+            _stats['memory_hits'] += 1
+            return entry[0]
+        if entry:
+            del _lru[key]
+
+    row = get_read_db().execute(
+        'SELECT insight_text, created_at FROM insight_cache WHERE prompt_hash = ?', (key,)
+    ).fetchone()
+    # Lookups never write: hits are batched into last_used by put(), expired rows are replaced
+    # or evicted there too
+    if row and now - row['created_at'] < INSIGHT_CACHE_TTL:
+        _remember(key, row['insight_text'], row['created_at'])
+        with _lock:
+            _touched[key] = now
+            _stats['hits'] += 1
+            _stats['db_hits'] += 1
+        return row['insight_text']
+
+    with _lock:
+        _stats['misses'] += 1
+    return None
+
+
+def put(prompt: str, insight_text: str):
+    """Store a successful LLM response, record the hits since the last put, and evict expired
+    rows and the least recently used rows past the size cap."""
+    key = prompt_key(prompt)
+    now = time.time()
+    with _lock:
+        touched = list(_touched.items())
+        _touched.clear()
+    with writer as db:
+        db.executemany(
+            'UPDATE insight_cache SET last_used = ? WHERE prompt_hash = ? AND last_used < ?',
+            [(t, k, t) for k, t in touched]
+        )
+        evicted = db.execute('DELETE FROM insight_cache WHERE created_at < ?', (now - INSIGHT_CACHE_TTL,)).rowcount
+        db.execute(
+            'INSERT OR REPLACE INTO insight_cache (prompt_hash, insight_text, created_at, last_used) '
+            'VALUES (?, ?, ?, ?)',
+            (key, insight_text, now, now)
+        )
+        evicted += db.execute(
+            'DELETE FROM insight_cache WHERE prompt_hash IN ('
+            '  SELECT prompt_hash FROM insight_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?'
+            ')',
+            (INSIGHT_CACHE_MAX_ROWS,)
+        ).rowcount
+    _remember(key, insight_text, now)
+    if evicted:
+        with _lock:
+            _stats['evictions'] += evicted
+
+
+def stats() -> dict:
+    with _lock:
+        result = dict(_stats)
+        result['memory_entries'] = len(_lru)
+    lookups = result['hits'] + result['misses']
+    result['hit_rate'] = round(result['hits'] / lookups, 3) if lookups else 0.0
+    result['ttl_seconds'] = INSIGHT_CACHE_TTL
+    result['max_rows'] = INSIGHT_CACHE_MAX_ROWS
+    return result
@@ -0,0 +1,86 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from database import writer
+
+INSIGHT_WORKERS = int(os.getenv('INSIGHT_WORKERS', '4'))
+
+_executor = ThreadPoolExecutor(max_workers=INSIGHT_WORKERS, thread_name_prefix='insight')
+
+
+def _now() -> str:
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def get_cached_insight(db, patient_id: int, state: str):
+    """Return the most recent stored insight for this patient/state, or None."""
+    row = db.execute(
+        'SELECT insight_text FROM ai_insights WHERE patient_id = ? AND state = ? '
+        'ORDER BY created_at DESC, id DESC LIMIT 1',
+        (patient_id, state)
+    ).fetchone()
+    return row['insight_text'] if row else None
+
+
+def submit_insight_job(generate, patient: dict, vitals: dict, state: str, fallback=None) -> int:
+    """Queue insight generation on the worker pool and return the job id.
+
+    If a job for the same patient/state is still queued or running, its id is
+    returned instead of starting a second LLM call. If `generate` raises and a
+    `fallback(patient, vitals)` is given, the job finishes with the fallback text
+    but nothing is written to ai_insights."""
+    # Check and insert under the writer so two requests can't both queue a job
+    with writer as db:
+        existing = db.execute(
+            "SELECT id FROM insight_jobs WHERE patient_id = ? AND state = ? AND status IN ('queued', 'running') "
+            'ORDER BY id DESC LIMIT 1',
+            (patient['id'], state)
+        ).fetchone()
+        if existing:
+            return existing['id']
+        job_id = db.execute(
+            "INSERT INTO insight_jobs (patient_id, state, status, created_at) VALUES (?, ?, 'queued', ?)",
+            (patient['id'], state, _now())
+        ).lastrowid
+    _executor.submit(_run_job, job_id, generate, patient, vitals, state, fallback)
+    return job_id
+
+
+def _run_job(job_id: int, generate, patient: dict, vitals: dict, state: str, fallback=None):
+    # The writer is only held around each update, never across the LLM call
+    try:
+        with writer as db:
+            db.execute("UPDATE insight_jobs SET status = 'running' WHERE id = ?", (job_id,))
+        try:
+            insight = generate(patient, vitals)
+        except Exception as e:
+            if fallback is None:
+                raise
+            with writer as db:
+                db.execute(
+                    "UPDATE insight_jobs SET status = 'done', insight_text = ?, error = ?, finished_at = ? "
+                    'WHERE id = ?',
+                    (fallback(patient, vitals), f'degraded: {type(e).__name__}: {e}', _now(), job_id)
+                )
+            return
+        with writer as db:
+            db.execute(
+                'INSERT INTO ai_insights (patient_id, insight_text, state, created_at) VALUES (?, ?, ?, ?)',
+                (patient['id'], insight, state, _now())
+            )
+            db.execute(
+                "UPDATE insight_jobs SET status = 'done', insight_text = ?, finished_at = ? WHERE id = ?",
+                (insight, _now(), job_id)
+            )
+    except Exception as e:
+        print(f'[AI] Insight job {job_id} failed: {type(e).__name__}: {e}')
+        with writer as db:
+            db.execute(
+                "UPDATE insight_jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                (f'{type(e).__name__}: {e}', _now(), job_id)
+            )
+
+
+def get_job(db, job_id: int):
+    row = db.execute('SELECT * FROM insight_jobs WHERE id = ?', (job_id,)).fetchone()
+    return dict(row) if row else None
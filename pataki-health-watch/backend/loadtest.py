@@ -0,0 +1,167 @@
+"""Load test for the Flask API against a temporary database and a mock Hugging Face router.
+
+Serves app.py on a local threaded HTTP server (real sockets, so concurrency is real), points
+HF_URL at mock_hf.py, seeds the demo patient plus --patients synthetic ones, then drives each
+route with --concurrency workers and prints throughput and p50/p95/p99 per route as JSON.
+Patient ids and mock errors come from seeded RNGs, so runs with the same flags are comparable.
+
+Usage (from pataki-health-watch/backend/):
+    python loadtest.py --requests 500 --concurrency 8 --out baseline.json
+    python loadtest.py --mock-latency 0.2 --mock-error-rate 0.1 --compare baseline.json
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+ROUTES = [
+    ('GET', '/api/patients/{id}/vitals'),
+    ('POST', '/api/patients/{id}/sync'),
+    ('GET', '/api/patients/{id}/health-data?period=week'),
+    ('GET', '/api/patients/{id}/health-summary?period=month'),
+    ('GET', '/api/patients/{id}/stats'),
+    ('GET', '/api/patients/{id}/trend'),
+    ('GET', '/api/patients/{id}/dashboard'),
+    ('GET', '/api/patients/{id}/data-view?period=week'),
+]
+
+
+def _percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def start_app_server(app):
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)   # no per-request access log
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='loadtest-app', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def drive_route(base_url: str, method: str, template: str, n_requests: int, concurrency: int,
+                first_id: int, last_id: int, seed_value: int) -> dict:
+    rng = random.Random(f'{seed_value}:{method} {template}')
+    urls = [base_url + template.format(id=rng.randint(first_id, last_id)) for _ in range(n_requests)]
+    session = requests.Session()
+    session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=concurrency))
+
+    def one(url):
+        t0 = time.perf_counter()
+        try:
+            status = session.request(method, url, timeout=30).status_code
+        except requests.RequestException as e:
+            status = type(e).__name__
+        return (time.perf_counter() - t0) * 1000, status
+
+    for url in urls[:min(10, len(urls))]:   # warm caches and pooled connections
+        one(url)
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, urls))
+    elapsed = time.perf_counter() - t0
+
+    latencies = sorted(ms for ms, _ in results)
+    statuses = {}
+    for _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': n_requests,
+        'errors': sum(n for status, n in statuses.items() if not status.startswith('2')),
+        'status_counts': statuses,
+        'throughput_rps': round(n_requests / elapsed, 1),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'p50_ms': round(_percentile(latencies, 50), 3),
+        'p95_ms': round(_percentile(latencies, 95), 3),
+        'p99_ms': round(_percentile(latencies, 99), 3),
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list:
+    """Routes whose p95 or throughput regressed by more than `threshold` (fraction)."""
+    regressions = []
+    for route, now in report['routes'].items():
+        before = baseline.get('routes', {}).get(route)
+        if not before:
+            continue
+        if now['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append(f'{route}: p95 {before["p95_ms"]}ms -> {now["p95_ms"]}ms')
+        if now['throughput_rps'] < before['throughput_rps'] * (1 - threshold):
+            regressions.append(f'{route}: throughput {before["throughput_rps"]} -> {now["throughput_rps"]} rps')
+    return regressions
+
+
+def run(args) -> dict:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from mock_hf import start_mock_server
+    mock, mock_url = start_mock_server(latency=args.mock_latency, error_rate=args.mock_error_rate,
+                                       seed=args.seed)
+    db_path = os.path.join(tempfile.mkdtemp(prefix='pataki-load-'), 'pataki.db')
+    os.environ['PATAKI_DB_PATH'] = db_path
+    os.environ['HF_URL'] = mock_url
+    os.environ.setdefault('HF_API_KEY', 'loadtest')
+
+    import app as app_module
+    from database import connect, init_db, seed_demo
+    from seed_patients import seed
+    init_db()
+    db = connect()
+    seed_demo(db)
+    seed(db, args.patients, seed_value=args.seed)
+    first_id, last_id = db.execute('SELECT MIN(id), MAX(id) FROM patients').fetchone()
+    db.close()
+
+    server, base_url = start_app_server(app_module.app)
+    report = {
+        'config': {k: v for k, v in vars(args).items() if k not in ('out', 'compare')},
+        'routes': {},
+    }
+    for method, template in ROUTES:
+        report['routes'][f'{method} {template}'] = drive_route(
+            base_url, method, template, args.requests, args.concurrency, first_id, last_id, args.seed)
+    report['mock_llm_requests'] = mock.request_count
+    server.shutdown()
+    mock.shutdown()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', type=int, default=200, help='synthetic patients besides the demo one')
+    parser.add_argument('--requests', type=int, default=500, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--mock-latency', type=float, default=0.05, help='seconds per mock LLM call')
+    parser.add_argument('--mock-error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', help='write the JSON report here as well as to stdout')
+    parser.add_argument('--compare', metavar='BASELINE', help='fail if p95/throughput regressed vs this report')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed regression fraction for --compare')
+    args = parser.parse_args()
+
+    # The app logs with print(); keep stdout for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(args)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output + '\n')
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}', file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
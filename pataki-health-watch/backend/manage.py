@@ -0,0 +1,122 @@
+"""Database management commands.
+
+Usage (from pataki-health-watch/backend/):
+    python manage.py migrate                    # apply pending schema migrations
+    python manage.py version                    # show applied migrations
+    python manage.py seed                       # demo patient into an empty database
+    python manage.py seed --synthetic 10000     # plus N synthetic patients
+    python manage.py bench-startup --runs 10    # worker boot time (import app) in ms
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BOOT_SNIPPET = (
+    'import time; t0 = time.perf_counter(); import app; '
+    'print((time.perf_counter() - t0) * 1000)'
+)
+
+
+def cmd_migrate(args):
+    import migrations
+    from database import connect
+    conn = connect()
+    applied = migrations.migrate(conn)
+    print(f'Schema at version {migrations.current_version(conn)}'
+          + (f' (applied {", ".join(map(str, applied))})' if applied else ' (up to date)'))
+    conn.close()
+
+
+def cmd_version(args):
+    import migrations
+    from database import connect
+    conn = connect()
+    current = migrations.current_version(conn)
+    print(f'Schema version {current} of {migrations.LATEST_VERSION}')
+    if current:
+        for version, description, applied_at in conn.execute(
+            'SELECT version, description, applied_at FROM schema_version ORDER BY version'
+        ):
+            print(f'  {version:>3}  {time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(applied_at))}  {description}')
+    conn.close()
+
+
+def cmd_seed(args):
+    import migrations
+    from database import connect, seed_demo
+    conn = connect()
+    migrations.migrate(conn)
+    print('Seeded demo patient.' if seed_demo(conn) else 'Patients already exist; demo seed skipped.')
+    if args.synthetic:
+        from seed_patients import seed
+        t0 = time.perf_counter()
+        first_id, last_id = seed(conn, args.synthetic)
+        print(f'Seeded synthetic patients {first_id}-{last_id} in {time.perf_counter() - t0:.1f}s')
+    conn.close()
+
+
+def _boot_ms(env) -> float:
+    out = subprocess.run([sys.executable, '-c', BOOT_SNIPPET], env=env, cwd=os.path.dirname(__file__) or '.',
+                         capture_output=True, text=True, check=True).stdout
+    return float(out.strip().splitlines()[-1])
+
+
+def cmd_bench_startup(args):
+    """Time `import app` in fresh interpreters against an already-migrated copy of the database,
+    plus the one-off cost of migrating an empty database and the per-start version check."""
+    import sqlite3
+    import migrations
+    from database import DB_PATH, connect
+
+    tmp = tempfile.mkdtemp(prefix='pataki-boot-')
+    fresh = sqlite3.connect(os.path.join(tmp, 'fresh.db'))
+    t0 = time.perf_counter()
+    migrations.migrate(fresh)
+    fresh_ms = (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        migrations.migrate(fresh)
+    check_us = (time.perf_counter() - t0) * 1000   # ms per 1000 calls == us per call
+    fresh.close()
+
+    db_path = os.path.join(tmp, 'pataki.db')
+    src = connect()
+    src.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    src.close()
+    shutil.copy(DB_PATH, db_path)
+    copy = sqlite3.connect(db_path)
+    migrations.migrate(copy)
+    copy.close()
+
+    env = {**os.environ, 'PATAKI_DB_PATH': db_path}
+    _boot_ms(env)   # warm the OS page cache and .pyc files
+    boots = [_boot_ms(env) for _ in range(args.runs)]
+    print(f'Worker boot (import app), {args.runs} runs: median {statistics.median(boots):.1f}ms, '
+          f'min {min(boots):.1f}ms, max {max(boots):.1f}ms')
+    print(f'Migrating an empty database to v{migrations.LATEST_VERSION}: {fresh_ms:.1f}ms (once per deployment)')
+    print(f'Version check on an up-to-date database: {check_us:.1f}us')
+    shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('migrate', help='apply pending schema migrations').set_defaults(func=cmd_migrate)
+    sub.add_parser('version', help='show the schema version').set_defaults(func=cmd_version)
+    seed = sub.add_parser('seed', help='seed the demo patient into an empty database')
+    seed.add_argument('--synthetic', type=int, default=0, metavar='N', help='also add N synthetic patients')
+    seed.set_defaults(func=cmd_seed)
+    bench = sub.add_parser('bench-startup', help='measure worker boot time')
+    bench.add_argument('--runs', type=int, default=10)
+    bench.set_defaults(func=cmd_bench_startup)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
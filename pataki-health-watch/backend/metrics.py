@@ -0,0 +1,253 @@
+"""In-process metrics exposed at /metrics in the Prometheus text format, plus a sampling profiler.
+
+Kept dependency-free: a handful of counters and histograms guarded by one lock. Values are
+per process, so under gunicorn each worker reports its own series (scrape each worker, or
+run one worker per port).
+
+Instrumented:
+  - HTTP request latency per Flask route, method and status
+  - SQLite queries and time, in total and per request (via TimedConnection in database.connect)
+  - LLM call latency, token usage, counted prompt tokens and outcomes by HTTP status / error class
+"""
+import collections
+import math
+import os
+import sys
+import threading
+import time
+import sqlite3
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+TOKEN_BUCKETS = (25, 50, 75, 100, 150, 200, 300, 500)
+PROFILER_MIN_INTERVAL = 0.001   # seconds; shorter intervals turn the sampler into a busy loop
+
+_lock = threading.Lock()
+_registry = []
+_local = threading.local()
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self._values = collections.defaultdict(float)
+        _registry.append(self)
+
+    def inc(self, *label_values, amount: float = 1.0):
+        with _lock:
+            self._values[label_values] += amount
+
+    def _render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        for label_values, value in sorted(self._values.items()):
+            yield f'{self.name}{_fmt_labels(self.labels, label_values)} {_fmt(value)}'
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}   # label values -> [bucket counts..., sum, count]
+        _registry.append(self)
+
+    def observe(self, value: float, *label_values):
+        with _lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def _render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        for label_values, series in sorted(self._series.items()):
+            for bound, count in zip(self.buckets, series):
+                labels = _fmt_labels(self.labels + ('le',), label_values + (_fmt(bound),))
+                yield f'{self.name}_bucket{labels} {count}'
+            labels = _fmt_labels(self.labels + ('le',), label_values + ('+Inf',))
+            yield f'{self.name}_bucket{labels} {series[-1]}'
+            yield f'{self.name}_sum{_fmt_labels(self.labels, label_values)} {_fmt(series[-2])}'
+            yield f'{self.name}_count{_fmt_labels(self.labels, label_values)} {series[-1]}'
+
+
+class Gauge:
+    """Value read at scrape time from `collect()`, which returns {label values tuple: value}."""
+
+    def __init__(self, name: str, help_text: str, collect, labels=()):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self.collect = collect
+        _registry.append(self)
+
+    def _render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} gauge'
+        for label_values, value in sorted(self.collect().items()):
+            yield f'{self.name}{_fmt_labels(self.labels, label_values)} {_fmt(value)}'
+
+
+def _fmt(value) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _fmt_labels(names, values) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(
+        f'{n}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for n, v in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+HTTP_LATENCY = Histogram(
+    'pataki_http_request_duration_seconds', 'Time to build the response, per route',
+    ('route', 'method', 'status'))
+DB_QUERIES = Counter('pataki_db_queries_total', 'SQLite statements executed')
+DB_SECONDS = Counter('pataki_db_query_seconds_total', 'Time spent in SQLite execute/executemany')
+DB_QUERIES_PER_REQUEST = Histogram(
+    'pataki_db_queries_per_request', 'SQLite statements per HTTP request', ('route',), QUERY_COUNT_BUCKETS)
+DB_SECONDS_PER_REQUEST = Histogram(
+    'pataki_db_seconds_per_request', 'SQLite time per HTTP request', ('route',))
+LLM_LATENCY = Histogram(
+    'pataki_llm_request_duration_seconds', 'Hugging Face call latency', ('mode', 'status'))
+LLM_CALLS = Counter('pataki_llm_requests_total', 'Hugging Face calls by outcome', ('mode', 'status'))
+LLM_TOKENS = Counter('pataki_llm_tokens_total', 'Tokens reported in LLM usage', ('kind',))
+LLM_PROMPT_TOKENS = Histogram(
+    'pataki_llm_prompt_tokens', 'Prompt tokens counted before each LLM call', ('state',), TOKEN_BUCKETS)
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 connection that counts and times execute/executemany calls."""
+
+    def execute(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(*args, **kwargs)
+        finally:
+            _record_query(time.perf_counter() - t0)
+
+    def executemany(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(*args, **kwargs)
+        finally:
+            _record_query(time.perf_counter() - t0)
+
+
+def _record_query(elapsed: float):
+    DB_QUERIES.inc()
+    DB_SECONDS.inc(amount=elapsed)
+    if getattr(_local, 'tracking', False):
+        _local.queries += 1
+        _local.db_seconds += elapsed
+
+
+def start_request():
+    _local.tracking = True
+    _local.queries = 0
+    _local.db_seconds = 0.0
+    _local.started = time.perf_counter()
+
+
+def finish_request(route: str, method: str, status: int):
+    if not getattr(_local, 'tracking', False):
+        return
+    _local.tracking = False
+    HTTP_LATENCY.observe(time.perf_counter() - _local.started, route, method, str(status))
+    DB_QUERIES_PER_REQUEST.observe(_local.queries, route)
+    DB_SECONDS_PER_REQUEST.observe(_local.db_seconds, route)
+
+
+def record_llm_call(mode: str, status, elapsed: float = None, usage: dict = None):
+    """status: HTTP status code, or an error class name such as 'Timeout' / 'ConnectionError'.
+    elapsed is None for calls that never went out (circuit open)."""
+    if elapsed is not None:
+        LLM_LATENCY.observe(elapsed, mode, str(status))
+    LLM_CALLS.inc(mode, str(status))
+    if usage:
+        LLM_TOKENS.inc('prompt', amount=usage.get('prompt_tokens') or 0)
+        LLM_TOKENS.inc('completion', amount=usage.get('completion_tokens') or 0)
+
+
+def render() -> str:
+    with _lock:
+        lines = [line for metric in _registry for line in metric._render()]
+    return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    """Samples every thread's stack at a fixed interval and counts collapsed stacks
+    ("file:func;file:func count" lines, the input format of flamegraph.pl / speedscope).
+
+    Off by default; start it at boot with PROFILER_ENABLED=1, or toggle it at runtime through
+    /api/debug/profiler (served with DEBUG_ENDPOINTS=1). Under gevent only OS threads are
+    visible, so greenlets show up as the hub's stack."""
+
+    def __init__(self):
+        self.interval = 0.01
+        self._stacks = collections.Counter()
+        self._samples = 0
+        self._stop = None
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = None):
+        if interval is not None:
+            if not math.isfinite(interval):
+                raise ValueError('interval must be a finite number of seconds')
+            self.interval = max(interval, PROFILER_MIN_INTERVAL)
+        if self.running:
+            return
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop,), name='profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+            self._thread.join(timeout=1)
+
+    def reset(self):
+        with _lock:
+            self._stacks.clear()
+            self._samples = 0
+
+    def _run(self, stop: threading.Event):
+        own = threading.get_ident()
+        while not stop.wait(self.interval):
+            # Walk the stacks without the lock; it's shared with every metric update
+            sampled = collections.Counter()
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                    frame = frame.f_back
+                sampled[';'.join(reversed(stack))] += 1
+            with _lock:
+                self._samples += 1
+                self._stacks.update(sampled)
+
+    def stats(self) -> dict:
+        with _lock:
+            return {'running': self.running, 'interval': self.interval,
+                    'samples': self._samples, 'distinct_stacks': len(self._stacks)}
+
+    def collapsed(self, limit: int = 500) -> str:
+        with _lock:
+            return ''.join(f'{stack} {count}\n' for stack, count in self._stacks.most_common(limit))
+
+
+profiler = SamplingProfiler()
+if os.getenv('PROFILER_ENABLED') == '1':
+    profiler.start(float(os.getenv('PROFILER_INTERVAL', '0.01')))
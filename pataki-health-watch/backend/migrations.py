@@ -0,0 +1,367 @@
+"""Versioned schema migrations.
+
+Each migration runs once, in order, and is recorded in schema_version in the same write
+transaction as its DDL, so a failed migration leaves the previous version intact and
+processes starting at the same time (gunicorn master, CLIs) serialize on the write lock.
+On an up-to-date database migrate() is a single SELECT.
+
+Add a migration by appending to MIGRATIONS; never edit one that has already shipped.
+
+Usage: python manage.py migrate
+"""
+import sqlite3
+import time
+
+# Version 1 is the schema as it stood before versioning. Every statement is IF NOT EXISTS /
+# OR IGNORE, so databases created by the old import-time init_db() adopt it in place.
+SCHEMA_V1 = '''
+    CREATE TABLE IF NOT EXISTS patients (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        age INTEGER,
+        address TEXT,
+        device_name TEXT,
+        device_status TEXT,
+        device_battery TEXT,
+        caregiver_name TEXT,
+        caregiver_relationship TEXT,
+        caregiver_phone TEXT,
+        caregiver_email TEXT,
+        current_state TEXT DEFAULT 'stable'
+    );
+
+    CREATE TABLE IF NOT EXISTS vitals (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        state TEXT,
+        hr INTEGER,
+        sleep_hours REAL,
+        steps INTEGER,
+        fatigue TEXT,
+        stability_score INTEGER,
+        status TEXT,
+        bp_sys INTEGER,
+        bp_dia INTEGER,
+        resting_hr INTEGER,
+        activity_min INTEGER,
+        last_updated TEXT,
+        FOREIGN KEY (patient_id) REFERENCES patients(id)
+    );
+
+    CREATE TABLE IF NOT EXISTS trend_scores (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        state TEXT,
+        day_label TEXT,
+        score INTEGER,
+        sort_order INTEGER,
+        FOREIGN KEY (patient_id) REFERENCES patients(id)
+    );
+
+    CREATE TABLE IF NOT EXISTS health_metrics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        period_type TEXT,
+        label TEXT,
+        hr INTEGER,
+        resting_hr INTEGER,
+        bp_sys INTEGER,
+        bp_dia INTEGER,
+        steps INTEGER,
+        sleep REAL,
+        activity_min INTEGER,
+        FOREIGN KEY (patient_id) REFERENCES patients(id)
+    );
+
+    CREATE TABLE IF NOT EXISTS period_summaries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        period_type TEXT,
+        hr_current INTEGER,
+        hr_resting INTEGER,
+        hr_baseline INTEGER,
+        sleep_total REAL,
+        sleep_baseline REAL,
+        steps INTEGER,
+        step_change INTEGER,
+        bp_sys INTEGER,
+        bp_dia INTEGER,
+        activity_min INTEGER,
+        FOREIGN KEY (patient_id) REFERENCES patients(id)
+    );
+
+    CREATE TABLE IF NOT EXISTS ai_insights (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        insight_text TEXT,
+        state TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (patient_id) REFERENCES patients(id)
+    );
+
+    CREATE TABLE IF NOT EXISTS insight_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        state TEXT,
+        status TEXT DEFAULT 'queued',
+        insight_text TEXT,
+        error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        finished_at TIMESTAMP,
+        FOREIGN KEY (patient_id) REFERENCES patients(id)
+    );
+
+    CREATE TABLE IF NOT EXISTS insight_cache (
+        prompt_hash TEXT PRIMARY KEY,
+        insight_text TEXT NOT NULL,
+        created_at REAL,
+        last_used REAL
+    );
+
+    CREATE TABLE IF NOT EXISTS raw_samples (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        ts INTEGER,
+        hr INTEGER,
+        steps INTEGER,
+        sleep_min INTEGER,
+        bp_sys INTEGER,
+        bp_dia INTEGER,
+        FOREIGN KEY (patient_id) REFERENCES patients(id)
+    );
+
+    CREATE TABLE IF NOT EXISTS metric_rollups (
+        patient_id INTEGER,
+        granularity TEXT,
+        bucket_start INTEGER,
+        metric TEXT,
+        count INTEGER,
+        sum REAL,
+        min REAL,
+        max REAL,
+        last_ts INTEGER,
+        PRIMARY KEY (patient_id, granularity, bucket_start, metric)
+    ) WITHOUT ROWID;
+
+    -- Compacted raw samples, one delta-encoded chunk per patient/metric/UTC day (see sample_store.py)
+    CREATE TABLE IF NOT EXISTS sample_chunks (
+        patient_id INTEGER,
+        metric TEXT,
+        day INTEGER,
+        count INTEGER,
+        first_ts INTEGER,
+        last_ts INTEGER,
+        ts_width INTEGER,
+        ts_blob BLOB,
+        val_width INTEGER,
+        val_blob BLOB,
+        PRIMARY KEY (patient_id, metric, day)
+    ) WITHOUT ROWID;
+
+    -- Bumped on every write that changes what a patient's dashboard shows; used for ETags
+    CREATE TABLE IF NOT EXISTS patient_versions (
+        patient_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    );
+
+    -- /api/stats counters, maintained by trigger so retention can delete old insights freely
+    CREATE TABLE IF NOT EXISTS patient_stats (
+        patient_id INTEGER PRIMARY KEY,
+        risk_events INTEGER NOT NULL DEFAULT 0
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trg_version_patients AFTER UPDATE ON patients BEGIN
+        INSERT INTO patient_versions (patient_id, version) VALUES (NEW.id, 1)
+        ON CONFLICT (patient_id) DO UPDATE SET version = version + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_version_vitals AFTER UPDATE ON vitals BEGIN
+        INSERT INTO patient_versions (patient_id, version) VALUES (NEW.patient_id, 1)
+        ON CONFLICT (patient_id) DO UPDATE SET version = version + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_version_trend_scores AFTER INSERT ON trend_scores BEGIN
+        INSERT INTO patient_versions (patient_id, version) VALUES (NEW.patient_id, 1)
+        ON CONFLICT (patient_id) DO UPDATE SET version = version + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_version_ai_insights AFTER INSERT ON ai_insights BEGIN
+        INSERT INTO patient_versions (patient_id, version) VALUES (NEW.patient_id, 1)
+        ON CONFLICT (patient_id) DO UPDATE SET version = version + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_stats_risk_events AFTER INSERT ON ai_insights
+    WHEN NEW.state = 'risk' BEGIN
+        INSERT INTO patient_stats (patient_id, risk_events) VALUES (NEW.patient_id, 1)
+        ON CONFLICT (patient_id) DO UPDATE SET risk_events = risk_events + 1;
+    END;
+
+    -- Every route filters by patient first, then by state / period / recency
+    CREATE INDEX IF NOT EXISTS idx_vitals_patient_state ON vitals (patient_id, state);
+    CREATE INDEX IF NOT EXISTS idx_trend_scores_patient_state ON trend_scores (patient_id, state, sort_order);
+    CREATE INDEX IF NOT EXISTS idx_health_metrics_patient_period ON health_metrics (patient_id, period_type);
+    CREATE INDEX IF NOT EXISTS idx_period_summaries_patient_period ON period_summaries (patient_id, period_type);
+    CREATE INDEX IF NOT EXISTS idx_ai_insights_patient_created ON ai_insights (patient_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_ai_insights_patient_state ON ai_insights (patient_id, state, created_at);
+    CREATE INDEX IF NOT EXISTS idx_insight_jobs_patient_state ON insight_jobs (patient_id, state, status);
+    CREATE INDEX IF NOT EXISTS idx_raw_samples_patient_ts ON raw_samples (patient_id, ts);
+
+    -- Counters for databases created before patient_stats existed
+    INSERT OR IGNORE INTO patient_stats (patient_id, risk_events)
+    SELECT patient_id, COUNT(*) FROM ai_insights WHERE state = 'risk' GROUP BY patient_id;
+'''
+
+
+def _enable_incremental_vacuum(conn):
+    # Retention frees pages with incremental VACUUM, which needs auto_vacuum set first;
+    # converting an existing file takes one full VACUUM, which can't run in a transaction.
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('VACUUM')
+
+
+# Texts the old get_ai_insight returned on failure and that were stored as if they were insights
+_LLM_ERROR_TEXTS = '''
+    DELETE FROM ai_insights
+    WHERE insight_text LIKE 'AI service error (%). Please check your HF_API_KEY.'
+       OR insight_text IN (
+           'AI service unreachable. Please check your network connection.',
+           'AI insight timed out. Please try syncing again.',
+           'AI insight unavailable. Please ensure HF_API_KEY is configured correctly.'
+       );
+'''
+
+
+# Streaming detector state (see anomaly.py): one fixed-size blob per patient, plus one row per
+# detected episode so early-detection lead time is measured rather than estimated
+ANOMALY_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS anomaly_state (
+        patient_id INTEGER PRIMARY KEY,
+        state BLOB NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS anomaly_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        detected_at INTEGER,
+        declined_at INTEGER,
+        resolved_at INTEGER,
+        lead_seconds INTEGER,
+        signals TEXT,
+        FOREIGN KEY (patient_id) REFERENCES patients(id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_anomaly_events_patient ON anomaly_events (patient_id, detected_at);
+'''
+
+
+# Leases for scheduler.py: one row per (job, shard); a node owns the work until expires_at
+JOB_LEASES_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS job_leases (
+        job TEXT,
+        shard INTEGER,
+        owner TEXT,
+        expires_at REAL NOT NULL DEFAULT 0,
+        last_started REAL,
+        last_finished REAL,
+        last_status TEXT,
+        last_seconds REAL,
+        last_items INTEGER,
+        runs INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (job, shard)
+    ) WITHOUT ROWID;
+'''
+
+
+# risk_events counted ai_insights inserts, but degraded insights are never stored, so a patient
+# who went to risk while the LLM was down wasn't counted. Count the state transitions instead.
+RISK_TRANSITIONS = '''
+    DROP TRIGGER IF EXISTS trg_stats_risk_events;
+    CREATE TRIGGER IF NOT EXISTS trg_stats_risk_transitions AFTER UPDATE OF current_state ON patients
+    WHEN NEW.current_state = 'risk' AND OLD.current_state IS NOT 'risk' BEGIN
+        INSERT INTO patient_stats (patient_id, risk_events) VALUES (NEW.id, 1)
+        ON CONFLICT (patient_id) DO UPDATE SET risk_events = risk_events + 1;
+    END;
+
+    -- Past transitions only left a trace as risk insights, which the old counter already holds;
+    -- a patient in risk right now got there at least once
+    INSERT INTO patient_stats (patient_id, risk_events)
+    SELECT id, 1 FROM patients WHERE current_state = 'risk'
+    ON CONFLICT (patient_id) DO UPDATE SET risk_events = MAX(risk_events, 1);
+'''
+
+
+# events.py's cross-process relay: each process polls for rows other processes appended.
+# AUTOINCREMENT so ids are never reused after pruning and the pollers' cursors only move forward.
+PATIENT_EVENTS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS patient_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        origin INTEGER NOT NULL,
+        patient_id INTEGER NOT NULL,
+        body TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+'''
+
+
+# (version, description, SQL script run in one transaction | callable(conn) run outside one)
+MIGRATIONS = [
+    (1, 'base schema', SCHEMA_V1),
+    (2, 'incremental auto_vacuum', _enable_incremental_vacuum),
+    (3, 'purge LLM error messages stored as insights', _LLM_ERROR_TEXTS),
+    (4, 'streaming anomaly detector state and episodes', ANOMALY_SCHEMA),
+    (5, 'scheduler job leases', JOB_LEASES_SCHEMA),
+    (6, 'count risk_events from patient state transitions', RISK_TRANSITIONS),
+    (7, 'cross-process event relay', PATIENT_EVENTS_SCHEMA),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _statements(script: str):
+    """Split a script into statements (trigger bodies contain semicolons)."""
+    buf = ''
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            if buf.strip():
+                yield buf.strip()
+            buf = ''
+
+
+def current_version(conn) -> int:
+    try:
+        return conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return 0
+
+
+def migrate(conn) -> list:
+    """Apply pending migrations. Returns the versions applied (empty when up to date)."""
+    if current_version(conn) >= LATEST_VERSION:
+        return []
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS schema_version ('
+        'version INTEGER PRIMARY KEY, description TEXT, applied_at REAL)'
+    )
+    conn.commit()
+    applied = []
+    for version, description, step in MIGRATIONS:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Re-check under the write lock: another process may have just applied it
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            if callable(step):
+                conn.rollback()
+                step(conn)
+                conn.execute('BEGIN IMMEDIATE')
+            else:
+                for statement in _statements(step):
+                    conn.execute(statement)
+            conn.execute(
+                'INSERT OR IGNORE INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                (version, description, time.time())
+            )
+            conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        print(f'[DB] Applied migration {version}: {description}')
+        applied.append(version)
+    return applied
@@ -0,0 +1,122 @@
+"""Local stand-in for the Hugging Face chat-completions router.
+
+Answers POST /v1/chat/completions like the real router, including OpenAI-style streaming
+chunks when the request sets "stream": true. Latency and error rate are configurable.
+
+Usage (from pataki-health-watch/backend/):
+    python mock_hf.py --port 8765 --latency 0.3 --token-delay 0.02
+    HF_URL=http://127.0.0.1:8765/v1/chat/completions python app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STABLE_TEXT = (
+    'Everything looks steady today: heart rate, sleep and movement are all in their usual range. '
+    'No action is needed; just continue the normal routine.'
+)
+RISK_TEXT = (
+    'Heart rate is elevated, sleep was short and movement has dropped sharply since yesterday. '
+    'Please check in right away — the user needs urgent care immediately.'
+)
+
+
+class MockHFHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        cfg = self.server.config
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        with self.server.lock:
+            self.server.request_count += 1
+            fail = cfg['error_rate'] and self.server.rng.random() < cfg['error_rate']
+            status = self.server.rng.choice(cfg['error_statuses'])
+
+        time.sleep(cfg['latency'])
+        if fail:
+            self._send_json(status, {'error': f'mock error {status}'})
+            return
+
+        prompt = '\n'.join(m.get('content', '') for m in body.get('messages') or [])
+        text = RISK_TEXT if 'warning signs' in prompt else STABLE_TEXT
+        words = text.split(' ')
+        completion = words[:body.get('max_tokens') or len(words)]
+        usage = {
+            'prompt_tokens': max(1, len(prompt) // 4),
+            'completion_tokens': len(completion),
+            'total_tokens': max(1, len(prompt) // 4) + len(completion),
+        }
+
+        if not body.get('stream'):
+            self._send_json(200, {
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ' '.join(completion)},
+                             'finish_reason': 'stop'}],
+                'usage': usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for i, word in enumerate(completion):
+            chunk = {'choices': [{'index': 0, 'delta': {'content': word if i == 0 else ' ' + word}}]}
+            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+            self.wfile.flush()
+            time.sleep(cfg['token_delay'])
+        final = {'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}], 'usage': usage}
+        self.wfile.write(f'data: {json.dumps(final)}\n\ndata: [DONE]\n\n'.encode())
+        self.wfile.flush()
+        self.close_connection = True
+
+    def _send_json(self, status: int, payload: dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_mock_server(port: int = 0, latency: float = 0.0, token_delay: float = 0.0,
+                      error_rate: float = 0.0, error_statuses=(429, 500, 503), seed=None):
+    """Start the mock in a background thread. Returns (server, url); call server.shutdown() to stop.
+    Pass `seed` for a reproducible sequence of injected errors."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), MockHFHandler)
+    server.daemon_threads = True
+    server.config = {
+        'latency': latency, 'token_delay': token_delay,
+        'error_rate': error_rate, 'error_statuses': tuple(error_statuses),
+    }
+    server.lock = threading.Lock()
+    server.rng = random.Random(seed)
+    server.request_count = 0
+    threading.Thread(target=server.serve_forever, name='mock-hf', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/v1/chat/completions'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.3, help='seconds before the response starts')
+    parser.add_argument('--token-delay', type=float, default=0.02, help='seconds between streamed tokens')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 429/5xx')
+    args = parser.parse_args()
+    server, url = start_mock_server(args.port, args.latency, args.token_delay, args.error_rate)
+    print(f'Mock Hugging Face router listening on {url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
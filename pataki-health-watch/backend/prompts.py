@@ -0,0 +1,244 @@
+"""Insight prompt templates, token counting and per-state output budgets.
+
+The prompt depends only on the state (risk/stable) and five bucketed descriptors, so every
+(state, descriptor combo) is rendered once into a template at import and a call only fills in
+the patient's name and age. The instructions are one short system message per state and the
+user message is just the facts. Each rendered prompt carries its token count and the state's
+max_tokens budget.
+
+Tokens are counted with tiktoken (o200k_base) when it is installed, otherwise estimated from
+word and punctuation pieces, which tracks BPE counts for short English prompts within ~10%.
+
+Usage (from pataki-health-watch/backend/):
+    python prompts.py --bench                       # tokens and cost per 1,000 insights, old vs new prompt
+    python prompts.py --bench --mock --calls 200    # plus measured usage from calls to a local mock
+"""
+import argparse
+import itertools
+import math
+import os
+import random
+import re
+from collections import namedtuple
+from scoring import RISK_SCORE_THRESHOLD
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding('o200k_base')
+except Exception:   # not installed, or the encoding can't be downloaded
+    _encoding = None
+
+# Completion budgets: a risk alert is 2-3 sentences plus the call to action, stable is 2 sentences.
+# gpt-oss counts its reasoning against max_tokens, so requests also ask for REASONING_EFFORT.
+MAX_TOKENS = {
+    'risk': int(os.getenv('LLM_MAX_TOKENS_RISK', '140')),
+    'stable': int(os.getenv('LLM_MAX_TOKENS_STABLE', '100')),
+}
+REASONING_EFFORT = os.getenv('LLM_REASONING_EFFORT', 'low')   # empty to leave it out of requests
+# USD per million tokens, for the benchmark's cost estimate; set to your provider's prices
+PRICE_IN_PER_M = float(os.getenv('LLM_PRICE_IN_PER_M', '0.15'))
+PRICE_OUT_PER_M = float(os.getenv('LLM_PRICE_OUT_PER_M', '0.75'))
+
+# Per-state instructions go in the system message; the user message is only the facts
+SYSTEM_PROMPTS = {
+    'risk': ('Caregiver alert: an elderly patient is showing warning signs. In 2-3 plain sentences explain '
+             'the readings, then end with: the user needs urgent care immediately.'),
+    'stable': ('Caregiver update: an elderly patient is doing well. In 2 warm plain sentences reassure the '
+               'caregiver, saying no action is needed and to continue the normal routine.'),
+}
+
+# Descriptor buckets, in template order
+HR = ('normal', 'elevated')
+SLEEP = ('good', 'below normal', 'very low')
+MOVEMENT = ('normal', 'less than usual', 'very little')
+BP = ('normal', 'high')
+FATIGUE = ('low', 'moderate', 'high', None)   # None: not reported, left out of the prompt
+
+
+class Prompt(namedtuple('Prompt', 'state text tokens max_tokens')):
+    @property
+    def system(self) -> str:
+        return SYSTEM_PROMPTS[self.state]
+
+    @property
+    def cache_key(self) -> str:
+        """Everything that determines the reply, for insight_cache."""
+        return f'{self.system}\n{self.text}'
+
+
+def _compile(state: str, hr: str, sleep: str, movement: str, bp: str, fatigue: str) -> str:
+    fatigue = f' fatigue {fatigue};' if fatigue else ''
+    return f'{{name}}, {{age}}. HR {hr}; sleep {sleep}; movement {movement};{fatigue} BP {bp}.'
+
+
+TEMPLATES = {
+    key: _compile(*key) for key in itertools.product(('risk', 'stable'), HR, SLEEP, MOVEMENT, BP, FATIGUE)
+}
+
+_PIECES = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+
+def count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    # Short common words are one token; long words split roughly every 6 letters; digits every 3
+    return sum(
+        math.ceil(len(p) / 6) if p[0].isalpha() else math.ceil(len(p) / 3) if p[0].isdigit() else 1
+        for p in _PIECES.findall(text)
+    )
+
+
+MESSAGE_OVERHEAD_TOKENS = 4   # role markers per chat message
+SYSTEM_TOKENS = {state: count_tokens(text) + MESSAGE_OVERHEAD_TOKENS for state, text in SYSTEM_PROMPTS.items()}
+
+
+def descriptors(vitals: dict) -> tuple:
+    """The state plus the bucketed descriptors that select a template."""
+    sleep = vitals['sleep_hours']
+    steps = vitals['steps']
+    return (
+        'risk' if vitals['stability_score'] < RISK_SCORE_THRESHOLD else 'stable',
+        HR[vitals['hr'] > 80],
+        'very low' if sleep < 5 else 'below normal' if sleep < 6.5 else 'good',
+        'very little' if steps < 2000 else 'less than usual' if steps < 4000 else 'normal',
+        BP[vitals['bp_sys'] > 130],
+        (vitals.get('fatigue') or '').lower() or None,
+    )
+
+
+def render(patient: dict, vitals: dict) -> Prompt:
+    key = descriptors(vitals)
+    template = TEMPLATES.get(key)
+    if template is None:   # a fatigue label outside FATIGUE
+        template = TEMPLATES[key] = _compile(*key)
+    text = template.format(name=patient['name'].split()[0], age=patient['age'])
+    state = key[0]
+    tokens = SYSTEM_TOKENS[state] + count_tokens(text) + MESSAGE_OVERHEAD_TOKENS
+    return Prompt(state, text, tokens, MAX_TOKENS[state])
+
+
+def request_body(model: str, prompt: Prompt, stream: bool = False) -> dict:
+    body = {
+        'model': model,
+        'messages': [{'role': 'system', 'content': prompt.system}, {'role': 'user', 'content': prompt.text}],
+        'max_tokens': prompt.max_tokens,
+    }
+    if REASONING_EFFORT:
+        body['reasoning_effort'] = REASONING_EFFORT
+    if stream:
+        body['stream'] = True
+    return body
+
+
+def _legacy_prompt(patient: dict, vitals: dict) -> str:
+    """The free-text prompt used before templates, kept as the benchmark baseline."""
+    first_name = patient['name'].split()[0]
+    state, hr, sleep, movement, bp, fatigue = descriptors(vitals)
+    movement = {'very little': 'very little movement', 'less than usual': 'less movement than usual',
+                'normal': 'normal movement'}[movement]
+    if state == 'risk':
+        tone = (f"{first_name} is showing warning signs and needs attention right away. "
+                f"Write 2-3 sentences that clearly alert the caregiver. "
+                f"End with a direct call to action stating: the user needs urgent care immediately. "
+                f"ENSURE A RESPONSE IS ALWAYS PROVIDED.")
+    else:
+        tone = (f"{first_name} is doing well today. "
+                f"Write 2-3 warm, reassuring sentences confirming everything looks fine. "
+                f"End by saying no action is needed and to continue the normal routine. "
+                f"ENSURE A RESPONSE IS ALWAYS PROVIDED.")
+    return (f"You are a health monitoring AI helping caregivers of elderly patients.\n{tone}\n\n"
+            f"Patient: {first_name}, {patient['age']} years old\nHeart rate today: {hr}\n"
+            f"Sleep last night: {sleep}\nMovement today: {movement}\n"
+            + (f"Energy level: {fatigue} fatigue\n" if fatigue else '') + f"Blood pressure: {bp}")
+
+
+LEGACY_MAX_TOKENS = 150
+
+
+def _sample_patients(n: int, from_db: bool = False, seed_value: int = 42):
+    """n synthetic patients with vitals, or up to n (patient, vitals) pairs from the database."""
+    if from_db:
+        from database import connect
+        db = connect()
+        rows = db.execute(
+            'SELECT p.name, p.age, v.hr, v.sleep_hours, v.steps, v.fatigue, v.stability_score, v.bp_sys '
+            'FROM patients p JOIN vitals v ON v.patient_id = p.id LIMIT ?', (n,)
+        ).fetchall()
+        db.close()
+        return [(dict(name=r[0], age=r[1]), dict(zip(('hr', 'sleep_hours', 'steps', 'fatigue',
+                                                      'stability_score', 'bp_sys'), r[2:]))) for r in rows]
+    rng = random.Random(seed_value)
+    return [
+        ({'name': rng.choice(['Margaret Lee', 'Joseph Okafor', 'Ana Souza']), 'age': rng.randint(65, 95)},
+         {'hr': rng.randint(60, 110), 'sleep_hours': round(rng.uniform(3, 9), 1), 'steps': rng.randint(500, 8000),
+          'fatigue': rng.choice(['Low', 'Moderate', 'High']), 'stability_score': rng.randint(30, 98),
+          'bp_sys': rng.randint(105, 150)})
+        for _ in range(n)
+    ]
+
+
+def _cost(tokens_in: float, tokens_out: float) -> float:
+    return (tokens_in * PRICE_IN_PER_M + tokens_out * PRICE_OUT_PER_M) / 1e6
+
+
+def _bench(n: int, calls: int, url: str = None, from_db: bool = False):
+    samples = _sample_patients(n, from_db)
+    old_in = sum(count_tokens(_legacy_prompt(p, v)) + MESSAGE_OVERHEAD_TOKENS for p, v in samples) / len(samples)
+    rendered = [render(p, v) for p, v in samples]
+    new_in = sum(r.tokens for r in rendered) / len(rendered)
+    new_out = sum(r.max_tokens for r in rendered) / len(rendered)
+    print(f'{len(samples)} prompts ({"tiktoken o200k_base" if _encoding else "estimated"} token counts)')
+    print(f'  legacy    in {old_in:6.1f}  out <= {LEGACY_MAX_TOKENS:5.1f}  '
+          f'cost/1000 <= ${_cost(old_in, LEGACY_MAX_TOKENS) * 1000:.4f}')
+    print(f'  templates in {new_in:6.1f}  out <= {new_out:5.1f}  '
+          f'cost/1000 <= ${_cost(new_in, new_out) * 1000:.4f}')
+    print(f'  distinct prompts: {len({r.cache_key for r in rendered})} (cache keys), '
+          f'templates: {len(TEMPLATES)}')
+    if not (calls and url):
+        return
+
+    import app as app_module
+    import batch_insights
+    session = batch_insights.make_session(1)
+    variants = (
+        ('legacy', lambda p, v: {'model': app_module.AI_MODEL, 'max_tokens': LEGACY_MAX_TOKENS,
+                                 'messages': [{'role': 'user', 'content': _legacy_prompt(p, v)}]}),
+        ('templates', lambda p, v: request_body(app_module.AI_MODEL, render(p, v))),
+    )
+    k = min(calls, len(samples))
+    for label, body in variants:
+        used = {'prompt_tokens': 0, 'completion_tokens': 0}
+        for p, v in samples[:k]:
+            resp = session.post(url, json=body(p, v), timeout=30,
+                                headers={'Authorization': f'Bearer {app_module.HF_API_KEY}'})
+            usage = resp.json().get('usage') or {}
+            for key in used:
+                used[key] += usage.get(key) or 0
+        tokens_in, tokens_out = used['prompt_tokens'] / k, used['completion_tokens'] / k
+        print(f'  measured {label:<9} in {tokens_in:6.1f}  out {tokens_out:6.1f}  '
+              f'cost/1000 ${_cost(tokens_in, tokens_out) * 1000:.4f}  ({k} calls)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bench', action='store_true')
+    parser.add_argument('-n', type=int, default=1000, help='prompts to render')
+    parser.add_argument('--calls', type=int, default=0, help='also call the LLM this many times per variant')
+    parser.add_argument('--mock', action='store_true', help='call a local mock of HF_URL instead')
+    parser.add_argument('--from-db', action='store_true', help='render prompts for patients in the database')
+    args = parser.parse_args()
+    if not args.bench:
+        parser.print_help()
+        return
+    url = None
+    if args.calls:
+        import app as app_module
+        url = app_module.HF_URL
+        if args.mock:
+            from mock_hf import start_mock_server
+            server, url = start_mock_server()
+    _bench(args.n, args.calls, url, args.from_db)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""Retention, compaction and downsampling so the database stays flat over months of operation.
+
+Each pass (every RETENTION_INTERVAL seconds in the background, or once via the CLI):
+  - compacts raw_samples older than RETENTION_RAW_DAYS into sample_chunks (not under
+    scheduler.py, which runs compaction as its own sharded job)
+  - drops sample chunks older than RETENTION_SAMPLE_DAYS (day/week/month rollups keep the history)
+  - drops hourly rollups older than RETENTION_HOURLY_DAYS
+  - collapses identical insights to the newest row per patient/state/text, and drops insights
+    older than RETENTION_INSIGHT_DAYS except the latest one per patient/state
+  - drops finished insight jobs older than RETENTION_JOB_DAYS
+  - returns up to RETENTION_VACUUM_PAGES free pages to the OS with incremental VACUUM
+
+Counters shown by /api/stats live in patient_stats and are maintained by triggers, so
+deleting old rows never changes them.
+
+Usage (from pataki-health-watch/backend/):
+    python retention.py            # run one pass and print what it did
+    python retention.py --loop     # run a pass every RETENTION_INTERVAL seconds (gunicorn's
+                                   # GUNICORN_RETENTION=1 starts this beside the web workers)
+"""
+import argparse
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import migrations
+import sample_store
+from database import connect, writer
+
+RETENTION_INTERVAL = int(os.getenv('RETENTION_INTERVAL', str(60 * 60)))   # seconds between passes
+RETENTION_RAW_DAYS = int(os.getenv('RETENTION_RAW_DAYS', '2'))
+RETENTION_SAMPLE_DAYS = int(os.getenv('RETENTION_SAMPLE_DAYS', '400'))
+RETENTION_HOURLY_DAYS = int(os.getenv('RETENTION_HOURLY_DAYS', '35'))
+RETENTION_INSIGHT_DAYS = int(os.getenv('RETENTION_INSIGHT_DAYS', '90'))
+RETENTION_JOB_DAYS = int(os.getenv('RETENTION_JOB_DAYS', '7'))
+RETENTION_VACUUM_PAGES = int(os.getenv('RETENTION_VACUUM_PAGES', '2000'))
+DELETE_BATCH = 5000   # rows per transaction, so a pass never holds the write lock for long
+
+_thread = None
+
+
+def _delete_batched(target, table: str, where: str, params=()) -> int:
+    """DELETE in rowid batches; returns the number of rows removed."""
+    removed = 0
+    while True:
+        with target as db:
+            cur = db.execute(
+                f'DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT ?)',
+                (*params, DELETE_BATCH)
+            )
+        removed += cur.rowcount
+        if cur.rowcount < DELETE_BATCH:
+            return removed
+
+
+def _delete_selected(target, table: str, select: str, params=()) -> int:
+    """Run `select` once for the ids to delete, then delete them in batches. For conditions
+    that are expensive to evaluate (window functions, grouped subqueries), which _delete_batched
+    would re-run for every batch."""
+    with target as db:
+        ids = [(r[0],) for r in db.execute(select, params)]
+    removed = 0
+    for i in range(0, len(ids), DELETE_BATCH):
+        with target as db:
+            removed += db.executemany(f'DELETE FROM {table} WHERE id = ?', ids[i:i + DELETE_BATCH]).rowcount
+    return removed
+
+
+def dedupe_insights(target) -> int:
+    """Keep only the newest row for each identical (patient, state, text) insight."""
+    return _delete_selected(target, 'ai_insights', '''
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY patient_id, state, insight_text ORDER BY created_at DESC, id DESC
+            ) AS rn FROM ai_insights
+        ) WHERE rn > 1''')
+
+
+def run_once(target, now: float = None, compact: bool = True) -> dict:
+    """One pass. `target` is a connection or database.writer; every step is its own short
+    `with target as db:` transaction, so in-process writers interleave with the pass."""
+    now = time.time() if now is None else now
+    day = 86400
+    report = {}
+    if compact:
+        report['raw_compacted'] = sample_store.compact(target, int(now) - RETENTION_RAW_DAYS * day)
+
+    with target as db:
+        report['chunks_dropped'] = db.execute(
+            'DELETE FROM sample_chunks WHERE day < ?', (int(now) - RETENTION_SAMPLE_DAYS * day,)
+        ).rowcount
+        report['hourly_rollups_dropped'] = db.execute(
+            "DELETE FROM metric_rollups WHERE granularity = 'hour' AND bucket_start < ?",
+            (int(now) - RETENTION_HOURLY_DAYS * day,)
+        ).rowcount
+
+    report['insights_deduped'] = dedupe_insights(target)
+    cutoff = (datetime.fromtimestamp(now) - timedelta(days=RETENTION_INSIGHT_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+    report['insights_expired'] = _delete_selected(
+        target, 'ai_insights',
+        'SELECT id FROM ai_insights WHERE created_at < ? '
+        'AND id NOT IN (SELECT MAX(id) FROM ai_insights GROUP BY patient_id, state)',
+        (cutoff,)
+    )
+    cutoff = (datetime.fromtimestamp(now) - timedelta(days=RETENTION_JOB_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+    report['jobs_expired'] = _delete_batched(
+        target, 'insight_jobs', "status IN ('done', 'failed') AND created_at < ?", (cutoff,)
+    )
+
+    with target as db:
+        report['free_pages_before'] = db.execute('PRAGMA freelist_count').fetchone()[0]
+        # executescript steps the pragma to completion; execute() would free a single page
+        db.executescript(f'PRAGMA incremental_vacuum({RETENTION_VACUUM_PAGES})')
+        db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        db.execute('PRAGMA optimize')
+        report['free_pages_after'] = db.execute('PRAGMA freelist_count').fetchone()[0]
+    return report
+
+
+def _run_forever(interval: int, target=None):
+    target = target or connect()
+    while True:
+        try:
+            t0 = time.perf_counter()
+            report = run_once(target)
+            changed = {k: v for k, v in report.items() if v and not k.startswith('free_pages')}
+            print(f'[Retention] Pass finished in {time.perf_counter() - t0:.2f}s: {changed or "nothing to do"}')
+        except Exception as e:
+            print(f'[Retention] Pass failed: {type(e).__name__}: {e}')
+        time.sleep(interval)
+
+
+def start(interval: int = RETENTION_INTERVAL):
+    """Start the background retention thread (once per process). interval <= 0 disables it.
+    It writes through the process's `writer`, like every other in-process write."""
+    global _thread
+    if interval <= 0 or (_thread is not None and _thread.is_alive()):
+        return
+    _thread = threading.Thread(target=_run_forever, args=(interval, writer), name='retention', daemon=True)
+    _thread.start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--loop', action='store_true', help='run a pass every RETENTION_INTERVAL seconds')
+    args = parser.parse_args()
+
+    db = connect()
+    migrations.migrate(db)
+    if args.loop:
+        db.close()
+        if RETENTION_INTERVAL <= 0:
+            raise SystemExit('RETENTION_INTERVAL is 0; nothing to run')
+        try:
+            _run_forever(RETENTION_INTERVAL)
+        except KeyboardInterrupt:
+            print('[Retention] Stopping')
+        return
+    for key, value in run_once(db).items():
+        print(f'  {key:<24} {value}')
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+from collections import defaultdict
+from datetime import datetime, timezone
+
+# Running aggregates per (patient, granularity, bucket, metric), updated in the same
+# transaction as the raw samples so reads never have to touch raw_samples.
+GRANULARITIES = ('hour', 'day', 'week', 'month', 'year')
+ROLLUP_METRICS = ('hr', 'steps', 'sleep_min', 'bp_sys', 'bp_dia', 'active_min')
+
+# A minute with at least this many steps counts towards activity_min
+ACTIVE_STEPS_PER_MIN = 60
+
+# Dashboard period -> (bucket that holds the summary, child buckets shown on the chart, max child span)
+PERIODS = {
+    'day': ('day', 'hour', 3600),
+    'week': ('week', 'day', 86400),
+    'month': ('month', 'week', 7 * 86400),
+    'year': ('year', 'month', 31 * 86400),
+}
+
+UPSERT_ROLLUP_SQL = '''
+    INSERT INTO metric_rollups (patient_id, granularity, bucket_start, metric, count, sum, min, max, last_ts)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (patient_id, granularity, bucket_start, metric) DO UPDATE SET
+        count = count + excluded.count,
+        sum = sum + excluded.sum,
+        min = MIN(min, excluded.min),
+        max = MAX(max, excluded.max),
+        last_ts = MAX(last_ts, excluded.last_ts)
+'''
+
+
+def bucket_starts(ts: int) -> dict:
+    """Start of the UTC hour/day/week(Mon)/month/year bucket containing ts."""
+    day_start = ts - ts % 86400
+    dt = datetime.fromtimestamp(day_start, timezone.utc)
+    return {
+        'hour': ts - ts % 3600,
+        'day': day_start,
+        'week': day_start - dt.weekday() * 86400,
+        'month': int(dt.replace(day=1).timestamp()),
+        'year': int(dt.replace(month=1, day=1).timestamp()),
+    }
+
+
+def apply_samples(db, rows) -> int:
+    """Fold a batch of raw sample tuples (patient_id, ts, hr, steps, sleep_min, bp_sys, bp_dia)
+    into the rollup table. Samples are aggregated per hour in memory first, then the hourly
+    aggregates are folded into the coarser buckets, so each bucket is upserted once per batch."""
+    hourly = {}
+    for pid, ts, hr, steps, sleep_min, bp_sys, bp_dia in rows:
+        hour = ts - ts % 3600
+        values = (hr, steps, sleep_min, bp_sys, bp_dia,
+                  None if steps is None else int(steps >= ACTIVE_STEPS_PER_MIN))
+        for metric, value in zip(ROLLUP_METRICS, values):
+            if value is None:
+                continue
+            key = (pid, hour, metric)
+            a = hourly.get(key)
+            if a is None:
+                hourly[key] = [1, value, value, value, ts]
+            else:
+                a[0] += 1
+                a[1] += value
+                if value < a[2]:
+                    a[2] = value
+                if value > a[3]:
+                    a[3] = value
+                if ts > a[4]:
+                    a[4] = ts
+
+    acc = {}
+    starts_cache = {}
+    for (pid, hour, metric), h in hourly.items():
+        starts = starts_cache.get(hour)
+        if starts is None:
+            starts = starts_cache[hour] = bucket_starts(hour)
+        for granularity, start in starts.items():
+            key = (pid, granularity, start, metric)
+            a = acc.get(key)
+            if a is None:
+                acc[key] = list(h)
+            else:
+                a[0] += h[0]
+                a[1] += h[1]
+                a[2] = min(a[2], h[2])
+                a[3] = max(a[3], h[3])
+                a[4] = max(a[4], h[4])
+    db.executemany(UPSERT_ROLLUP_SQL, [key + tuple(a) for key, a in acc.items()])
+    return len(acc)
+
+
+def _pivot(rows) -> dict:
+    buckets = defaultdict(dict)
+    for r in rows:
+        buckets[r['bucket_start']][r['metric']] = r
+    return buckets
+
+
+def _avg(metrics: dict, metric: str):
+    m = metrics.get(metric)
+    return round(m['sum'] / m['count']) if m and m['count'] else None
+
+
+def _total(metrics: dict, metric: str):
+    m = metrics.get(metric)
+    return m['sum'] if m else 0
+
+
+def _latest_bucket(db, patient_id: int, granularity: str):
+    return db.execute(
+        'SELECT MAX(bucket_start) FROM metric_rollups WHERE patient_id = ? AND granularity = ?',
+        (patient_id, granularity)
+    ).fetchone()[0]
+
+
+def _label(period: str, start: int, index: int) -> str:
+    dt = datetime.fromtimestamp(start, timezone.utc)
+    if period == 'day':
+        return dt.strftime('%I%p').lstrip('0').lower()
+    if period == 'week':
+        return dt.strftime('%a')
+    if period == 'month':
+        return f'Week {index + 1}'
+    return dt.strftime('%b')
+
+
+def get_period_rows(db, patient_id: int, period: str):
+    """health_metrics-shaped rows for the most recent period, built from child rollup buckets.
+    Returns None if the patient has no ingested samples."""
+    if period not in PERIODS:
+        return None
+    parent, child, child_span = PERIODS[period]
+    parent_start = _latest_bucket(db, patient_id, parent)
+    if parent_start is None:
+        return None
+    last_ts = db.execute(
+        'SELECT MAX(last_ts) FROM metric_rollups WHERE patient_id = ? AND granularity = ? AND bucket_start = ?',
+        (patient_id, parent, parent_start)
+    ).fetchone()[0]
+    rows = db.execute(
+        'SELECT bucket_start, metric, count, sum, min, max FROM metric_rollups '
+        'WHERE patient_id = ? AND granularity = ? AND bucket_start > ? AND bucket_start <= ? '
+        'ORDER BY bucket_start',
+        (patient_id, child, parent_start - child_span, last_ts)
+    ).fetchall()
+
+    result = []
+    for index, (start, metrics) in enumerate(sorted(_pivot(rows).items())):
+        hr = metrics.get('hr')
+        result.append({
+            'patient_id': patient_id,
+            'period_type': period,
+            'label': _label(period, start, index),
+            'hr': _avg(metrics, 'hr'),
+            'resting_hr': int(hr['min']) if hr else None,
+            'bp_sys': _avg(metrics, 'bp_sys'),
+            'bp_dia': _avg(metrics, 'bp_dia'),
+            'steps': int(_total(metrics, 'steps')),
+            'sleep': round(_total(metrics, 'sleep_min') / 60, 1),
+            'activity_min': int(_total(metrics, 'active_min')),
+        })
+    return result
+
+
+def get_period_summary(db, patient_id: int, period: str):
+    """Summary for the most recent period read from its single precomputed bucket.
+    Returns None if the patient has no ingested samples."""
+    if period not in PERIODS:
+        return None
+    parent = PERIODS[period][0]
+    parent_start = _latest_bucket(db, patient_id, parent)
+    if parent_start is None:
+        return None
+    rows = db.execute(
+        'SELECT bucket_start, metric, count, sum, min, max, last_ts FROM metric_rollups '
+        'WHERE patient_id = ? AND granularity = ? AND bucket_start = ?',
+        (patient_id, parent, parent_start)
+    ).fetchall()
+    metrics = _pivot(rows)[parent_start]
+    last_ts = max(r['last_ts'] for r in rows)
+    hr = metrics.get('hr')
+    return {
+        'hr_current': _avg(metrics, 'hr'),
+        'hr_resting': int(hr['min']) if hr else None,
+        'bp_sys': _avg(metrics, 'bp_sys'),
+        'bp_dia': _avg(metrics, 'bp_dia'),
+        'steps': int(_total(metrics, 'steps')),
+        'sleep_total': round(_total(metrics, 'sleep_min') / 60, 1),
+        'activity_min': int(_total(metrics, 'active_min')),
+        # Days covered so far, so partial periods get a proportional baseline
+        'days_covered': (last_ts - parent_start) // 86400 + 1,
+    }
+
+
+def rebuild(db, patient_id: int, batch_size: int = 50000):
+    """Recompute a patient's rollups from raw_samples (e.g. after a backfill or bulk delete)."""
+    db.execute('DELETE FROM metric_rollups WHERE patient_id = ?', (patient_id,))
+    cur = db.execute(
+        'SELECT patient_id, ts, hr, steps, sleep_min, bp_sys, bp_dia FROM raw_samples WHERE patient_id = ?',
+        (patient_id,)
+    )
+    while True:
+        batch = cur.fetchmany(batch_size)
+        if not batch:
+            break
+        apply_samples(db, [tuple(r) for r in batch])
+    db.commit()
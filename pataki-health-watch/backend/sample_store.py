@@ -0,0 +1,208 @@
+"""Compressed long-term storage for raw wearable samples.
+
+raw_samples is the write-optimised hot table the ingest buffer appends to. compact() moves
+finished days out of it into sample_chunks: one row per (patient, metric, UTC day) holding
+delta-encoded timestamp and value columns, packed into the narrowest integer width that fits
+and zlib-compressed. query() reads only the chunks overlapping the requested range (a primary
+key range scan), plus any not-yet-compacted raw rows.
+
+Usage (from pataki-health-watch/backend/):
+    python sample_store.py --compact              # compact everything before today
+    python sample_store.py --bench --patients 20  # size/latency estimate for a year of minute HR
+"""
+import argparse
+import os
+import tempfile
+import time
+import zlib
+import numpy as np
+
+METRICS = ('hr', 'steps', 'sleep_min', 'bp_sys', 'bp_dia')
+DAY = 86400
+
+# Width codes for delta-encoded columns
+_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32, 8: np.int64}
+
+UPSERT_CHUNK_SQL = '''
+    INSERT OR REPLACE INTO sample_chunks (patient_id, metric, day, count, first_ts, last_ts, ts_width,
+                                          ts_blob, val_width, val_blob)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def _encode(values: np.ndarray):
+    """Delta-encode, narrow to the smallest int width that holds every delta, then compress."""
+    deltas = np.diff(values.astype(np.int64), prepend=0)
+    lo, hi = (int(deltas.min()), int(deltas.max())) if len(deltas) else (0, 0)
+    for width, dtype in _DTYPES.items():
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return width, zlib.compress(deltas.astype(dtype).tobytes(), 6)
+
+
+def _decode(width: int, blob: bytes) -> np.ndarray:
+    return np.cumsum(np.frombuffer(zlib.decompress(blob), dtype=_DTYPES[width]).astype(np.int64))
+
+
+def write_chunk(db, patient_id: int, metric: str, day: int, ts: np.ndarray, values: np.ndarray):
+    """Merge samples into the (patient, metric, day) chunk. Samples must all fall inside `day`."""
+    existing = db.execute(
+        'SELECT ts_width, ts_blob, val_width, val_blob FROM sample_chunks WHERE patient_id = ? AND metric = ? AND day = ?',
+        (patient_id, metric, day)
+    ).fetchone()
+    if existing:
+        ts = np.concatenate([_decode(existing[0], existing[1]) + day, ts])
+        values = np.concatenate([_decode(existing[2], existing[3]), values])
+    order = np.argsort(ts, kind='stable')
+    ts, values = ts[order], values[order]
+    ts_width, ts_blob = _encode(ts - day)
+    val_width, val_blob = _encode(values)
+    db.execute(UPSERT_CHUNK_SQL, (patient_id, metric, day, len(ts), int(ts[0]), int(ts[-1]),
+                                  ts_width, ts_blob, val_width, val_blob))
+
+
+def compact(target, before_ts: int = None, batch_patients: int = 500, shard: tuple = None) -> int:
+    """Move raw_samples older than the UTC day containing before_ts (default: now) into chunks.
+    shard=(index, count) limits it to patients with id % count == index.
+    Each batch reads and deletes its raw rows under the write lock (BEGIN IMMEDIATE), so two
+    compactions running at once can't both merge the same rows into a chunk. `target` is a
+    connection or database.writer.
+    Returns the number of raw rows compacted."""
+    if before_ts is None:
+        before_ts = int(time.time())
+    cutoff = before_ts - before_ts % DAY
+    query = 'SELECT DISTINCT patient_id FROM raw_samples WHERE ts < ?'
+    params = (cutoff,)
+    if shard is not None:
+        query += ' AND patient_id % ? = ?'
+        params += (shard[1], shard[0])
+    with target as db:
+        patient_ids = [r[0] for r in db.execute(query, params)]
+    moved = 0
+    for i in range(0, len(patient_ids), batch_patients):
+        with target as db:
+            if not db.in_transaction:
+                db.execute('BEGIN IMMEDIATE')
+            for pid in patient_ids[i:i + batch_patients]:
+                rows = db.execute(
+                    f'SELECT ts, {", ".join(METRICS)} FROM raw_samples WHERE patient_id = ? AND ts < ? ORDER BY ts',
+                    (pid, cutoff)
+                ).fetchall()
+                if not rows:   # another compaction got here first
+                    continue
+                data = np.array([[np.nan if v is None else v for v in r] for r in rows], dtype=np.float64)
+                ts = data[:, 0].astype(np.int64)
+                days = ts - ts % DAY
+                for day in np.unique(days):
+                    in_day = days == day
+                    for col, metric in enumerate(METRICS, start=1):
+                        sel = in_day & ~np.isnan(data[:, col])
+                        if sel.any():
+                            write_chunk(db, pid, metric, int(day), ts[sel], data[sel, col].astype(np.int64))
+                db.execute('DELETE FROM raw_samples WHERE patient_id = ? AND ts < ?', (pid, cutoff))
+                moved += len(rows)
+    return moved
+
+
+def query(db, patient_id: int, metric: str, start: int, end: int, resolution: int = None):
+    """Samples of one metric in [start, end) as (ts, values) NumPy arrays.
+
+    With `resolution` (seconds) the samples are averaged into buckets of that width and the
+    bucket start timestamps are returned instead."""
+    if metric not in METRICS:
+        raise ValueError(f'unknown metric {metric!r}')
+    ts_parts, val_parts = [], []
+    for day, ts_width, ts_blob, val_width, val_blob in db.execute(
+        'SELECT day, ts_width, ts_blob, val_width, val_blob FROM sample_chunks '
+        'WHERE patient_id = ? AND metric = ? AND day >= ? AND day < ? ORDER BY day',
+        (patient_id, metric, start - start % DAY, end)
+    ):
+        ts_parts.append(_decode(ts_width, ts_blob) + day)
+        val_parts.append(_decode(val_width, val_blob))
+    raw = db.execute(
+        f'SELECT ts, {metric} FROM raw_samples WHERE patient_id = ? AND ts >= ? AND ts < ? '
+        f'AND {metric} IS NOT NULL ORDER BY ts',
+        (patient_id, start, end)
+    ).fetchall()
+    if raw:
+        raw = np.array([tuple(r) for r in raw], dtype=np.int64)
+        ts_parts.append(raw[:, 0])
+        val_parts.append(raw[:, 1])
+    if not ts_parts:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+
+    ts = np.concatenate(ts_parts)
+    values = np.concatenate(val_parts)
+    keep = (ts >= start) & (ts < end)
+    ts, values = ts[keep], values[keep]
+    if resolution:
+        buckets = (ts - start) // resolution
+        sums = np.bincount(buckets, weights=values)
+        counts = np.bincount(buckets)
+        nonzero = counts > 0
+        return start + np.nonzero(nonzero)[0] * resolution, sums[nonzero] / counts[nonzero]
+    return ts, values
+
+
+def _bench(n_patients: int, days: int, query_days: int):
+    from database import connect, init_db
+    init_db()
+    db = connect()
+    rng = np.random.default_rng(42)
+    start_day = 1740787200  # 2025-03-01 UTC
+    minute_offsets = np.arange(0, DAY, 60)
+    t0 = time.perf_counter()
+    for pid in range(1, n_patients + 1):
+        base = 65 + rng.integers(-5, 6)
+        with db:
+            for d in range(days):
+                day = start_day + d * DAY
+                hr = base + np.cumsum(rng.integers(-2, 3, len(minute_offsets))) // 8
+                write_chunk(db, pid, 'hr', day, day + minute_offsets, np.clip(hr, 40, 180))
+    write_s = time.perf_counter() - t0
+    n_samples = n_patients * days * len(minute_offsets)
+    blob_bytes = db.execute('SELECT SUM(LENGTH(ts_blob) + LENGTH(val_blob)) FROM sample_chunks').fetchone()[0]
+    db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    file_bytes = os.path.getsize(db.execute('PRAGMA database_list').fetchone()[2])
+
+    q_start = start_day + (days - query_days) * DAY
+    timings = []
+    for pid in range(1, n_patients + 1):
+        t = time.perf_counter()
+        ts, values = query(db, pid, 'hr', q_start, q_start + query_days * DAY)
+        timings.append((time.perf_counter() - t) * 1000)
+    db.close()
+
+    per_sample = file_bytes / n_samples
+    print(f'Wrote {n_samples:,} minute HR samples ({n_patients} patients x {days} days) in {write_s:.1f}s')
+    print(f'  compressed blobs: {blob_bytes / n_samples:.3f} bytes/sample, '
+          f'database file: {per_sample:.3f} bytes/sample')
+    print(f'  projected year of minute HR for 10k patients: {per_sample * 10000 * 365 * 1440 / 1e9:.1f} GB')
+    print(f'  {query_days}-day query ({len(ts):,} samples): median {sorted(timings)[len(timings) // 2]:.2f}ms, '
+          f'max {max(timings):.2f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--compact', action='store_true', help='move finished days from raw_samples into chunks')
+    parser.add_argument('--bench', action='store_true', help='benchmark on a temporary database')
+    parser.add_argument('--patients', type=int, default=20)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--query-days', type=int, default=7)
+    args = parser.parse_args()
+
+    if args.bench:
+        os.environ['PATAKI_DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix='pataki-samples-'), 'pataki.db')
+        _bench(args.patients, args.days, args.query_days)
+        return
+    if args.compact:
+        import migrations
+        from database import connect
+        db = connect()
+        migrations.migrate(db)
+        print(f'Compacted {compact(db):,} raw samples into chunks.')
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+"""Periodic per-patient jobs on a process pool, off the request path.
+
+Jobs (interval, shards):
+  compact     move raw samples older than RETENTION_RAW_DAYS into sample chunks (daily, sharded)
+  score       re-score stability_score/current_state with scoring.py for patients the
+              streaming detector doesn't track, i.e. without ingested samples (hourly, sharded)
+  insights    regenerate ai_insights for patients whose state changed (every 15 min, sharded)
+  retention   retention.run_once without its compaction step, which `compact` owns (hourly, one shard)
+
+Sharded jobs split patients by id % SCHEDULER_SHARDS. Each (job, shard) is claimed through a
+lease row in job_leases with a conditional UPSERT, so any number of scheduler nodes can share
+one database without doing the same work twice. A node renews its leases while the work runs;
+if it dies, the lease expires after SCHEDULER_LEASE_SECONDS and another node picks the shard up.
+When the scheduler runs the retention job, start the web app with RETENTION_INTERVAL=0.
+
+Usage (from pataki-health-watch/backend/):
+    python scheduler.py run --workers 4                  # run due jobs forever
+    python scheduler.py run --once --jobs score,compact  # each shard once (across nodes), then report
+    python scheduler.py status                           # lease table
+"""
+import argparse
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+SCHEDULER_SHARDS = int(os.getenv('SCHEDULER_SHARDS', '8'))
+SCHEDULER_LEASE_SECONDS = float(os.getenv('SCHEDULER_LEASE_SECONDS', '60'))
+SCHEDULER_TICK = float(os.getenv('SCHEDULER_TICK', '2'))
+SCHEDULER_RETRY_SECONDS = 60           # a failed shard is retried after this, not the full interval
+REPORT_INTERVAL = 300                  # seconds between throughput reports in `run`
+
+ACQUIRE_SQL = '''
+    INSERT INTO job_leases (job, shard, owner, expires_at, last_started) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (job, shard) DO UPDATE SET
+        owner = excluded.owner, expires_at = excluded.expires_at, last_started = excluded.last_started
+    WHERE job_leases.expires_at < ? AND COALESCE(job_leases.last_finished, 0) + ? <= ?
+'''
+
+_db = None   # one connection per pool process
+
+
+def _worker_db():
+    global _db
+    if _db is None:
+        from database import connect
+        _db = connect()
+    return _db
+
+
+def _compact(db, shard) -> int:
+    import retention
+    import sample_store
+    return sample_store.compact(db, int(time.time()) - retention.RETENTION_RAW_DAYS * 86400, shard=shard)
+
+
+def _score(db, shard) -> int:
+    import scoring
+    results = scoring.score_patients(db, shard)
+    # Patients with ingested samples are scored by the streaming detector (anomaly.py)
+    streamed = {r[0] for r in db.execute(
+        'SELECT patient_id FROM anomaly_state WHERE patient_id % ? = ?', (shard[1], shard[0])
+    )}
+    results = {pid: r for pid, r in results.items() if pid not in streamed}
+    scoring.apply_scores(db, results)
+    return len(results)
+
+
+def _insights(db, shard) -> int:
+    import app as app_module
+    import batch_insights
+    # Insights stored, not patients attempted: with the LLM down nothing is stored
+    return batch_insights.run_batch(db, app_module, shard=shard)['inserted']
+
+
+def _retention(db, shard) -> int:
+    import retention
+    report = retention.run_once(db, compact=False)
+    return sum(v for k, v in report.items() if not k.startswith('free_pages'))
+
+
+# name -> (interval seconds, shards, function(db, (shard, shards)) -> items processed)
+JOBS = {
+    'compact': (24 * 3600, SCHEDULER_SHARDS, _compact),
+    'score': (3600, SCHEDULER_SHARDS, _score),
+    'insights': (15 * 60, SCHEDULER_SHARDS, _insights),
+    'retention': (3600, 1, _retention),
+}
+
+
+def run_task(job: str, shard: int, shards: int) -> int:
+    """Runs in a pool process."""
+    db = _worker_db()
+    try:
+        return JOBS[job][2](db, (shard, shards))
+    except Exception:
+        if db.in_transaction:
+            db.rollback()
+        raise
+
+
+def acquire(db, job: str, shard: int, owner: str, interval: float, now: float = None) -> bool:
+    """Claim (job, shard) if its lease is free and the job is due. Atomic across processes."""
+    now = time.time() if now is None else now
+    with db:
+        cur = db.execute(ACQUIRE_SQL, (job, shard, owner, now + SCHEDULER_LEASE_SECONDS, now, now, interval, now))
+    return cur.rowcount == 1
+
+
+def renew(db, job: str, shard: int, owner: str) -> bool:
+    with db:
+        cur = db.execute(
+            'UPDATE job_leases SET expires_at = ? WHERE job = ? AND shard = ? AND owner = ?',
+            (time.time() + SCHEDULER_LEASE_SECONDS, job, shard, owner)
+        )
+    return cur.rowcount == 1
+
+
+def release(db, job: str, shard: int, owner: str, status: str, seconds: float, items: int, interval: float):
+    # A failed shard looks as if it finished long enough ago to be retried soon
+    finished = time.time()
+    if status != 'ok':
+        finished -= max(interval - SCHEDULER_RETRY_SECONDS, 0)
+    with db:
+        cur = db.execute(
+            '''UPDATE job_leases SET owner = NULL, expires_at = 0, last_finished = ?, last_status = ?,
+                   last_seconds = ?, last_items = ?, runs = runs + 1
+               WHERE job = ? AND shard = ? AND owner = ?''',
+            (finished, status, seconds, items, job, shard, owner)
+        )
+    if not cur.rowcount:
+        print(f'[Scheduler] Lease on {job}/{shard} was taken over before the run finished')
+
+
+def report(totals: dict, wall: float) -> list:
+    lines = []
+    for job, t in totals.items():
+        rate = f'{t["items"] / t["seconds"]:,.0f} items/s' if t['seconds'] else '-'
+        lines.append(f'{job:<10} {t["runs"]:>4} runs  {t["failed"]:>3} failed  {t["items"]:>9,} items  '
+                     f'{t["seconds"]:8.1f}s busy  {rate}')
+    busy = sum(t['seconds'] for t in totals.values())
+    lines.append(f'wall {wall:.1f}s, busy {busy:.1f}s across workers')
+    return lines
+
+
+def run(job_names, workers: int, once: bool = False) -> dict:
+    import migrations
+    from database import connect
+    db = connect()
+    migrations.migrate(db)
+    owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+    tasks = [(job, shard) for job in job_names for shard in range(JOBS[job][1])]
+    totals = {job: {'runs': 0, 'failed': 0, 'items': 0, 'seconds': 0.0} for job in job_names}
+    attempted = set()
+    in_flight = {}   # future -> (job, shard, started)
+    t0 = last_report = time.perf_counter()
+    started_at = time.time()
+    print(f'[Scheduler] {owner}: {len(tasks)} job shards on {workers} worker processes')
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        try:
+            while True:
+                running = {(job, shard) for job, shard, _ in in_flight.values()}
+                # Read first so idle ticks don't open a write transaction per shard
+                now = time.time()
+                leases = {(job, shard): (expires_at, finished or 0) for job, shard, expires_at, finished in
+                          db.execute('SELECT job, shard, expires_at, last_finished FROM job_leases')}
+                for job, shard in tasks:
+                    if len(in_flight) >= workers:
+                        break
+                    if (job, shard) in running or (once and (job, shard) in attempted):
+                        continue
+                    # --once: due unless some node finished it since this run started
+                    interval = now - started_at if once else JOBS[job][0]
+                    expires_at, finished = leases.get((job, shard), (0, 0))
+                    if expires_at >= now or finished + interval > now:
+                        attempted.add((job, shard))
+                        continue
+                    if acquire(db, job, shard, owner, interval):
+                        in_flight[pool.submit(run_task, job, shard, JOBS[job][1])] = (job, shard, time.perf_counter())
+                    attempted.add((job, shard))
+                if once and not in_flight:
+                    break
+
+                done, _ = wait(in_flight, timeout=SCHEDULER_TICK, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job, shard, started = in_flight.pop(future)
+                    elapsed = time.perf_counter() - started
+                    try:
+                        items, status = future.result(), 'ok'
+                    except Exception as e:
+                        items, status = 0, f'failed: {type(e).__name__}: {e}'
+                        totals[job]['failed'] += 1
+                        print(f'[Scheduler] {job}/{shard} {status}')
+                    release(db, job, shard, owner, status, elapsed, items, JOBS[job][0])
+                    totals[job]['runs'] += 1
+                    totals[job]['items'] += items
+                    totals[job]['seconds'] += elapsed
+                for job, shard, _ in in_flight.values():
+                    if not renew(db, job, shard, owner):
+                        print(f'[Scheduler] Lost the lease on {job}/{shard}')
+
+                if not once and time.perf_counter() - last_report >= REPORT_INTERVAL:
+                    last_report = time.perf_counter()
+                    for line in report(totals, last_report - t0):
+                        print(f'[Scheduler] {line}')
+        except KeyboardInterrupt:
+            print('[Scheduler] Stopping; waiting for running shards')
+            for future, (job, shard, started) in in_flight.items():
+                try:
+                    items, status = future.result(), 'ok'
+                except Exception as e:
+                    items, status = 0, f'failed: {type(e).__name__}: {e}'
+                release(db, job, shard, owner, status, time.perf_counter() - started, items, JOBS[job][0])
+    db.close()
+    return {'wall_seconds': time.perf_counter() - t0, 'jobs': totals}
+
+
+def cmd_run(args):
+    job_names = args.jobs.split(',') if args.jobs else list(JOBS)
+    unknown = [j for j in job_names if j not in JOBS]
+    if unknown:
+        raise SystemExit(f'unknown job(s): {", ".join(unknown)}; choose from {", ".join(JOBS)}')
+    result = run(job_names, args.workers, args.once)
+    for line in report(result['jobs'], result['wall_seconds']):
+        print(line)
+
+
+def cmd_status(args):
+    import migrations
+    from database import connect
+    db = connect()
+    migrations.migrate(db)
+    now = time.time()
+    for job, shard, owner, expires_at, finished, status, seconds, items, runs in db.execute(
+        'SELECT job, shard, owner, expires_at, last_finished, last_status, last_seconds, last_items, runs '
+        'FROM job_leases ORDER BY job, shard'
+    ):
+        held = f'held by {owner} for {expires_at - now:.0f}s' if expires_at > now else 'free'
+        last = (f'last {time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(finished))} {status} '
+                f'({items} items, {seconds:.2f}s)') if finished else 'never finished'
+        print(f'  {job:<10} {shard:>3}  runs {runs:<5} {held:<40} {last}')
+    db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    run_parser = sub.add_parser('run', help='run due jobs')
+    run_parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='worker processes')
+    run_parser.add_argument('--jobs', help=f'comma-separated subset of {",".join(JOBS)}')
+    run_parser.add_argument('--once', action='store_true',
+                            help='run every shard not already run by any node since starting, then exit')
+    run_parser.set_defaults(func=cmd_run)
+    sub.add_parser('status', help='show job leases').set_defaults(func=cmd_status)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""Stability scoring from daily health history against each patient's personal baseline.
+
+All patients are scored in one vectorized pass over (patients x days) NumPy arrays:
+for every day, each metric is compared with the patient's trailing-window mean/std
+(a rolling z-score), adverse deviations are weighted and turned into a 0-100 score.
+
+Usage (from pataki-health-watch/backend/):
+    python scoring.py                  # print scores for every patient
+    python scoring.py --apply          # also write stability_score / current_state
+    python scoring.py --bench 100000   # score 100k synthetic patient-days
+"""
+import argparse
+import time
+import numpy as np
+
+METRICS = ('hr', 'resting_hr', 'sleep', 'steps', 'bp_sys')
+
+# +1: higher than baseline is adverse, -1: lower than baseline is adverse
+DIRECTION = np.array([1, 1, -1, -1, 1], dtype=np.float64)
+WEIGHTS = np.array([0.25, 0.20, 0.25, 0.20, 0.10], dtype=np.float64)
+
+# Used until a patient has MIN_BASELINE_DAYS of their own history
+# (same defaults as BASELINE_HR / BASELINE_SLEEP_PER_PERIOD / BASELINE_STEPS_DAILY in app.py)
+POPULATION_MEAN = np.array([70, 58, 7.5, 5200, 118], dtype=np.float64)
+POPULATION_STD = np.array([6, 4, 1.0, 1500, 8], dtype=np.float64)
+# Floor on the personal std so a very regular week doesn't turn tiny wobbles into alarms
+MIN_STD = np.array([3, 2, 0.5, 500, 5], dtype=np.float64)
+
+BASELINE_WINDOW_DAYS = 28
+MIN_BASELINE_DAYS = 3
+Z_CAP = 4.0
+PENALTY_SCALE = 15.0
+RISK_SCORE_THRESHOLD = 70
+
+
+def score_matrix(values: np.ndarray, window: int = BASELINE_WINDOW_DAYS) -> np.ndarray:
+    """Score every patient-day.
+
+    values: float array (patients, days, len(METRICS)) with NaN for missing data, oldest day first.
+    Returns a (patients, days) float array of 0-100 scores (NaN where a day has no data).
+    """
+    n_patients, n_days, n_metrics = values.shape
+    valid = ~np.isnan(values)
+    x = np.where(valid, values, 0.0)
+
+    # Prefix sums give the trailing-window sums for every day at once: window [t - window, t)
+    zeros = np.zeros((n_patients, 1, n_metrics))
+    s1 = np.concatenate([zeros, np.cumsum(x, axis=1)], axis=1)
+    s2 = np.concatenate([zeros, np.cumsum(x * x, axis=1)], axis=1)
+    cnt = np.concatenate([zeros, np.cumsum(valid, axis=1, dtype=np.float64)], axis=1)
+    t = np.arange(n_days)
+    lo = np.maximum(t - window, 0)
+    win_sum = s1[:, t] - s1[:, lo]
+    win_sq = s2[:, t] - s2[:, lo]
+    win_n = cnt[:, t] - cnt[:, lo]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = win_sum / win_n
+        std = np.sqrt(np.maximum(win_sq / win_n - mean * mean, 0.0))
+    personal = win_n >= MIN_BASELINE_DAYS
+    mean = np.where(personal, mean, POPULATION_MEAN)
+    std = np.where(personal, np.maximum(std, MIN_STD), POPULATION_STD)
+
+    z = (x - mean) / std * DIRECTION
+    adverse = np.where(valid, np.clip(z, 0.0, Z_CAP), 0.0)
+    scores = np.clip(100.0 - PENALTY_SCALE * (adverse @ WEIGHTS), 0.0, 100.0)
+    return np.where(valid.any(axis=2), scores, np.nan)
+
+
+def load_daily_history(db, days: int = BASELINE_WINDOW_DAYS + 1, shard: tuple = None):
+    """Build the (patients, days, metrics) array from daily rollups of ingested samples.
+    Patients without ingested samples fall back to their seeded week of health_metrics.
+    shard=(index, count) limits it to patients with id % count == index."""
+    shard_sql, shard_params = '', ()
+    if shard is not None:
+        shard_sql, shard_params = ' AND patient_id % ? = ?', (shard[1], shard[0])
+    patient_ids = np.array([r[0] for r in db.execute(
+        'SELECT id FROM patients' + (' WHERE id % ? = ?' if shard else '') + ' ORDER BY id', shard_params
+    )], dtype=np.int64)
+    values = np.full((len(patient_ids), days, len(METRICS)), np.nan)
+    if not len(patient_ids):
+        return patient_ids, values
+
+    rows = db.execute(
+        '''SELECT r.patient_id, r.bucket_start, r.metric, r.sum, r.count, r.min
+           FROM metric_rollups r
+           JOIN (SELECT patient_id, MAX(bucket_start) AS last_day FROM metric_rollups
+                 WHERE granularity = 'day' GROUP BY patient_id) latest USING (patient_id)
+           WHERE r.granularity = 'day' AND r.metric IN ('hr', 'sleep_min', 'steps', 'bp_sys')
+             AND r.bucket_start > latest.last_day - ? * 86400''' + shard_sql,
+        (days,) + shard_params
+    ).fetchall()
+    has_rollups = set()
+    if rows:
+        pid = np.array([r[0] for r in rows], dtype=np.int64)
+        start = np.array([r[1] for r in rows], dtype=np.int64)
+        metric = np.array([r[2] for r in rows])
+        total = np.array([r[3] for r in rows], dtype=np.float64)
+        count = np.array([r[4] for r in rows], dtype=np.float64)
+        low = np.array([r[5] for r in rows], dtype=np.float64)
+
+        p_idx = np.searchsorted(patient_ids, pid)
+        last_day = np.zeros(len(patient_ids), dtype=np.int64)
+        np.maximum.at(last_day, p_idx, start)
+        d_idx = days - 1 - (last_day[p_idx] - start) // 86400
+        for m, col, value in (
+            ('hr', 0, total / count),
+            ('hr', 1, low),                      # resting HR approximated by the day's minimum
+            ('sleep_min', 2, total / 60),
+            ('steps', 3, total),
+            ('bp_sys', 4, total / count),
+        ):
+            sel = metric == m
+            values[p_idx[sel], d_idx[sel], col] = value[sel]
+        has_rollups = set(pid.tolist())
+
+    seeded = db.execute(
+        "SELECT patient_id, hr, resting_hr, sleep, steps, bp_sys FROM health_metrics "
+        "WHERE period_type = 'week'" + shard_sql + " ORDER BY patient_id, id", shard_params
+    ).fetchall()
+    by_patient = {}
+    for r in seeded:
+        if r[0] not in has_rollups:
+            by_patient.setdefault(r[0], []).append(r[1:])
+    for pid, history in by_patient.items():
+        i = np.searchsorted(patient_ids, pid)
+        if i < len(patient_ids) and patient_ids[i] == pid:
+            arr = np.array(history[-days:], dtype=np.float64)
+            values[i, days - len(arr):] = arr
+    return patient_ids, values
+
+
+def score_patients(db, shard: tuple = None) -> dict:
+    """Latest stability score and stable/risk state for every patient with history."""
+    patient_ids, values = load_daily_history(db, shard=shard)
+    scores = score_matrix(values)
+    # Most recent day with data for each patient
+    has_data = ~np.isnan(scores)
+    last = scores.shape[1] - 1 - np.argmax(has_data[:, ::-1], axis=1)
+    latest = scores[np.arange(len(patient_ids)), last]
+    results = {}
+    for pid, score, any_data in zip(patient_ids.tolist(), latest.tolist(), has_data.any(axis=1).tolist()):
+        if any_data:
+            score = int(round(score))
+            results[pid] = {'score': score, 'state': 'risk' if score < RISK_SCORE_THRESHOLD else 'stable'}
+    return results
+
+
+def apply_scores(db, results: dict):
+    """Write scores back: the patient's current_state and the stability_score of that state's vitals row.
+    Unchanged rows aren't touched, so their patient_versions (and ETags) stay put."""
+    db.executemany(
+        'UPDATE patients SET current_state = ? WHERE id = ? AND current_state != ?',
+        [(r['state'], pid, r['state']) for pid, r in results.items()]
+    )
+    db.executemany(
+        'UPDATE vitals SET stability_score = ? WHERE patient_id = ? AND state = ? AND stability_score IS NOT ?',
+        [(r['score'], pid, r['state'], r['score']) for pid, r in results.items()]
+    )
+    db.commit()
+
+
+def _bench(patient_days: int, days: int = 90, seed_value: int = 42):
+    rng = np.random.default_rng(seed_value)
+    n_patients = max(1, patient_days // days)
+    base = POPULATION_MEAN + rng.normal(0, 1, (n_patients, 1, len(METRICS))) * POPULATION_STD * 0.3
+    values = base + rng.normal(0, 1, (n_patients, days, len(METRICS))) * MIN_STD
+    values[rng.random(values.shape) < 0.02] = np.nan
+    t0 = time.perf_counter()
+    scores = score_matrix(values)
+    elapsed = time.perf_counter() - t0
+    at_risk = int(np.sum(scores[:, -1] < RISK_SCORE_THRESHOLD))
+    print(f'Scored {n_patients * days:,} patient-days ({n_patients:,} patients x {days} days) '
+          f'in {elapsed * 1000:.1f}ms ({n_patients * days / elapsed:,.0f} patient-days/sec), '
+          f'{at_risk} at risk on the last day')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--apply', action='store_true', help='write scores to patients/vitals')
+    parser.add_argument('--bench', type=int, metavar='PATIENT_DAYS', help='benchmark on synthetic data')
+    args = parser.parse_args()
+
+    if args.bench:
+        _bench(args.bench)
+        return
+
+    import migrations
+    from database import connect
+    db = connect()
+    migrations.migrate(db)
+    t0 = time.perf_counter()
+    results = score_patients(db)
+    print(f'Scored {len(results)} patients in {(time.perf_counter() - t0) * 1000:.1f}ms')
+    for pid, r in list(results.items())[:20]:
+        print(f'  patient {pid}: {r["score"]} ({r["state"]})')
+    if args.apply:
+        apply_scores(db, results)
+        print('Scores written.')
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Seed N synthetic patients and measure per-route latency.
+
+Usage (from pataki-health-watch/backend/):
+    python seed_patients.py --patients 10000 --requests 500
+    python seed_patients.py --patients 10000 --db /tmp/pataki-bench.db --bench-only
+
+By default a fresh temporary database is used so the demo pataki.db is left untouched.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+DAY_LABELS = ['6am', '8am', '10am', '12pm', '2pm', '4pm', '6pm', '8pm', '10pm']
+WEEK_LABELS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+MONTH_LABELS = ['Week 1', 'Week 2', 'Week 3', 'Week 4']
+YEAR_LABELS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+FIRST_NAMES = ['Amarachi', 'Chidi', 'Ngozi', 'Tunde', 'Folake', 'Emeka', 'Bisi', 'Kwame', 'Zainab', 'Ifeoma']
+LAST_NAMES = ['Rabi', 'Okafor', 'Adeyemi', 'Balogun', 'Eze', 'Mensah', 'Bello', 'Nwosu', 'Okeke', 'Danjuma']
+
+BATCH_SIZE = 1000
+
+
+def _metric_row(rng, steps_scale, sleep_scale):
+    hr = rng.randint(62, 90)
+    return (
+        hr, hr - rng.randint(10, 15), rng.randint(112, 136), rng.randint(72, 88),
+        int(rng.randint(1000, 5600) * steps_scale), round(rng.uniform(4.0, 8.0) * sleep_scale, 1),
+        rng.randint(10, 45),
+    )
+
+
+def seed(db, n_patients: int, seed_value: int = 42):
+    """Insert n synthetic patients with vitals, trends and health metrics using batched inserts."""
+    rng = random.Random(seed_value)
+    c = db.cursor()
+    start_id = (c.execute('SELECT COALESCE(MAX(id), 0) FROM patients').fetchone()[0]) + 1
+
+    for batch_start in range(0, n_patients, BATCH_SIZE):
+        batch_ids = range(start_id + batch_start, start_id + min(batch_start + BATCH_SIZE, n_patients))
+        patients, vitals, trends, metrics = [], [], [], []
+        for pid in batch_ids:
+            name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+            patients.append((
+                pid, name, rng.randint(65, 95), 'Lagos', 'Xiaomi Smart Band 9', 'Connected',
+                f'{rng.randint(10, 100)}%', 'Synthetic Caregiver', 'Child', '+234 700 000 000',
+                f'caregiver{pid}@example.com', rng.choice(['stable', 'stable', 'stable', 'risk']),
+            ))
+            vitals.append((pid, 'stable', rng.randint(62, 78), round(rng.uniform(6.5, 8.5), 1),
+                           rng.randint(4000, 7000), 'Low', rng.randint(80, 98), 'Stable',
+                           rng.randint(110, 125), rng.randint(70, 80), rng.randint(54, 62),
+                           rng.randint(30, 50), '2026-02-19 10:23:00'))
+            vitals.append((pid, 'risk', rng.randint(95, 120), round(rng.uniform(3.5, 5.0), 1),
+                           rng.randint(800, 2000), 'High', rng.randint(35, 65), 'High Risk',
+                           rng.randint(130, 145), rng.randint(84, 92), rng.randint(70, 80),
+                           rng.randint(5, 15), '2026-02-22 09:00:00'))
+            for order, label in enumerate(WEEK_LABELS):
+                trends.append((pid, 'stable', label, rng.randint(86, 94), order))
+                risk_score = rng.randint(86, 92) if order < 4 else rng.randint(40, 75)
+                trends.append((pid, 'risk', label, risk_score, order))
+            for period_type, labels, steps_scale, sleep_scale in [
+                ('day', DAY_LABELS, 0.2, 1), ('week', WEEK_LABELS, 1, 1),
+                ('month', MONTH_LABELS, 7, 7), ('year', YEAR_LABELS, 30, 30),
+            ]:
+                for label in labels:
+                    metrics.append((pid, period_type, label) + _metric_row(rng, steps_scale, sleep_scale))
+
+        c.executemany(
+            '''INSERT INTO patients
+               (id, name, age, address, device_name, device_status, device_battery,
+                caregiver_name, caregiver_relationship, caregiver_phone, caregiver_email, current_state)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', patients)
+        c.executemany(
+            '''INSERT INTO vitals (patient_id, state, hr, sleep_hours, steps, fatigue,
+               stability_score, status, bp_sys, bp_dia, resting_hr, activity_min, last_updated)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', vitals)
+        c.executemany(
+            'INSERT INTO trend_scores (patient_id, state, day_label, score, sort_order) VALUES (?, ?, ?, ?, ?)',
+            trends)
+        c.executemany(
+            '''INSERT INTO health_metrics
+               (patient_id, period_type, label, hr, resting_hr, bp_sys, bp_dia, steps, sleep, activity_min)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', metrics)
+        db.commit()
+    return start_id, start_id + n_patients - 1
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def bench(app_module, first_id: int, last_id: int, n_requests: int, seed_value: int = 7):
+    """Hit each patient-scoped route for random patients and report latency in ms."""
+    # Route latency is what we're measuring here, not the LLM round trip. Routes queue
+    # generate_ai_insight on the insight worker pool and look it up at call time.
+    app_module.generate_ai_insight = lambda patient, vitals: 'Benchmark insight.'
+    client = app_module.app.test_client()
+    rng = random.Random(seed_value)
+    routes = [
+        ('GET', '/api/patients/{id}'),
+        ('GET', '/api/patients/{id}/vitals'),
+        ('GET', '/api/patients/{id}/trend'),
+        ('GET', '/api/patients/{id}/health-data?period=week'),
+        ('GET', '/api/patients/{id}/health-summary?period=month'),
+        ('GET', '/api/patients/{id}/stats'),
+        ('POST', '/api/patients/{id}/sync'),
+    ]
+    results = {}
+    for method, template in routes:
+        samples = []
+        for _ in range(n_requests):
+            url = template.format(id=rng.randint(first_id, last_id))
+            t0 = time.perf_counter()
+            resp = client.open(url, method=method)
+            samples.append((time.perf_counter() - t0) * 1000)
+            if resp.status_code != 200:
+                raise RuntimeError(f'{method} {url} returned {resp.status_code}')
+        results[f'{method} {template}'] = {
+            'mean_ms': round(statistics.mean(samples), 3),
+            'p50_ms': round(_percentile(samples, 50), 3),
+            'p95_ms': round(_percentile(samples, 95), 3),
+            'p99_ms': round(_percentile(samples, 99), 3),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', type=int, default=10000, help='number of synthetic patients to add')
+    parser.add_argument('--requests', type=int, default=500, help='requests per route')
+    parser.add_argument('--db', help='database file (default: a fresh temporary file)')
+    parser.add_argument('--bench-only', action='store_true', help='skip seeding and benchmark existing patients')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='pataki-bench-'), 'pataki.db')
+    os.environ['PATAKI_DB_PATH'] = db_path
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as app_module
+    from database import connect, init_db, seed_demo
+
+    init_db()
+    db = connect()
+    seed_demo(db)
+    if args.bench_only:
+        first_id, last_id = db.execute('SELECT MIN(id), MAX(id) FROM patients').fetchone()
+    else:
+        t0 = time.perf_counter()
+        first_id, last_id = seed(db, args.patients)
+        print(f'Seeded {args.patients} patients into {db_path} in {time.perf_counter() - t0:.1f}s')
+    total = db.execute('SELECT COUNT(*) FROM patients').fetchone()[0]
+    db.close()
+
+    print(f'Benchmarking {args.requests} requests per route across {total} patients')
+    for route, stats in bench(app_module, first_id, last_id, args.requests).items():
+        print(f'  {route:<55} mean {stats["mean_ms"]:>7.2f}ms  p50 {stats["p50_ms"]:>7.2f}ms  '
+              f'p95 {stats["p95_ms"]:>7.2f}ms  p99 {stats["p99_ms"]:>7.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Every test session works on a copy of the tracked demo database, never the file itself.
+# Set before any backend module is imported: database.DB_PATH is read at import.
+_tmp = tempfile.mkdtemp(prefix='pataki-tests-')
+os.environ['PATAKI_DB_PATH'] = os.path.join(_tmp, 'pataki.db')
+os.environ['HF_API_KEY'] = ''
+os.environ['HF_URL'] = 'http://127.0.0.1:9/v1/chat/completions'   # nothing listens; LLM calls fail fast
+shutil.copy(os.path.join(BACKEND_DIR, 'pataki.db'), os.environ['PATAKI_DB_PATH'])
+
+
+@pytest.fixture(scope='session')
+def app():
+    import database
+    database.init_db()
+    import app as app_module
+    return app_module.app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
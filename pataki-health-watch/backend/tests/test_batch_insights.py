@@ -0,0 +1,74 @@
+import pytest
+
+import batch_insights
+import prompts
+from circuit_breaker import CircuitBreaker
+
+PROMPT = prompts.render({'name': 'Ada Lovelace', 'age': 81},
+                        {'hr': 72, 'sleep_hours': 7.5, 'steps': 5200, 'bp_sys': 118,
+                         'fatigue': 'Low', 'stability_score': 92})
+
+
+class FakeResponse:
+    ok = True
+    status_code = 200
+    headers = {}
+
+    def __init__(self, body):
+        self._body = body
+
+    def json(self):
+        if isinstance(self._body, Exception):
+            raise self._body
+        return self._body
+
+
+class FakeSession:
+    def __init__(self, body):
+        self.body = body
+        self.calls = 0
+
+    def post(self, url, **kwargs):
+        self.calls += 1
+        return FakeResponse(self.body)
+
+
+def call(body, breaker):
+    return batch_insights.call_llm(FakeSession(body), 'http://llm.invalid', 'key', 'model', PROMPT,
+                                   max_retries=0, breaker=breaker)
+
+
+def test_completion_text_is_returned_and_recorded_as_success():
+    breaker = CircuitBreaker('test', failure_threshold=2)
+    breaker.record_failure()
+    body = {'choices': [{'message': {'content': '  All readings look normal.  '}}]}
+    assert call(body, breaker) == 'All readings look normal.'
+    assert breaker.stats()['consecutive_failures'] == 0
+
+
+@pytest.mark.parametrize('body', [
+    ValueError('not JSON'),
+    {},
+    {'choices': []},
+    {'choices': 'oops'},
+    {'choices': [{'message': {'content': None}}]},
+    ['not', 'an', 'object'],
+], ids=['not-json', 'no-choices', 'empty-choices', 'choices-not-a-list', 'null-content', 'list-body'])
+def test_malformed_response_is_a_failure(body):
+    breaker = CircuitBreaker('test', failure_threshold=2)
+    assert call(body, breaker) is None
+    assert breaker.stats()['consecutive_failures'] == 1
+
+
+def test_malformed_responses_open_the_breaker():
+    breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=60)
+    for _ in range(2):
+        assert call({}, breaker) is None
+    assert breaker.state == 'open'
+    session = FakeSession({'choices': [{'message': {'content': 'ok'}}]})
+    assert batch_insights.call_llm(session, 'http://llm.invalid', 'key', 'model', PROMPT, breaker=breaker) is None
+    assert session.calls == 0
+
+
+def test_empty_completion_is_not_an_insight():
+    assert call({'choices': [{'message': {'content': '   '}}]}, CircuitBreaker('test')) is None
@@ -0,0 +1,67 @@
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.stats()['rejected'] == 1
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker('test', failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_half_open_after_reset_timeout_allows_one_probe(clock):
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock[0] += 29.9
+    assert breaker.state == OPEN
+    clock[0] += 0.1
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_probe_success_closes_and_probe_failure_reopens(clock):
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.stats()['times_opened'] == 2
+
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+def test_unrecorded_probe_stops_blocking_after_reset_timeout(clock):
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow()          # probe whose outcome is never recorded
+    clock[0] += 10
+    assert not breaker.allow()
+    clock[0] += 20
+    assert breaker.allow()
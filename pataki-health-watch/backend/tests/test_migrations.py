@@ -0,0 +1,57 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import migrations
+
+BASELINE_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pataki.db')
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    """A copy of the tracked database, as shipped before any migration ran."""
+    path = tmp_path / 'pataki.db'
+    shutil.copy(BASELINE_DB, path)
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+def test_migrates_the_baseline_database_to_the_latest_version(baseline):
+    assert migrations.current_version(baseline) == 0
+    assert migrations.migrate(baseline) == [v for v, _, _ in migrations.MIGRATIONS]
+    assert migrations.current_version(baseline) == migrations.LATEST_VERSION
+    assert baseline.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+    tables = {r[0] for r in baseline.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {'patient_versions', 'patient_stats', 'anomaly_state', 'job_leases', 'patient_events'} <= tables
+    assert baseline.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+
+
+def test_migrate_is_a_no_op_when_up_to_date(baseline):
+    migrations.migrate(baseline)
+    assert migrations.migrate(baseline) == []
+
+
+def test_keeps_the_baseline_risk_counts(baseline):
+    risk_insights = dict(baseline.execute(
+        "SELECT patient_id, COUNT(*) FROM ai_insights WHERE state = 'risk' GROUP BY patient_id"
+    ).fetchall())
+    migrations.migrate(baseline)
+    counters = dict(baseline.execute('SELECT patient_id, risk_events FROM patient_stats').fetchall())
+    for patient_id, count in risk_insights.items():
+        assert counters[patient_id] >= count
+
+
+def test_risk_events_count_transitions_to_risk(baseline):
+    migrations.migrate(baseline)
+    baseline.execute("UPDATE patients SET current_state = 'stable' WHERE id = 1")
+    before = baseline.execute('SELECT risk_events FROM patient_stats WHERE patient_id = 1').fetchone()[0]
+    for state in ('risk', 'risk', 'stable', 'risk'):
+        baseline.execute('UPDATE patients SET current_state = ? WHERE id = 1', (state,))
+    after = baseline.execute('SELECT risk_events FROM patient_stats WHERE patient_id = 1').fetchone()[0]
+    assert after - before == 2
+    # Stored insights no longer count
+    baseline.execute("INSERT INTO ai_insights (patient_id, insight_text, state) VALUES (1, 'x', 'risk')")
+    assert baseline.execute('SELECT risk_events FROM patient_stats WHERE patient_id = 1').fetchone()[0] == after
@@ -0,0 +1,27 @@
+import pytest
+
+
+@pytest.mark.parametrize('url', [
+    '/api/patients/1',
+    '/api/patients/1/vitals',
+    '/api/patients/1/trend',
+    '/api/patients/1/dashboard',
+    '/api/patients/1/stats',
+])
+def test_patient_scoped_routes_answer_directly(client, url):
+    response = client.get(url)
+    assert response.status_code == 200, response.headers.get('Location')
+
+
+def test_unscoped_routes_default_to_the_demo_patient(client):
+    assert client.get('/api/patient').get_json() == client.get('/api/patients/1').get_json()
+
+
+def test_scoped_sync_is_not_redirected(client):
+    response = client.post('/api/patients/1/sync')
+    assert response.status_code == 200
+    assert response.get_json()['state'] in ('risk', 'stable')
+
+
+def test_stats_counts_the_patients_caregiver(client):
+    assert client.get('/api/patients/1/stats').get_json()['active_caregivers'] == 1
@@ -0,0 +1,78 @@
+import threading
+
+import numpy as np
+import pytest
+
+import sample_store
+
+DAY = sample_store.DAY
+
+
+@pytest.mark.parametrize('delta, width', [
+    (127, 1), (128, 2), (-128, 1), (-129, 2),
+    (2 ** 15 - 1, 2), (2 ** 15, 4), (-(2 ** 15), 2), (-(2 ** 15) - 1, 4),
+    (2 ** 31 - 1, 4), (2 ** 31, 8),
+])
+def test_encode_picks_the_narrowest_width_and_round_trips(delta, width):
+    values = np.array([0, delta, delta], dtype=np.int64)   # deltas: 0, delta, 0
+    encoded_width, blob = sample_store._encode(values)
+    assert encoded_width == width
+    assert np.array_equal(sample_store._decode(encoded_width, blob), values)
+
+
+@pytest.mark.parametrize('values', [
+    [],
+    [72],
+    [1_771_718_400, 1_771_718_460, 1_771_718_400],
+    [-(2 ** 62), 2 ** 62],
+], ids=['empty', 'single', 'timestamps', 'extremes'])
+def test_round_trip(values):
+    values = np.array(values, dtype=np.int64)
+    assert np.array_equal(sample_store._decode(*sample_store._encode(values)), values)
+
+
+@pytest.fixture
+def db(app):
+    from database import connect
+    conn = connect()
+    yield conn
+    conn.close()
+
+
+def _insert_raw(db, patient_id, day, n):
+    with db:
+        db.executemany('INSERT INTO raw_samples (patient_id, ts, hr) VALUES (?, ?, ?)',
+                       [(patient_id, day + i * 60, 60 + i % 40) for i in range(n)])
+
+
+def test_compact_moves_raw_samples_into_chunks_and_query_reads_them(db):
+    day = 1_700_006_400 - 1_700_006_400 % DAY
+    _insert_raw(db, 9001, day, 300)
+    assert sample_store.compact(db, day + 2 * DAY, shard=(9001 % 7, 7)) == 300
+    assert db.execute('SELECT COUNT(*) FROM raw_samples WHERE patient_id = 9001').fetchone()[0] == 0
+    ts, values = sample_store.query(db, 9001, 'hr', day, day + DAY)
+    assert np.array_equal(ts, day + np.arange(300) * 60)
+    assert np.array_equal(values, 60 + np.arange(300) % 40)
+
+
+def test_concurrent_compactions_merge_each_sample_once(db):
+    from database import connect
+    day = 1_700_006_400 - 1_700_006_400 % DAY + 10 * DAY
+    _insert_raw(db, 9002, day, 100)
+    moved = []
+
+    def run():
+        conn = connect(check_same_thread=False)
+        moved.append(sample_store.compact(conn, day + 2 * DAY, batch_patients=1))
+        conn.close()
+
+    threads = [threading.Thread(target=run) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(moved) == 100
+    count = db.execute("SELECT count FROM sample_chunks WHERE patient_id = 9002 AND metric = 'hr' AND day = ?",
+                       (day,)).fetchone()[0]
+    assert count == 100
+    assert len(sample_store.query(db, 9002, 'hr', day, day + DAY)[0]) == 100
@@ -57,15 +57,12 @@ const Data = () => {
   useEffect(() => {
     const load = async () => {
       try {
-        const [metricsRes, summaryRes, patientRes] = await Promise.all([
-          fetch(`${API_BASE_URL}/api/health-data?period=${period}`),
-          fetch(`${API_BASE_URL}/api/health-summary?period=${period}`),
-          fetch(`${API_BASE_URL}/api/patient`),
-        ]);
-        setChartData(await metricsRes.json());
-        setSummary(await summaryRes.json());
-        const patient = await patientRes.json();
-        setPatientName(patient.name);
+        // One request; the browser revalidates it with If-None-Match and gets a 304 when unchanged
+        const res = await fetch(`${API_BASE_URL}/api/data-view?period=${period}`);
+        const view = await res.json();
+        setChartData(view.health_data);
+        setSummary(view.summary);
+        setPatientName(view.patient.name);
       } catch (err) {
         console.error('Failed to load health data:', err);
       }
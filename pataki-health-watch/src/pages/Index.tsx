@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { AnimatePresence, motion } from 'motion/react';
 import AppShell from '@/components/layout/AppShell';
 import DashboardHeader from '@/components/dashboard/DashboardHeader';
@@ -46,6 +46,23 @@ const saveStateToSessionStorage = (state: any) => {
   }
 };
 
+// Poll a background insight job until the LLM result is ready (when the insight stream fails)
+const INSIGHT_POLL_INTERVAL_MS = 1000;
+const INSIGHT_POLL_MAX_ATTEMPTS = 30;
+
+const pollInsightJob = async (jobId: number): Promise<string | null> => {
+  for (let attempt = 0; attempt < INSIGHT_POLL_MAX_ATTEMPTS; attempt++) {
+    const res = await fetch(`${API_BASE_URL}/api/insight/jobs/${jobId}`);
+    const job = await res.json();
+    if (job.status === 'done') return job.insight;
+    if (job.status === 'failed') return null;
+    await new Promise(resolve => setTimeout(resolve, INSIGHT_POLL_INTERVAL_MS));
+  }
+  return null;
+};
+
+const PENDING_INSIGHT_TEXT = 'Generating a fresh insight…';
+
 const Index = () => {
   // Initialize state from session storage or null/empty defaults
   const persistedState = loadStateFromSessionStorage();
@@ -59,6 +76,9 @@ const Index = () => {
   const [patientName, setPatientName] = useState(persistedState?.patientName || '');
   const [stats, setStats] = useState(persistedState?.stats || { risk_events_prevented: 0, avg_early_detection: '–', active_caregivers: 0 });
   const [lastUpdatedTime, setLastUpdatedTime] = useState(persistedState?.lastUpdatedTime || '');
+  // The open /api/insight/stream, if any. A sync and the state event it pushes both ask for
+  // the insight; only the first opens a stream, so it's generated (and stored) once.
+  const insightStreamRef = useRef<EventSource | null>(null);
 
   // Load initial data from backend on mount OR from session storage
   useEffect(() => {
@@ -73,24 +93,19 @@ const Index = () => {
       }
 
       try {
-        const [vitalsRes, trendRes, patientRes, statsRes] = await Promise.all([
-          fetch(`${API_BASE_URL}/api/vitals`),
-          fetch(`${API_BASE_URL}/api/trend`),
-          fetch(`${API_BASE_URL}/api/patient`),
-          fetch(`${API_BASE_URL}/api/stats`),
-        ]);
-        const vitals = await vitalsRes.json();
-        const trend = await trendRes.json();
-        const patient = await patientRes.json();
-        const statsData = await statsRes.json();
+        // One request; the browser revalidates it with If-None-Match and gets a 304 when unchanged
+        const res = await fetch(`${API_BASE_URL}/api/dashboard?insight=stream`);
+        const dashboard = await res.json();
+        const { vitals, trend, patient, stats: statsData } = dashboard;
 
         setAppState({
           status: vitals.status,
           score: vitals.stability_score,
           vitals: { hr: vitals.hr, sleep: vitals.sleep_hours, steps: vitals.steps, fatigue: vitals.fatigue },
-          insight: vitals.insight,
+          insight: vitals.insight || PENDING_INSIGHT_TEXT,
           themeColor: vitals.theme_color,
         });
+        refreshInsight(vitals);
         setChartData(trend);
         setPatientName(patient.name);
         setStats(statsData);
@@ -120,20 +135,110 @@ const Index = () => {
     saveStateToSessionStorage({ appState, chartData, patientName, stats, lastUpdatedTime, isSynced });
   }, [appState, chartData, patientName, stats, lastUpdatedTime, isSynced]);
 
+  // Stream the LLM insight token by token into the InsightCard. If the stream can't be opened
+  // or drops before `done` (e.g. a proxy that buffers SSE), fall back to polling a job.
+  const streamInsight = () => {
+    if (insightStreamRef.current) return;
+    const source = new EventSource(`${API_BASE_URL}/api/insight/stream`);
+    insightStreamRef.current = source;
+    let done = false;
+    const finish = () => {
+      source.close();
+      if (insightStreamRef.current === source) insightStreamRef.current = null;
+    };
+    let text = '';
+    source.addEventListener('token', (event) => {
+      text += JSON.parse((event as MessageEvent).data).text;
+      setAppState(prev => (prev ? { ...prev, insight: text } : prev));
+    });
+    source.addEventListener('done', (event) => {
+      done = true;
+      const { insight } = JSON.parse((event as MessageEvent).data);
+      setAppState(prev => (prev ? { ...prev, insight } : prev));
+      finish();
+    });
+    source.addEventListener('error', () => {
+      finish();
+      if (!done) pollInsightFallback();
+    });
+  };
+
+  // Without ?insight=stream the dashboard queues a background job for the insight instead
+  const pollInsightFallback = async () => {
+    try {
+      const res = await fetch(`${API_BASE_URL}/api/dashboard`, { cache: 'no-store' });
+      const { vitals } = await res.json();
+      if (vitals.insight) {
+        setAppState(prev => (prev ? { ...prev, insight: vitals.insight } : prev));
+        return;
+      }
+      await refreshInsight(vitals);
+    } catch (err) {
+      console.error('Failed to fall back to an insight job:', err);
+    }
+  };
+
+  useEffect(() => () => insightStreamRef.current?.close(), []);
+
+  const refreshInsight = async (data: { insight_stream?: boolean; insight_job_id?: number }) => {
+    if (data.insight_stream) {
+      streamInsight();
+      return;
+    }
+    if (!data.insight_job_id) return;
+    try {
+      const insight = await pollInsightJob(data.insight_job_id);
+      if (insight) {
+        setAppState(prev => (prev ? { ...prev, insight } : prev));
+      }
+    } catch (err) {
+      console.error('Failed to fetch insight job:', err);
+    }
+  };
+
+  // Backend pushes state transitions (e.g. a new risk alert) — refresh only when one arrives
+  useEffect(() => {
+    const source = new EventSource(`${API_BASE_URL}/api/events`);
+    const onStateEvent = async () => {
+      try {
+        const res = await fetch(`${API_BASE_URL}/api/dashboard?insight=stream`);
+        const { vitals, trend, stats: statsData } = await res.json();
+        setAppState(prev => ({
+          status: vitals.status,
+          score: vitals.stability_score,
+          vitals: { hr: vitals.hr, sleep: vitals.sleep_hours, steps: vitals.steps, fatigue: vitals.fatigue },
+          // Keep the text a stream that is already open is writing
+          insight: (insightStreamRef.current && prev?.insight) || vitals.insight || PENDING_INSIGHT_TEXT,
+          themeColor: vitals.theme_color,
+        }));
+        refreshInsight(vitals);
+        setChartData(trend);
+        setStats(statsData);
+        setLastUpdatedTime(new Date().toLocaleString());
+      } catch (err) {
+        console.error('Failed to refresh after pushed event:', err);
+      }
+    };
+    source.addEventListener('risk_alert', onStateEvent);
+    source.addEventListener('state_change', onStateEvent);
+    return () => source.close();
+  }, []);
+
   const handleSync = async () => {
     setIsSyncing(true);
     setCaregiverNotified(false);
     setHospitalAlerted(false);
     try {
-      const res = await fetch(`${API_BASE_URL}/api/sync`, { method: 'POST' });
+      const res = await fetch(`${API_BASE_URL}/api/sync?insight=stream`, { method: 'POST' });
       const data = await res.json();
       setAppState({
         status: data.status,
         score: data.stability_score,
         vitals: { hr: data.hr, sleep: data.sleep_hours, steps: data.steps, fatigue: data.fatigue },
-        insight: data.insight,
+        insight: data.insight || PENDING_INSIGHT_TEXT,
         themeColor: data.theme_color,
       });
+      refreshInsight(data);
       setChartData(data.trend);
       setIsSynced(true);
       setLastUpdatedTime(new Date().toLocaleString()); // Update with current time on successful sync